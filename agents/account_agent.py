@@ -2,9 +2,10 @@ import db
 import re
 from typing import TypedDict, Optional, List, Dict, Any
 from agents import message_agent as msg
+from agents.entity_extractor import first, phone_digits
 
-ADDRESS_RE = re.compile(r"\b\d{1,6}\s+[A-Za-z0-9 .'-]+,\s*[A-Za-z .'-]+,\s*[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b", re.IGNORECASE,) #US address
-PHONE_RE = re.compile(r"\b(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})\b") #Phone patterns
+# Addresses / phones come from the shared single-pass extractor. NAME_RE stays local:
+# it matches any run of 2-4 words, so in a combined scan it would swallow everything else.
 NAME_RE = re.compile(r"\b[A-Za-z'-]{2,25}(?:\s+[A-Za-z'-]{2,25}){1,3}\b") #Name patterns
 
 class AgentState(TypedDict):
@@ -21,6 +22,7 @@ class AgentState(TypedDict):
     context_refs: Optional[List[str]]
     preface: Optional[str]
     memory: Optional[Dict[str, Any]]
+    entities: Optional[Dict[str, List[str]]]
 
     
 
@@ -44,12 +46,12 @@ def account_agent(state: AgentState) -> AgentState:
         return change_full_name_agent(state)
     else:
         # Check if this looks like a phone number using regex
-        if PHONE_RE.search(text):
+        if first(state, "phones"):
             print("[AGENT] Detected phone number via regex, routing to change_phone_number_agent")
             return change_phone_number_agent(state)
         
         # Check if this looks like an address using regex
-        if ADDRESS_RE.search(text):
+        if first(state, "addresses"):
             print("[AGENT] Detected address via regex, routing to change_address_agent")
             return change_address_agent(state)
             
@@ -123,9 +125,8 @@ def change_address_agent(state: AgentState) -> AgentState:
     # --------------------------------------------------
     # Tries to detect a one-line address in message
     # --------------------------------------------------
-    address = ADDRESS_RE.search(text)
-    if address:
-        addr = address.group(0)
+    addr = first(state, "addresses")
+    if addr:
         parts = [p.strip() for p in addr.split(",")]
         if len(parts) == 3:
             street = parts[0]
@@ -245,11 +246,10 @@ def change_phone_number_agent(state: "AgentState") -> "AgentState":
     # --------------------------------------------------
     # pulls plain number (e.g. "770-555-1234" or "(770) 555 1234")
     # --------------------------------------------------
-    phone_match = PHONE_RE.search(text)
-    if phone_match:
-        # Extract the three groups: area code, exchange, number
-        area_code, exchange, number = phone_match.groups()
-        raw_digits = f"{area_code}{exchange}{number}"
+    phone = first(state, "phones")
+    if phone:
+        # area code + exchange + number, country code dropped
+        raw_digits = phone_digits(phone)
         # Ensure E.164 format for US numbers
         if len(raw_digits) == 10:
             updates["phone"] = f"+1{raw_digits}"
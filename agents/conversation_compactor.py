@@ -0,0 +1,74 @@
+# agents/conversation_compactor.py
+"""
+Rolling conversation compaction.
+
+Past COMPACT_AFTER hot messages, the oldest turns are folded into the conversation's
+rolling_summary (one line per user request, newest kept) and summary_entities (running
+entity sets), moved to conversation_archive, and only the KEEP_RECENT newest messages
+stay in conversation_text. Every consumer (memory_agent, summaries, history page) reads
+this bounded form, so bytes read per turn stop growing with the conversation.
+db.restore_conversation() undoes it.
+
+The summary is extractive on purpose: compaction runs on the save path of a turn and
+must not wait on a model call.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import db
+from agents.entity_extractor import ENTITY_KINDS, extract
+from agents.memory_agent import _detect_domain, _shorten
+
+COMPACT_AFTER = int(os.environ.get("COMPACT_AFTER", "40"))   # hot messages before compacting
+KEEP_RECENT = int(os.environ.get("COMPACT_KEEP", "20"))      # raw messages kept hot
+SUMMARY_MAX_LINES = 12
+ENTITY_MAX_PER_KIND = 20
+
+
+def _fold_summary(previous: Optional[str], folded: List[Dict[str, Any]]) -> str:
+    lines = [l for l in (previous or "").splitlines() if l.strip()]
+    for m in folded:
+        if m.get("role") != "user" or not (m.get("content") or "").strip():
+            continue
+        tags = _detect_domain(m["content"])
+        lines.append(f"- [{', '.join(tags) if tags else 'general'}] {_shorten(m['content'], 120)}")
+    return "\n".join(lines[-SUMMARY_MAX_LINES:])
+
+def _fold_entities(previous: Optional[str], folded: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    try:
+        ents = json.loads(previous) if previous else {}
+    except ValueError:
+        ents = {}
+    out: Dict[str, List[str]] = {k: list(ents.get(k) or []) for k in ENTITY_KINDS}
+    for m in folded:
+        for kind, vals in extract(m.get("content") or "").items():
+            for v in vals:
+                if v in out[kind]:
+                    out[kind].remove(v)   # most recent mention last
+                out[kind].append(v)
+    return {k: v[-ENTITY_MAX_PER_KIND:] for k, v in out.items() if v}
+
+def maybe_compact(conversation_id: str) -> bool:
+    """Compact the stored conversation if its hot part is past COMPACT_AFTER. True if it was."""
+    row = db.get_compacted_conversation(conversation_id)
+    if row is None or not row["conversation_text"]:
+        return False
+    try:
+        hot = json.loads(row["conversation_text"])
+    except ValueError:
+        return False   # plain-text transcripts are not compacted
+    if not isinstance(hot, list) or len(hot) <= COMPACT_AFTER:
+        return False
+
+    folded, keep = hot[:-KEEP_RECENT], hot[-KEEP_RECENT:]
+    done = db.compact_conversation(
+        conversation_id, row["compacted_count"], folded, keep,
+        rolling_summary=_fold_summary(row["rolling_summary"], folded),
+        summary_entities=_fold_entities(row["summary_entities"], folded),
+    )
+    if done:
+        print(f"[COMPACT] {conversation_id}: folded {len(folded)} messages, {len(keep)} kept hot")
+    return done
@@ -0,0 +1,63 @@
+# agents/entity_extractor.py
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional
+
+# ------------ Combined pattern ------------
+# One alternative per entity kind, scanned in a single finditer pass. Order matters
+# when two kinds can start at the same position: an email can contain "ord_123" and
+# an address starts with digits, so both are tried before order / phone.
+PATTERNS: Dict[str, str] = {
+    "email":   r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}",
+    "address": r"\b\d{1,6}\s+[A-Za-z0-9 .'-]+,\s*[A-Za-z .'-]+,\s*[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b",   # US address
+    "order":   r"\bORD[-_](?=[A-Za-z0-9_-]*\d)[A-Za-z0-9]+(?:[-_][A-Za-z0-9]+)*\b|\bORD\d{3,}\b",      # ord_001, ORD-W-001, ORD123
+    "payment": r"\bPAY[-_]?\d{3,}\b",                                                                 # PAY_98765
+    "date":    r"\b(?:20\d{2}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[/\-]\d{1,2}[/\-]20\d{2})\b",               # YYYY-MM-DD or MM/DD/YYYY
+    "phone":   r"(?<!\w)(?:\+?1[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b",                         # US phone number
+}
+
+# group name -> key in the result dict
+KINDS: Dict[str, str] = {
+    "order": "orders",
+    "payment": "payments",
+    "email": "emails",
+    "date": "dates",
+    "address": "addresses",
+    "phone": "phones",
+}
+ENTITY_KINDS = tuple(KINDS.values())
+
+ENTITY_RE = re.compile("|".join(f"(?P<{name}>{p})" for name, p in PATTERNS.items()), re.IGNORECASE)
+
+# whole-value validation (e.g. an email already on the state)
+EMAIL_RE = re.compile(PATTERNS["email"])
+
+
+# ------------ Public API ------------
+def extract(text: str) -> Dict[str, List[str]]:
+    """All entities in `text`, in order of appearance, from one pass over the string."""
+    out: Dict[str, List[str]] = {k: [] for k in ENTITY_KINDS}
+    for m in ENTITY_RE.finditer(text or ""):
+        out[KINDS[m.lastgroup]].append(m.group(0))
+    return out
+
+def get_entities(state: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Entities for the current input. The supervisor attaches them once per turn;
+    agents called directly (tests, sub-flows) extract and attach on first use.
+    """
+    ents = state.get("entities")
+    if ents is None:
+        ents = extract(state.get("input") or "")
+        state["entities"] = ents
+    return ents
+
+def first(state: Dict[str, Any], kind: str) -> Optional[str]:
+    vals = get_entities(state).get(kind) or []
+    return vals[0] if vals else None
+
+def phone_digits(phone: str) -> str:
+    """US phone as 10 digits (country code dropped)."""
+    digits = re.sub(r"\D", "", phone or "")
+    return digits[1:] if len(digits) == 11 and digits.startswith("1") else digits
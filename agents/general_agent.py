@@ -1,4 +1,5 @@
 import os
+import time
 import db
 import json
 from typing import TypedDict, Optional, List, Dict, Any
@@ -7,6 +8,9 @@ from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from agents import prompt_builder, llm_runtime, model_selector
+from agents.prompt_builder import PromptBuilder, BuiltPrompt
+
 
 # --- Load .env ---
 load_dotenv()
@@ -18,6 +22,7 @@ class AgentState(TypedDict):
     input: str
     email: Optional[str]
     intent: Optional[str]
+    intent_confidence: Optional[float]
     reasoning: Optional[str]
     tool_calls: List[str]
     tool_results: List[str]
@@ -36,11 +41,11 @@ model = ChatGoogleGenerativeAI(
     #stream=True  # enable streaming
 )
 
-model_fast = ChatGoogleGenerativeAI( #currenly used for summarization only. 
+model_fast = ChatGoogleGenerativeAI( #used for summarization and as the hedge when `model` is slow
     model="gemini-2.5-flash-lite",
     google_api_key=os.environ["GOOGLE_API_KEY"],
     temperature=0.1,             #for speed
-    max_output_tokens=64,        # small cap to increase speed
+    max_output_tokens=256,       # small cap to increase speed (room for a short hedged answer)
     #stream=True  # enable streaming
 )
 
@@ -57,27 +62,25 @@ SYSTEM_PROMPT = (
     )
 
 
-def _build_prompt(state: AgentState) -> str:
-    """Builds a prompt that includes memory context."""
-    lines: List[str] = [SYSTEM_PROMPT]
+def _build_prompt(state: AgentState) -> BuiltPrompt:
+    """Builds a token-budgeted prompt that includes memory context."""
+    builder = PromptBuilder("general_agent")
+    builder.add("system", SYSTEM_PROMPT, required=True)
 
-    # Builds up context from memory / prior messages
+    # Builds up context from memory / prior messages (newest context kept)
     preface = state.get("preface")
     if preface:
-        lines.append("CONTEXT FROM PREVIOUS MESSAGES:")
-        lines.append(preface.strip())
+        builder.add("memory", preface, header="CONTEXT FROM PREVIOUS MESSAGES:", keep="tail")
 
     # Fallback
     elif state.get("context_summary"):
-        lines.append("CONTEXT SUMMARY:")
-        lines.append(state["context_summary"])
+        builder.add("memory", state["context_summary"], header="CONTEXT SUMMARY:", keep="tail")
 
-    # Current user message
+    # Current user message (long pastes keep their start and end)
     user_text = state.get("input") or ""
-    lines.append("USER MESSAGE:")
-    lines.append(user_text.strip())
+    builder.add("user", user_text, header="USER MESSAGE:", keep="both", required=True)
 
-    return "\n\n".join(lines)
+    return builder.build()
 
 
 def general_agent(state: AgentState) -> AgentState:
@@ -89,8 +92,19 @@ def general_agent(state: AgentState) -> AgentState:
     state.setdefault("tool_calls", [])
     state.setdefault("tool_results", [])
 
+    # Simple turns (greetings, acknowledgements) go to the fast model
+    selected, choice = model_selector.select_model(state, model, model_fast)
+    state["tool_calls"].append(f"general_agent(model={choice.tier}, complexity={choice.score})")
+
     try:
-        resp = model.invoke(prompt)
+        start = time.perf_counter()
+        resp = llm_runtime.invoke(
+            selected, prompt.text,
+            hedge_model=model_fast if selected is model else None,
+            deadline_s=llm_runtime.CALL_DEADLINE_S,
+            fallback=llm_runtime.BUSY_MESSAGE,
+        )
+        prompt_builder.record(prompt, time.perf_counter() - start)
         content = getattr(resp, "content", None) or str(resp)
         state["output"] = content.strip()
     except Exception as e:
@@ -103,12 +117,19 @@ def general_agent(state: AgentState) -> AgentState:
     return state
 
 def summarize_conversation(conversation_id: int) -> str:
-    convo = db.get_conversation(conversation_id)
-    if not convo:
+    # compacted form: rolling summary of the folded turns + the hot messages (bounded size)
+    row = db.get_compacted_conversation(conversation_id)
+    if not row or not (row["conversation_text"] or row["rolling_summary"]):
         return "Conversation not found."
     else:
-        resp = model_fast.invoke(
+        convo = row["conversation_text"] or ""
+        if row["rolling_summary"]:
+            convo = f"Earlier requests:\n{row['rolling_summary']}\n\nRecent messages:\n{convo}"
+        resp = llm_runtime.invoke(
+            model_fast,
             f"Summarize this conversation in <= 8 words: "
-            f"Use only plain text, speed is the goal. \n\n{convo}"
+            f"Use only plain text, speed is the goal. \n\n{convo}",
+            lane="background",
+            fallback="Previous conversation",
         )
         return getattr(resp, "content", None) or str(resp) or "No summary available."
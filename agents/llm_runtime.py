@@ -0,0 +1,475 @@
+# agents/llm_runtime.py
+from __future__ import annotations
+
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# ------------ Dispatch config (override via .env) ------------
+MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "4"))
+RATE_PER_SEC = float(os.environ.get("LLM_RATE_PER_SEC", "2"))        # token-bucket refill; <= 0 disables
+BURST = int(os.environ.get("LLM_BURST", "4"))                        # token-bucket capacity
+QUEUE_DEADLINE_S = float(os.environ.get("LLM_QUEUE_DEADLINE_S", "15"))
+HEDGE_AFTER_S = float(os.environ.get("LLM_HEDGE_AFTER_S", "4"))      # send the hedge after this long
+CALL_DEADLINE_S = float(os.environ.get("LLM_CALL_DEADLINE_S", "20"))  # give up (canned reply) after this long
+
+# Lower value = served first
+LANES: Dict[str, int] = {
+    "interactive": 0,   # chat turns, classification, policy answers
+    "background": 1,    # summaries and other work nobody is waiting on
+}
+
+BUSY_MESSAGE = (
+    "We're handling a lot of requests right now. "
+    "Please try again in a moment."
+)
+
+
+class LLMQueueTimeout(RuntimeError):
+    """Raised when a call waited in the dispatch queue past its deadline."""
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when neither the primary nor the hedged call answered in time."""
+
+
+class LLMCancelled(RuntimeError):
+    """Raised in a hedged call that lost the race before it got a dispatch slot."""
+
+
+@dataclass
+class Reply:
+    """Stand-in response (same .content shape as a model reply) used for fallbacks."""
+    content: str
+    fallback: bool = True
+
+
+# ------------ Single-flight (request coalescing) ------------
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one in-flight call.
+    The first caller (leader) runs the function; everyone who arrives while it is
+    running waits and receives the same result (or the same exception).
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0        # total requests seen
+        self.executed = 0     # requests that actually hit the provider
+        self.collapsed = 0    # requests served by someone else's in-flight call
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if isinstance(call.error, LLMCancelled):
+                return self.do(key, fn)     # the leader was a losing hedge; run it ourselves
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            if call.waiters:
+                print(f"[LLM] single-flight: {call.waiters} duplicate call(s) shared one request")
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "collapsed": self.collapsed,
+                "collapse_rate": round(self.collapsed / self.calls, 3) if self.calls else 0.0,
+                "in_flight": len(self._calls),
+            }
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+# ------------ Dispatch scheduler (concurrency + rate limit + lanes) ------------
+class DispatchScheduler:
+    """
+    Bounds concurrent provider calls.
+    - at most max_in_flight calls run at once
+    - a token bucket (rate_per_s, burst) smooths the request rate
+    - waiting calls are served by lane priority, then FIFO
+    - a call that cannot start before its deadline fails fast with LLMQueueTimeout
+    - a call whose `cancelled` event is set while it waits leaves the queue with LLMCancelled
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, rate_per_s: float = RATE_PER_SEC,
+                 burst: int = BURST, queue_deadline_s: float = QUEUE_DEADLINE_S):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.rate_per_s = float(rate_per_s)
+        self.burst = max(1, int(burst))
+        self.queue_deadline_s = float(queue_deadline_s)
+
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int, object]] = []   # (lane priority, seq, ticket)
+        self._seq = itertools.count()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self.in_flight = 0
+
+        # metrics
+        self.max_queue_depth = 0
+        self.admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.timeouts: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.cancelled: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate_per_s <= 0:
+            self._tokens = float(self.burst)
+        else:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate_per_s)
+        self._refilled_at = now
+
+    def acquire(self, lane: str = "interactive", deadline_s: Optional[float] = None,
+                cancelled: Optional[threading.Event] = None) -> None:
+        prio = LANES.get(lane, max(LANES.values()))
+        lane = lane if lane in LANES else "background"
+        ticket = object()
+        enqueued = time.monotonic()
+        deadline = enqueued + (self.queue_deadline_s if deadline_s is None else deadline_s)
+
+        with self._cond:
+            heapq.heappush(self._queue, (prio, next(self._seq), ticket))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    self._queue = [e for e in self._queue if e[2] is not ticket]
+                    heapq.heapify(self._queue)
+                    self.cancelled[lane] += 1
+                    self._cond.notify_all()
+                    raise LLMCancelled(f"LLM call cancelled while queued (lane={lane})")
+
+                now = time.monotonic()
+                self._refill(now)
+                if (self._queue[0][2] is ticket and self.in_flight < self.max_in_flight
+                        and self._tokens >= 1):
+                    heapq.heappop(self._queue)
+                    self.in_flight += 1
+                    self._tokens -= 1
+                    waited = now - enqueued
+                    self.admitted[lane] += 1
+                    self.total_wait_s += waited
+                    self.max_wait_s = max(self.max_wait_s, waited)
+                    self._cond.notify_all()   # the next head may be able to go too
+                    return
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._queue = [e for e in self._queue if e[2] is not ticket]
+                    heapq.heapify(self._queue)
+                    self.timeouts[lane] += 1
+                    self._cond.notify_all()
+                    raise LLMQueueTimeout(
+                        f"LLM queue wait exceeded {deadline - enqueued:.1f}s (lane={lane})"
+                    )
+
+                wait_for = remaining
+                if self._tokens < 1 and self.rate_per_s > 0:
+                    wait_for = min(wait_for, (1 - self._tokens) / self.rate_per_s)
+                self._cond.wait(wait_for)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+
+    def wake(self) -> None:
+        """Let queued callers re-check their `cancelled` events."""
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = "interactive", deadline_s: Optional[float] = None):
+        self.acquire(lane, deadline_s)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            admitted = sum(self.admitted.values())
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": dict(self.admitted),
+                "timeouts": dict(self.timeouts),
+                "cancelled": dict(self.cancelled),
+                "avg_wait_s": round(self.total_wait_s / admitted, 4) if admitted else 0.0,
+                "max_wait_s": round(self.max_wait_s, 4),
+            }
+
+
+SCHEDULER = DispatchScheduler()
+
+
+# ------------ Latency / hedge metrics ------------
+class LatencyTracker:
+    """Rolling latency samples plus counters for hedges and deadline misses."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.deadline_misses = 0
+
+    def record(self, latency_s: float, *, hedged: bool = False, hedge_won: bool = False,
+               missed: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self._samples.append(latency_s)
+            self.hedges_fired += int(hedged)
+            self.hedge_wins += int(hedge_won)
+            self.deadline_misses += int(missed)
+
+    def _pct(self, ordered: List[float], p: float) -> float:
+        if not ordered:
+            return 0.0
+        i = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return round(ordered[i], 4)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._samples)
+            return {
+                "calls": self.calls,
+                "p50_s": self._pct(ordered, 0.50),
+                "p95_s": self._pct(ordered, 0.95),
+                "p99_s": self._pct(ordered, 0.99),
+                "max_s": round(ordered[-1], 4) if ordered else 0.0,
+                "hedges_fired": self.hedges_fired,
+                "hedge_rate": round(self.hedges_fired / self.calls, 3) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "deadline_misses": self.deadline_misses,
+            }
+
+
+LATENCY = LatencyTracker()
+
+# Threads for deadline/hedged calls. A call that loses the race keeps running in
+# the background until the provider returns (Python threads cannot be cancelled),
+# but its scheduler slot is given back as soon as the winner is known (_Lease).
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+class _Lease:
+    """
+    One hedged attempt's hold on a scheduler slot. cancel() frees the slot while the
+    provider call is still running, or takes the attempt out of the queue if it has
+    not been admitted yet; the slot is released exactly once either way. The attempts
+    of one hedged call are rivals: the first to answer cancels the others before its
+    own slot frees up, so a queued rival cannot take that slot.
+    """
+
+    def __init__(self, scheduler: DispatchScheduler, rivals: List["_Lease"]):
+        self.scheduler = scheduler
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._held = False
+        self.rivals = rivals
+        rivals.append(self)
+
+    def hold(self) -> bool:
+        """Record the slot just acquired; False (slot released) if cancelled meanwhile."""
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._held = True
+                return True
+        self.scheduler.release()
+        return False
+
+    def drop(self) -> None:
+        with self._lock:
+            held, self._held = self._held, False
+        if held:
+            self.scheduler.release()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled.set()
+        self.drop()
+        self.scheduler.wake()
+
+    def won(self) -> None:
+        for lease in self.rivals:
+            if lease is not self:
+                lease.cancel()
+
+
+def prompt_key(model: Any, prompt: Any) -> str:
+    """Hash of (model instance, prompt) used to detect identical requests."""
+    name = getattr(model, "model", None) or type(model).__name__
+    body = prompt if isinstance(prompt, str) else repr(prompt)
+    h = hashlib.sha256()
+    h.update(f"{name}|{id(model)}|".encode("utf-8"))
+    h.update(body.encode("utf-8", "ignore"))
+    return h.hexdigest()
+
+
+# ------------ Public API ------------
+def _dispatch(model: Any, prompt: Any, lane: str, queue_deadline_s: Optional[float],
+              lease: Optional[_Lease] = None) -> Any:
+    def run() -> Any:
+        if lease is None:
+            with SCHEDULER.slot(lane, queue_deadline_s):
+                return model.invoke(prompt)
+        lease.scheduler.acquire(lane, queue_deadline_s, cancelled=lease.cancelled)
+        if not lease.hold():
+            raise LLMCancelled("LLM call cancelled before it started")
+        try:
+            result = model.invoke(prompt)
+            lease.won()
+            return result
+        finally:
+            lease.drop()
+    return SINGLE_FLIGHT.do(prompt_key(model, prompt), run)
+
+
+def _hedged(model: Any, prompt: Any, lane: str, queue_deadline_s: Optional[float],
+            hedge_model: Any, hedge_after_s: float, deadline_s: Optional[float]) -> Any:
+    start = time.monotonic()
+    deadline = start + deadline_s if deadline_s is not None else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    leases: Dict[Any, _Lease] = {}
+    rivals: List[_Lease] = []
+
+    def submit(m: Any):
+        lease = _Lease(SCHEDULER, rivals)
+        f = _EXECUTOR.submit(_dispatch, m, prompt, lane, queue_deadline_s, lease)
+        leases[f] = lease
+        return f
+
+    primary = submit(model)
+    pending = [primary]
+    hedge = None
+
+    if hedge_model is not None:
+        first_wait = hedge_after_s if deadline is None else min(hedge_after_s, remaining())
+        done, _ = wait(pending, timeout=first_wait)
+        failed = primary in done and primary.exception() is not None
+        if (not done or failed) and (deadline is None or remaining() > 0):
+            if failed:
+                print(f"[LLM] primary failed ({primary.exception()!r}), sending hedged request")
+            else:
+                print(f"[LLM] primary slower than {hedge_after_s:.1f}s, sending hedged request")
+            hedge = submit(hedge_model)
+            pending.append(hedge)
+
+    errors: List[BaseException] = []
+    while pending:
+        done, _ = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            break   # deadline hit with calls still running
+        for f in done:
+            pending.remove(f)
+            try:
+                result = f.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            LATENCY.record(time.monotonic() - start, hedged=hedge is not None,
+                           hedge_won=f is hedge)
+            for loser in pending:
+                loser.cancel()
+                leases[loser].cancel()
+            return result
+
+    if pending:
+        LATENCY.record(time.monotonic() - start, hedged=hedge is not None, missed=True)
+        raise LLMDeadlineExceeded(f"no LLM answer within {deadline_s:.1f}s")
+    LATENCY.record(time.monotonic() - start, hedged=hedge is not None)
+    raise errors[0]
+
+
+def invoke(model: Any, prompt: Any, *, lane: str = "interactive",
+           queue_deadline_s: Optional[float] = None, fallback: Optional[str] = None,
+           hedge_model: Any = None, hedge_after_s: float = HEDGE_AFTER_S,
+           deadline_s: Optional[float] = None) -> Any:
+    """
+    Drop-in replacement for model.invoke(prompt).
+    - identical concurrent prompts to the same model share one provider call
+    - provider calls go through the dispatch scheduler (lane = priority)
+    - with hedge_model, a second request goes to hedge_model if the primary has not
+      answered after hedge_after_s, or as soon as it fails; whichever answers first
+      wins and the loser gives its dispatch slot back
+    - with deadline_s, the call gives up after deadline_s
+    If the call times out (queue or deadline), returns Reply(fallback) when a fallback
+    text is given, otherwise raises LLMQueueTimeout / LLMDeadlineExceeded.
+    """
+    try:
+        if hedge_model is None and deadline_s is None:
+            start = time.monotonic()
+            try:
+                return _dispatch(model, prompt, lane, queue_deadline_s)
+            finally:
+                LATENCY.record(time.monotonic() - start)
+        return _hedged(model, prompt, lane, queue_deadline_s, hedge_model, hedge_after_s, deadline_s)
+    except (LLMQueueTimeout, LLMDeadlineExceeded) as e:
+        print(f"[LLM] {e}")
+        if fallback is None:
+            raise
+        return Reply(fallback)
+
+
+def llm_stats() -> Dict[str, Any]:
+    return {
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "latency": LATENCY.stats(),
+    }
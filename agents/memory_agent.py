@@ -1,10 +1,17 @@
 from __future__ import annotations
-from typing import TypedDict, List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import TypedDict, List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
+from collections import OrderedDict, Counter
+import heapq
+import math
+import os
 import re
 import json
+import threading
 from functools import lru_cache
 import db
+from agents.entity_extractor import extract, ENTITY_KINDS
+from agents import memory_vectors
 
 
 class AgentState(TypedDict, total=False):
@@ -18,16 +25,10 @@ class AgentState(TypedDict, total=False):
     context_refs: Optional[List[str]]
     preface: Optional[str]
     memory: Optional[Dict[str, Any]]
+    history_refs: Optional[List[str]]
+    conversation_summary: Optional[str]
 
-# ------------ Simple REGEX identifiers ------------
-ORDER  = re.compile(r"\bORD[\-_]?\d{3,}\b", re.IGNORECASE) #example: ORD_12345
-PAY    = re.compile(r"\bPAY[\-_]?\d{3,}\b", re.IGNORECASE) #example: PAY_98765
-EMAIL  = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.IGNORECASE) #email regex
-DATE   = re.compile(r"\b(20\d{2}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[/\-]\d{1,2}[/\-]20\d{2})\b") #YYYY-MM-DD or MM/DD/YYYY
-ADDRESS = re.compile(r"\b\d{1,6}\s+[A-Za-z0-9 .'-]+,\s*[A-Za-z .'-]+,\s*[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b", re.IGNORECASE,) #US address
-PHONE  = re.compile(r"\b(\+?1[-.\s]?|)\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b") #US phone number
-NAME   = re.compile(r"\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b") #Simple full name
-
+# ------------ Domain keywords (entities come from agents/entity_extractor.py) ------------
 KEYWORDS  = {
     "return": {"return","refund","rma","exchange","restocking","window"},
     "shipping": {"ship","shipped","delivered","tracking","carrier","label"},
@@ -41,14 +42,19 @@ KEYWORDS  = {
 def _tokenize(s: str) -> set:
     return set(re.findall(r"[a-z0-9]+", s.lower()))
 
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "could", "do", "does", "for",
+    "from", "had", "has", "have", "hi", "how", "i", "if", "in", "is", "it", "its", "me", "my",
+    "no", "not", "of", "on", "or", "our", "please", "so", "that", "the", "their", "then", "there",
+    "this", "to", "was", "we", "were", "what", "when", "where", "which", "will", "with", "would",
+    "yes", "you", "your",
+}
+
+def _term_freqs(s: str) -> Dict[str, int]:
+    return dict(Counter(t for t in re.findall(r"[a-z0-9]+", s.lower()) if t not in STOPWORDS))
+
 def _extract_entities(text: str) -> Dict[str, List[str]]:
-    out: Dict[str, List[str]] = {"orders": [], "payments": [], "emails": [], "dates": [], "addresses": []}
-    out["orders"]   = ORDER.findall(text) or []
-    out["payments"] = PAY.findall(text) or []
-    out["emails"]   = EMAIL.findall(text) or []
-    out["dates"]    = DATE.findall(text) or []
-    out["addresses"] = ADDRESS.findall(text) or []
-    return out
+    return extract(text)
 
 def _detect_domain(text: str) -> List[str]:
     toks = _tokenize(text)
@@ -67,16 +73,14 @@ class Msg:
     ents: Dict[str, List[str]]
     tags: List[str]
     toks: set
+    tf: Dict[str, int] = field(default_factory=dict)    # term -> count, stopwords removed (BM25)
+
+def _make_msg(i: int, m: Dict[str, str]) -> Msg:
+    c = m.get("content") or ""
+    return Msg(i, (m.get("role") or "assistant"), c, _extract_entities(c), _detect_domain(c), _tokenize(c), _term_freqs(c))
 
 def _build_index(messages: List[Dict[str,str]]) -> List[Msg]:
-    idx: List[Msg] = []
-    for i, m in enumerate(messages):
-        c = m.get("content","")
-        ents = _extract_entities(c)
-        tags = _detect_domain(c)
-        toks = _tokenize(c)
-        idx.append(Msg(i, (m.get("role") or "assistant"), c, ents, tags, toks))
-    return idx
+    return [_make_msg(i, m) for i, m in enumerate(messages)]
 
 def _score(query: Msg, past: Msg) -> float:
     # Simple score: token overlap + entity overlap + domain overlap, with small weights
@@ -98,6 +102,339 @@ def _topk_links(index: List[Msg], k: int = 4) -> List[Msg]:
     scored.sort(key=lambda x: x[1], reverse=True)
     return [m for m, s in scored if s > 0][:k]
 
+# ------------ BM25 retrieval ------------
+BM25_K1 = 1.2
+BM25_B = 0.75
+ENTITY_BOOST = 8.0          # per shared order/payment/email/date/...; an exact ID beats ~any single term (idf <= ln N)
+TAG_BOOST = 1.0             # per shared domain tag, recent window only
+ID_CONFLICT = 0.5           # both mention order/payment IDs but none in common -> probably another order
+ID_KINDS = ("orders", "payments")
+HIGH_DF_RATIO = 0.1         # terms in more than this share of messages only re-score existing candidates
+HIGH_DF_MIN = 64
+
+# Link scorer: "bm25" (default), "vector" (hashed features + numpy, see memory_vectors.py)
+# or "overlap" (the original set-intersection _score over the whole conversation)
+SCORER = os.environ.get("MEMORY_SCORER", "bm25").lower()
+if SCORER == "vector" and not memory_vectors.HAS_NUMPY:
+    print("[MEMORY] MEMORY_SCORER=vector needs numpy; using bm25")
+    SCORER = "bm25"
+
+# ------------ Incremental Index (per conversation) ------------
+LINK_WINDOW = 20            # newest messages considered for links / summary
+INDEX_CACHE_SIZE = int(os.environ.get("MEMORY_INDEX_CACHE", "256"))
+PERSIST_INDEX = os.environ.get("MEMORY_INDEX_PERSIST", "0").lower() in {"1", "true", "yes"}
+
+INDEX_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "loaded": 0, "rebuilds": 0, "indexed": 0, "evicted": 0}
+
+
+@dataclass
+class ConversationIndex:
+    """Msg index for one conversation; only newly appended messages get processed."""
+    msgs: List[Msg] = field(default_factory=list)
+    entities: Dict[str, set] = field(default_factory=lambda: {k: set() for k in ENTITY_KINDS})
+    postings: Dict[str, Dict[int, int]] = field(default_factory=dict)        # term -> {msg idx: tf}
+    entity_postings: Dict[Tuple[str, str], List[int]] = field(default_factory=dict)
+    doc_len: List[int] = field(default_factory=list)
+    total_len: int = 0
+    vectors: Optional[Any] = None      # memory_vectors.HashedVectors, built on first vector search
+    last_start: Optional[int] = None    # offset of the last indexed element in the stored JSON blob
+    persisted: int = 0                  # msgs already written to memory_index_msgs
+    compacted: int = 0                  # stored messages folded into the rolling summary (not indexed)
+    summary: str = ""                   # rolling summary of the compacted turns
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def append(self, messages: List[Dict[str, str]]) -> List[Msg]:
+        new = [_make_msg(len(self.msgs) + i, m) for i, m in enumerate(messages)]
+        for m in new:
+            self.add(m)
+        INDEX_STATS["indexed"] += len(new)
+        return new
+
+    def add(self, m: Msg) -> None:
+        """Adds one already-processed message to the entity sets and postings."""
+        self.msgs.append(m)
+        for k, vals in m.ents.items():
+            self.entities.setdefault(k, set()).update(vals)
+            for v in set(vals):
+                self.entity_postings.setdefault((k, v.lower()), []).append(m.idx)
+        for term, tf in m.tf.items():
+            self.postings.setdefault(term, {})[m.idx] = tf
+        n = sum(m.tf.values())
+        self.doc_len.append(n)
+        self.total_len += n
+        if self.vectors is not None:
+            self.vectors.add(m)
+
+    def vector_search(self, k: int = 5) -> List[Tuple[Msg, float]]:
+        """Same ranking as _score, as one sparse mat-vec over hashed features (needs numpy)."""
+        if not self.msgs:
+            return []
+        if self.vectors is None:
+            self.vectors = memory_vectors.HashedVectors()
+            for m in self.msgs:
+                self.vectors.add(m)
+        return [(self.msgs[i], round(sc, 3)) for i, sc in self.vectors.topk(self.msgs[-1], k)]
+
+    def search(self, k: int = 5, query: Optional[Msg] = None) -> List[Tuple[Msg, float]]:
+        """
+        Top-k past messages for `query` (default: newest message) over the whole
+        conversation: BM25 on terms + entity boosts + tag overlap in the recent window.
+        Very common terms only re-score candidates found by rarer terms / entities,
+        so the cost follows the rare postings rather than the conversation length.
+        """
+        q = query or (self.msgs[-1] if self.msgs else None)
+        n = len(self.msgs)
+        if q is None or n < 2:
+            return []
+        avgdl = (self.total_len / n) or 1.0
+        high_df = max(HIGH_DF_MIN, int(n * HIGH_DF_RATIO))
+        scores: Dict[int, float] = {}
+
+        def bm25(term: str, plist: Dict[int, int], ids) -> None:
+            df = len(plist)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i in ids:
+                tf = plist.get(i)
+                if tf:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[i] / avgdl)
+                    scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        common = []
+        for term in q.tf:
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            if len(plist) > high_df:
+                common.append((term, plist))
+            else:
+                bm25(term, plist, plist.keys())
+
+        for kind, vals in q.ents.items():
+            for v in set(vals):
+                for i in self.entity_postings.get((kind, v.lower()), ()):
+                    scores[i] = scores.get(i, 0.0) + ENTITY_BOOST
+
+        if common:
+            ids = list(scores) or [m.idx for m in self.msgs[-LINK_WINDOW:]]
+            for term, plist in common:
+                bm25(term, plist, ids)
+
+        qtags = set(q.tags)
+        if qtags:
+            for m in self.msgs[-LINK_WINDOW:]:
+                shared = len(qtags.intersection(m.tags))
+                if shared:
+                    scores[m.idx] = scores.get(m.idx, 0.0) + TAG_BOOST * shared
+
+        scores.pop(q.idx, None)
+        q_ids = {kind: {v.lower() for v in q.ents.get(kind) or ()} for kind in ID_KINDS}
+        for i in scores:
+            ents = self.msgs[i].ents
+            for kind in ID_KINDS:
+                if q_ids[kind] and ents.get(kind) and not q_ids[kind].intersection(v.lower() for v in ents[kind]):
+                    scores[i] *= ID_CONFLICT
+                    break
+        top = heapq.nlargest(k, scores.items(), key=lambda kv: (kv[1], kv[0]))
+        return [(self.msgs[i], round(sc, 3)) for i, sc in top if sc > 0 and self.msgs[i].content]
+
+    def extends(self, messages: List[Dict[str, str]]) -> bool:
+        """True if `messages` is what we indexed plus (possibly) newer messages."""
+        n = len(self.msgs)
+        if n > len(messages):
+            return False
+        return n == 0 or (_as_message(messages[n - 1]).get("content") or "") == self.msgs[-1].content
+
+
+_INDEX_CACHE: "OrderedDict[str, ConversationIndex]" = OrderedDict()
+_INDEX_LOCK = threading.Lock()
+
+def _cache_get(conversation_id: str) -> Optional[ConversationIndex]:
+    with _INDEX_LOCK:
+        idx = _INDEX_CACHE.get(conversation_id)
+        if idx is not None:
+            _INDEX_CACHE.move_to_end(conversation_id)
+            INDEX_STATS["hits"] += 1
+        else:
+            INDEX_STATS["misses"] += 1
+        return idx
+
+def _cache_put(conversation_id: str, idx: ConversationIndex) -> None:
+    with _INDEX_LOCK:
+        _INDEX_CACHE[conversation_id] = idx
+        _INDEX_CACHE.move_to_end(conversation_id)
+        while len(_INDEX_CACHE) > INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+            INDEX_STATS["evicted"] += 1
+
+def reset_index(conversation_id: Optional[str] = None) -> None:
+    """Drop the cached index for one conversation (or all of them)."""
+    with _INDEX_LOCK:
+        if conversation_id is None:
+            _INDEX_CACHE.clear()
+            _HISTORY_CACHE.clear()
+        else:
+            _INDEX_CACHE.pop(conversation_id, None)
+
+def _as_message(obj: Any) -> Dict[str, str]:
+    return obj if isinstance(obj, dict) else {"role": "assistant", "content": str(obj)}
+
+def _skip_ws(text: str, i: int) -> int:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return i
+
+_DECODER = json.JSONDecoder()
+
+def _decode_elements(text: str, pos: int = 0, opening: bool = True) -> Optional[Tuple[List[Any], List[int]]]:
+    """
+    Decode JSON array elements from text[pos:] with raw_decode, one at a time.
+    `opening` means text[pos] is the '['; otherwise text[pos] is the start of an element.
+    Returns (elements, start offsets) or None if the text is not a well-formed array tail.
+    """
+    objs: List[Any] = []
+    starts: List[int] = []
+    i = _skip_ws(text, pos)
+    if opening:
+        if not text.startswith("[", i):
+            return None
+        i = _skip_ws(text, i + 1)
+        if text.startswith("]", i):
+            return objs, starts
+    while True:
+        try:
+            obj, end = _DECODER.raw_decode(text, i)
+        except ValueError:
+            return None
+        objs.append(obj)
+        starts.append(i)
+        i = _skip_ws(text, end)
+        if text.startswith(",", i):
+            i = _skip_ws(text, i + 1)
+        elif text.startswith("]", i):
+            return objs, starts
+        else:
+            return None
+
+def _full_load(conversation_id: str) -> ConversationIndex:
+    """
+    Index the compacted form: hot messages plus the rolling summary and entities of
+    the turns folded out of them (agents/conversation_compactor.py).
+    """
+    idx = ConversationIndex()
+    row = db.get_compacted_conversation(conversation_id)
+    if row is None:
+        return idx
+    idx.compacted = row["compacted_count"] or 0
+    idx.summary = row["rolling_summary"] or ""
+    try:
+        for kind, vals in json.loads(row["summary_entities"] or "{}").items():
+            if kind in idx.entities:
+                idx.entities[kind].update(vals)
+    except (ValueError, AttributeError):
+        pass
+    raw = row["conversation_text"]
+    if not raw:
+        return idx
+    parsed = _decode_elements(raw)
+    if parsed is not None:
+        objs, starts = parsed
+        idx.append([_as_message(o) for o in objs])
+        idx.last_start = starts[-1] if starts else None
+    else:
+        # plain-text seeds ("User: Hi\nAssistant: Hello!") are never appended to; no offset kept
+        idx.append([{"role": "assistant", "content": line} for line in raw.splitlines() if line.strip()])
+    return idx
+
+def _sync_from_db(conversation_id: str, idx: ConversationIndex) -> ConversationIndex:
+    """
+    Bring idx up to date with the stored conversation. Reads the blob from the last
+    indexed element onwards; that element is re-decoded to confirm the blob was only
+    appended to, otherwise the index is rebuilt from the full text. A compaction since
+    the last sync also rebuilds, from the (bounded) compacted form.
+    """
+    if idx.last_start is not None and idx.msgs:
+        got = db.get_conversation_tail(conversation_id, idx.last_start)
+        compacted = (got["compacted_count"] or 0) if got else 0
+        parsed = _decode_elements(got["tail"], opening=False) if got and got["tail"] else None
+        if parsed is not None and compacted == idx.compacted:
+            objs, starts = parsed
+            if objs and (_as_message(objs[0]).get("content") or "") == idx.msgs[-1].content:
+                idx.append([_as_message(o) for o in objs[1:]])
+                idx.last_start += starts[-1]
+                return idx
+        INDEX_STATS["rebuilds"] += 1
+    return _full_load(conversation_id)
+
+def _restore_index(conversation_id: str) -> Optional[ConversationIndex]:
+    saved = db.get_memory_index(conversation_id)
+    if not saved:
+        return None
+    head, rows = saved
+    idx = ConversationIndex(last_start=head["last_start"])
+    for r in rows:
+        tf = json.loads(r["toks"])
+        if isinstance(tf, list):   # rows written before term counts were stored
+            tf = _term_freqs(r["content"] or "")
+        idx.add(Msg(r["idx"], r["role"], r["content"], json.loads(r["ents"]), json.loads(r["tags"]),
+                    _tokenize(r["content"] or ""), tf))
+    idx.persisted = len(idx.msgs)
+    INDEX_STATS["loaded"] += 1
+    return idx
+
+def _persist_index(conversation_id: str, idx: ConversationIndex) -> None:
+    if idx.persisted > len(idx.msgs):
+        idx.persisted = 0   # rebuilt smaller than what is stored
+    new = idx.msgs[idx.persisted:]
+    if not new and idx.persisted:
+        return
+    rows = [
+        (m.idx, m.role, m.content, json.dumps(m.ents), json.dumps(m.tags), json.dumps(m.tf))
+        for m in new
+    ]
+    db.save_memory_index(conversation_id, idx.last_start, len(idx.msgs), rows, reset=(idx.persisted == 0))
+    idx.persisted = len(idx.msgs)
+
+def get_index(conversation_id: Optional[str] = None,
+              messages: Optional[List[Dict[str, str]]] = None) -> ConversationIndex:
+    """
+    Incremental index for a conversation. With `messages` the caller's list is the
+    source of truth; otherwise the stored conversation is read from its last indexed
+    element onwards. Cached in-process (LRU) per conversation_id, optionally
+    persisted with MEMORY_INDEX_PERSIST=1.
+    """
+    if not conversation_id:
+        idx = ConversationIndex()
+        idx.append(messages or [])
+        return idx
+
+    idx = _cache_get(conversation_id)
+    if idx is None and PERSIST_INDEX and not messages:
+        try:
+            idx = _restore_index(conversation_id)
+        except Exception as e:
+            print(f"[MEMORY] index restore failed: {e}")
+    idx = idx or ConversationIndex()
+
+    with idx.lock:
+        if messages:
+            if not idx.extends(messages):
+                INDEX_STATS["rebuilds"] += 1
+                idx = ConversationIndex()
+            idx.append(messages[len(idx.msgs):])
+        elif db:
+            idx = _sync_from_db(conversation_id, idx)
+            if PERSIST_INDEX and not idx.compacted:   # compacted conversations are small to rebuild
+                try:
+                    _persist_index(conversation_id, idx)
+                except Exception as e:
+                    print(f"[MEMORY] index persist failed: {e}")
+    _cache_put(conversation_id, idx)
+    return idx
+
+def index_stats() -> Dict[str, Any]:
+    with _INDEX_LOCK:
+        return {**INDEX_STATS, "cached": len(_INDEX_CACHE)}
+
 # ------------ Summarization  ------------
 def _shorten(s: str, n: int = 160) -> str:
     s = s.strip().replace("\n"," ")
@@ -118,6 +455,64 @@ def _compose_running_summary(index: List[Msg]) -> str:
         return f"{dom} — {frag}"
     return f"{dom} — " + "; ".join(ents)
 
+def _links(conv_index: ConversationIndex, k: int = 5) -> List[Msg]:
+    if SCORER == "vector" and memory_vectors.HAS_NUMPY:
+        return [m for m, _ in conv_index.vector_search(k)]
+    if SCORER == "overlap":
+        return _topk_links(conv_index.msgs, k=k)
+    return [m for m, _ in conv_index.search(k=k)]
+
+# ------------ Cross-conversation history (FTS5) ------------
+HISTORY_ENABLED = os.environ.get("MEMORY_HISTORY", "1").lower() not in {"0", "false", "no"}
+HISTORY_LIMIT = 3
+HISTORY_MAX_TERMS = 12
+HISTORY_CACHE_SIZE = 512
+
+HISTORY_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "errors": 0}
+_HISTORY_CACHE: "OrderedDict[Tuple[str, int, str, Tuple[str, ...]], List[str]]" = OrderedDict()
+
+def _history_terms(text: str) -> List[str]:
+    terms: List[str] = []
+    for t in re.findall(r"[a-z0-9]+", (text or "").lower()):
+        if len(t) > 1 and t not in STOPWORDS and t not in terms:
+            terms.append(t)
+    return terms[:HISTORY_MAX_TERMS]
+
+def history_refs(email: Optional[str], conversation_id: Optional[str], query: str,
+                 limit: int = HISTORY_LIMIT, archived_before: int = 0) -> List[str]:
+    """
+    Short snippets from the customer's earlier conversations that match `query`
+    (db.search_customer_history, bm25-ranked), including this conversation's compacted
+    turns (msg_seq < archived_before). Cached per conversation + query terms, so a
+    session repeating itself does not hit the FTS index again.
+    """
+    terms = _history_terms(query)
+    if not (HISTORY_ENABLED and db and email and terms):
+        return []
+    key = (conversation_id or "", archived_before, email.lower(), tuple(sorted(terms)))
+    with _INDEX_LOCK:
+        if key in _HISTORY_CACHE:
+            _HISTORY_CACHE.move_to_end(key)
+            HISTORY_STATS["hits"] += 1
+            return list(_HISTORY_CACHE[key])
+        HISTORY_STATS["misses"] += 1
+    try:
+        rows = db.search_customer_history(email, query, exclude_conversation_id=conversation_id,
+                                          limit=limit, terms=terms, archived_before=archived_before)
+    except Exception as e:
+        HISTORY_STATS["errors"] += 1
+        print(f"[MEMORY] history search failed: {e}")
+        return []
+    refs = [
+        f"{(r['started_at'] or '')[:10]} {r['role'] or 'transcript'}: {_shorten(r['snippet'] or r['content'] or '', 160)}"
+        for r in rows
+    ]
+    with _INDEX_LOCK:
+        _HISTORY_CACHE[key] = refs
+        while len(_HISTORY_CACHE) > HISTORY_CACHE_SIZE:
+            _HISTORY_CACHE.popitem(last=False)
+    return list(refs)
+
 # ------------ Public API ------------
 def memory_agent(state: AgentState) -> AgentState:
     """
@@ -125,38 +520,32 @@ def memory_agent(state: AgentState) -> AgentState:
       - context_summary: 1 line
       - context_refs: list of short prior snippets
       - memory: {entities, links}
+      - history_refs: snippets from the customer's earlier conversations
+      - conversation_summary: rolling summary of compacted turns (may be empty)
     Will load previous messages from DB
     """
-    # 1) Fetch messages
-    msgs = state.get("messages") or []
-    if not msgs and db and state.get("conversation_id"):
-        row = db.get_conversation(state["conversation_id"])  # fetch from DB
-        try:
-            raw = row["conversation_text"] if hasattr(row, "__getitem__") else row 
-        except Exception:
-            raw = None
-        if raw:
-            try:
-                msgs = json.loads(raw)
-            except Exception:
-                msgs = [{"role":"assistant","content":line} for line in (raw.splitlines() if raw else []) if line.strip()]
-
-    if not msgs:
+    # 1) Fetch messages (only the ones appended since the last turn get indexed)
+    conv_index = get_index(state.get("conversation_id"), state.get("messages") or None)
+
+    # 1b) Earlier conversations of the same customer (also on a conversation's first turn)
+    query = state.get("input") or (conv_index.msgs[-1].content if conv_index.msgs else "")
+    state["history_refs"] = history_refs(state.get("email"), state.get("conversation_id"), query,
+                                         archived_before=conv_index.compacted)
+    state["conversation_summary"] = conv_index.summary
+
+    if not conv_index.msgs:
         # no context — returns a minimal state
         state["context_summary"] = ""
         state["context_refs"] = []
         state["memory"] = {"entities":{}, "links":[]}
         return state
 
-    # 2) Builds index and links newest message
-    index = _build_index(msgs[-20:])  # last 20 msgs
-    links = _topk_links(index, k=5)
+    # 2) Links newest message against the whole conversation (BM25 + entity boosts)
+    index = conv_index.msgs[-LINK_WINDOW:]
+    links = _links(conv_index, k=5)
 
-    # 3) Collect entities and builds memory
-    entities: Dict[str, set] = {"orders": set(), "payments": set(), "emails": set(), "dates": set(), "addresses": set()}
-    for m in index:
-        for k, vals in m.ents.items():
-            entities[k].update(vals)
+    # 3) Running entity sets for the whole conversation
+    entities = conv_index.entities
 
     # 4) Produce summary
     summary = _compose_running_summary(index)
@@ -0,0 +1,101 @@
+# agents/memory_vectors.py
+"""
+Optional NumPy scorer for memory_agent links.
+
+Each message becomes a hashed sparse feature vector (tokens, entities, domain tags).
+Feature values are sqrt of the _score weights, so a dot product reproduces
+memory_agent._score (up to hash collisions). All candidates are scored against the
+newest message with one sparse matrix-vector product, and top-k comes from
+argpartition. Enable with MEMORY_SCORER=vector; without numpy memory_agent falls
+back to BM25.
+"""
+from __future__ import annotations
+
+import math
+import zlib
+from typing import Any, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: pip install numpy
+    np = None
+
+HAS_NUMPY = np is not None
+
+DIM = 1 << 16                  # hashed feature space
+TOKEN_WEIGHT = math.sqrt(0.5)  # _score: 0.5 per shared token
+ENTITY_WEIGHT = math.sqrt(3.0) # _score: 3.0 per shared order/payment/email/date
+TAG_WEIGHT = math.sqrt(2.0)    # _score: 2.0 per shared domain tag
+ENTITY_KINDS = ("orders", "payments", "emails", "dates")   # same kinds as _score
+
+
+def _slot(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) & (DIM - 1)
+
+def features(msg: Any) -> Dict[int, float]:
+    """Hashed features of a memory_agent.Msg (duck-typed: toks, ents, tags)."""
+    out: Dict[int, float] = {}
+    for t in msg.toks:
+        out[_slot("t:" + t)] = TOKEN_WEIGHT
+    for kind in ENTITY_KINDS:
+        for v in set(msg.ents.get(kind) or ()):
+            out[_slot(f"e:{kind}:{v}")] = ENTITY_WEIGHT
+    for tag in set(msg.tags):
+        out[_slot("g:" + tag)] = TAG_WEIGHT
+    return out
+
+
+class HashedVectors:
+    """Append-only CSR matrix (one row per message) in growable numpy buffers."""
+
+    def __init__(self, capacity: int = 4096):
+        if not HAS_NUMPY:
+            raise RuntimeError("numpy is not installed")
+        self.indices = np.zeros(capacity, dtype=np.int32)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.indptr = np.zeros(1024, dtype=np.int64)
+        self.nnz = 0
+        self.rows = 0
+        self.empty = np.zeros(1024, dtype=bool)    # rows with no content never link
+
+    def _grow(self, nnz: int) -> None:
+        if self.nnz + nnz > len(self.indices):
+            cap = max(len(self.indices) * 2, self.nnz + nnz)
+            self.indices = np.resize(self.indices, cap)
+            self.values = np.resize(self.values, cap)
+        if self.rows + 2 > len(self.indptr):
+            self.indptr = np.resize(self.indptr, len(self.indptr) * 2)
+            self.empty = np.resize(self.empty, len(self.indptr))
+
+    def add(self, msg: Any) -> None:
+        feats = features(msg)
+        # every row keeps one (0, 0.0) entry so np.add.reduceat never sees an empty segment
+        idx = [0] + list(feats.keys())
+        val = [0.0] + list(feats.values())
+        self._grow(len(idx))
+        self.indices[self.nnz:self.nnz + len(idx)] = idx
+        self.values[self.nnz:self.nnz + len(val)] = val
+        self.empty[self.rows] = not msg.content
+        self.nnz += len(idx)
+        self.rows += 1
+        self.indptr[self.rows] = self.nnz
+
+    def scores(self, query: Any) -> "np.ndarray":
+        q = np.zeros(DIM, dtype=np.float32)
+        for i, v in features(query).items():
+            q[i] = v
+        prod = q[self.indices[:self.nnz]] * self.values[:self.nnz]
+        return np.add.reduceat(prod, self.indptr[:self.rows])
+
+    def topk(self, query: Any, k: int) -> List[Tuple[int, float]]:
+        """(row, score) of the best k rows other than the query itself, score > 0."""
+        if self.rows == 0:
+            return []
+        s = self.scores(query)
+        if 0 <= query.idx < self.rows:
+            s[query.idx] = 0.0
+        s[self.empty[:self.rows]] = 0.0
+        k = min(k, self.rows)
+        part = np.argpartition(-s, k - 1)[:k]
+        best = part[np.argsort(-s[part], kind="stable")]
+        return [(int(i), float(s[i])) for i in best if s[i] > 0]
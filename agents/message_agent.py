@@ -1,9 +1,10 @@
 from __future__ import annotations
 import os
 import re
-import time
 from typing import TypedDict, Optional, List, Dict, Any, Callable
 import db
+from agents.entity_extractor import EMAIL_RE, first, phone_digits
+from agents.tool_runtime import RetryPolicy, ToolRuntime
 import sendgrid
 from dotenv import load_dotenv
 from sendgrid_tool import send_email
@@ -144,7 +145,8 @@ TOOL_REGISTRY = {
             "cc": "list[str] (optional)",
             "bcc": "list[str] (optional)",
         },
-        "desc": "Send an email via SendGrid with optional CC/BCC."
+        "desc": "Send an email via SendGrid with optional CC/BCC.",
+        "timeout_s": 20,
     },
     "notify:send_sms": {
         "fn": lambda to, body: send_sms_vonage(
@@ -155,11 +157,12 @@ TOOL_REGISTRY = {
             "to": "str (required, phone number)",
             "body": "str (required)",
         },
-        "desc": "Send an SMS via Vonage."
+        "desc": "Send an SMS via Vonage.",
+        "timeout_s": 20,
     }
 }
 
-EMAIL_REGEX = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+EMAIL_REGEX = EMAIL_RE   # shared with agents/entity_extractor.py
 
 
 class MessageAgent:
@@ -176,6 +179,9 @@ class MessageAgent:
     def __init__(self, max_retries: int = 2, backoff_s: float = 0.5):
         self.max_retries = max_retries
         self.backoff_s = backoff_s
+        # a send that timed out may still have gone out: never re-send on timeout
+        self.tools = ToolRuntime(TOOL_REGISTRY, retry=RetryPolicy(max_retries=max_retries, base_s=backoff_s,
+                                                                  retry_timeouts=False))
 
     # --------- entrypoint ---------
     def run(self, state: AgentState) -> AgentState:
@@ -215,7 +221,7 @@ class MessageAgent:
         observations = []
         for step in plan:
             print(f"[DEBUG] Executing tool: {step['tool']} with args: {step['args']}")
-            obs = self._call_tool_with_retries(step["tool"], step["args"], state)
+            obs = self.tools.call(step["tool"], step["args"], state)
             print(f"[DEBUG] Tool result: {obs}")
             observations.append({"step": step, "obs": obs})
 
@@ -231,8 +237,12 @@ class MessageAgent:
     def extract_phone(self, state: AgentState) -> None:
         if state.get("phone"):
             return
-        text = (state.get("input") or "").strip()
-        m = re.search(r"\+?[1-9]\d{1,14}", text)
+        phone = first(state, "phones")
+        if phone:
+            state["phone"] = "+1" + phone_digits(phone)
+            return
+        # non-US numbers: loose E.164
+        m = re.search(r"\+?[1-9]\d{1,14}", (state.get("input") or "").strip())
         if m:
             state["phone"] = m.group(0)
 
@@ -245,10 +255,9 @@ class MessageAgent:
     def extract_email(self, state: AgentState) -> None:
         if state.get("email"):
             return
-        text = (state.get("input") or "").strip()
-        m = EMAIL_REGEX.search(text)
-        if m:
-            state["email"] = m.group(0).lower()
+        email = first(state, "emails")
+        if email:
+            state["email"] = email.lower()
 
     def _validate(self, state: AgentState) -> List[str]:
         issues = []
@@ -288,31 +297,6 @@ class MessageAgent:
             })
         return steps
 
-    def _call_tool_with_retries(self, tool_name: str, args: Dict[str, Any], state: AgentState):
-        if tool_name not in TOOL_REGISTRY:
-            raise ValueError(f"Unknown tool: {tool_name}")
-        fn: Tool = TOOL_REGISTRY[tool_name]["fn"]
-
-        retries = self.max_retries
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                state["tool_calls"].append(f"{tool_name}({', '.join(f'{k}={v!r}' for k,v in args.items())})")
-                result = fn(**args)  # send_email.invoke({...})
-                # Keep a short preview in logs
-                state["tool_results"].append(self._truncate_for_log({"ok": True, "result": result}))
-                return result
-            except Exception as e:
-                state["tool_results"].append(f"[ERROR] {tool_name}: {e!r}")
-                if attempt > retries:
-                    raise
-                time.sleep(self.backoff_s * attempt)
-
-    def _truncate_for_log(self, obj: Any, limit: int = 300) -> str:
-        s = repr(obj)
-        return s if len(s) <= limit else s[:limit] + "…"
-
     # --------- message templating ---------
 
     @staticmethod
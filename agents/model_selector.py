@@ -0,0 +1,92 @@
+# agents/model_selector.py
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from agents.entity_extractor import extract, get_entities
+
+# Turns scoring at or below this go to the fast model
+FAST_MAX_SCORE = float(os.environ.get("MODEL_SELECT_FAST_MAX", "0.2"))
+ADAPTIVE_ENABLED = os.environ.get("ADAPTIVE_MODEL_SELECTION", "1").lower() not in {"0", "false", "no"}
+
+# Greetings / acknowledgements the fast model handles fine
+SMALL_TALK = {
+    "hi", "hello", "hey", "yo", "thanks", "thank", "you", "thx", "ty", "ok", "okay", "k",
+    "bye", "goodbye", "great", "cool", "nice", "awesome", "yes", "no", "yep", "nope",
+    "sure", "good", "morning", "afternoon", "evening", "there", "got", "it", "perfect",
+}
+
+# weights for the complexity score (sum = 1.0)
+W_LENGTH = 0.40
+W_ENTITIES = 0.35
+W_UNCERTAINTY = 0.25
+
+LENGTH_SATURATION = 25       # words at which the length factor maxes out
+ENTITY_SATURATION = 3        # entities at which the entity factor maxes out
+
+SELECTION_COUNTS: Dict[str, int] = {"fast": 0, "primary": 0}
+
+
+@dataclass
+class Selection:
+    tier: str                      # "fast" | "primary"
+    score: float
+    factors: Dict[str, float] = field(default_factory=dict)
+
+
+def estimate_complexity(text: str, memory: Optional[Dict[str, Any]] = None,
+                        intent_confidence: Optional[float] = None,
+                        entities: Optional[Dict[str, Any]] = None) -> Tuple[float, Dict[str, float]]:
+    """
+    0.0 (trivial) .. 1.0 (complex), from:
+      - length of the message
+      - entities in the message (order/payment IDs, emails, dates, addresses)
+        plus whether memory_agent already tracks entities for this conversation
+      - how unsure the supervisor was about the intent
+    """
+    words = re.findall(r"[a-z0-9']+", (text or "").lower())
+    if words and all(w in SMALL_TALK for w in words):
+        return 0.0, {"small_talk": 1.0}
+
+    length = min(1.0, len(words) / LENGTH_SATURATION)
+
+    ents = entities if entities is not None else extract(text or "")
+    n_ents = sum(len(v) for v in ents.values())
+    mem_ents = ((memory or {}).get("entities") or {})
+    has_mem_ents = any(mem_ents.get(k) for k in mem_ents)
+    entities = min(1.0, n_ents / ENTITY_SATURATION + (0.2 if has_mem_ents else 0.0))
+
+    uncertainty = 0.5 if intent_confidence is None else 1.0 - max(0.0, min(1.0, intent_confidence))
+
+    # several questions / clauses usually need real reasoning
+    multi = 0.1 if (text or "").count("?") > 1 or len(re.findall(r"\b(and|but|also|because)\b", text or "", re.I)) > 1 else 0.0
+
+    score = W_LENGTH * length + W_ENTITIES * entities + W_UNCERTAINTY * uncertainty + multi
+    factors = {
+        "length": round(length, 3),
+        "entities": round(entities, 3),
+        "uncertainty": round(uncertainty, 3),
+        "multi": multi,
+    }
+    return round(min(1.0, score), 3), factors
+
+
+def select_model(state: Dict[str, Any], primary: Any, fast: Any) -> Tuple[Any, Selection]:
+    """Pick the fast model when the turn is simple enough; logs the choice."""
+    if not ADAPTIVE_ENABLED:
+        return primary, Selection("primary", 1.0, {"adaptive": 0.0})
+
+    score, factors = estimate_complexity(
+        state.get("input") or "",
+        memory=state.get("memory"),
+        intent_confidence=state.get("intent_confidence"),
+        entities=get_entities(state),
+    )
+    tier = "fast" if score <= FAST_MAX_SCORE else "primary"
+    SELECTION_COUNTS[tier] += 1
+    detail = ", ".join(f"{k}={v}" for k, v in factors.items())
+    print(f"[MODEL_SELECT] {tier} (score={score:.2f}; {detail})")
+    return (fast if tier == "fast" else primary), Selection(tier, score, factors)
@@ -1,9 +1,10 @@
 from __future__ import annotations
 import re
-import time
 from typing import TypedDict, Optional, List, Dict, Any, Callable
 
 import db
+from agents.entity_extractor import first
+from agents.tool_runtime import RetryPolicy, ToolRuntime
 
 
 # ---------- Shared state type ----------
@@ -23,6 +24,8 @@ class AgentState(TypedDict, total=False):
     context_refs: Optional[List[str]]
     preface: Optional[str]
     memory: Optional[Dict[str, Any]]
+    entities: Optional[Dict[str, List[str]]]
+    orders_cursor: Optional[str]     # keyset cursor for "show more orders" (db.list_orders_page)
 
 
 
@@ -30,17 +33,33 @@ class AgentState(TypedDict, total=False):
 
 Tool = Callable[..., Any]
 
+ORDER_PAGE_SIZE = 5
+ORDER_LIST_COLUMNS = db.ORDER_SUMMARY_COLUMNS + ("shipping_address",)
+_MORE_RE = re.compile(r"\b(more|older) orders\b", re.I)     # same phrases as supervisor INTENT_KEYWORDS
+
 TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
     "orders:list_for_user": {
         "fn": lambda email: db.list_orders_for_user(email),
         "schema": {"email": "str (required)"},
         "desc": "Return orders for a given user email, newest first.",
     },
+    "orders:list_page": {
+        "fn": lambda email, limit=ORDER_PAGE_SIZE, cursor=None: db.list_orders_page(
+            email, limit=limit, cursor=cursor, columns=ORDER_LIST_COLUMNS
+        ),
+        "schema": {"email": "str (required)", "limit": "int", "cursor": "str (from the previous page)"},
+        "desc": "Return one page of the user's orders, newest first, and the cursor for the next page.",
+    },
     "orders:get_by_id": {
         "fn": lambda order_id: db.get_order_by_id(order_id),
         "schema": {"order_id": "str (required)"},
         "desc": "Return details for a specific order by its ID.",
     },
+    "orders:get_full": {
+        "fn": lambda order_id, email=None: db.get_order_full(order_id, email=email),
+        "schema": {"order_id": "str (required)", "email": "str (only this user's order)"},
+        "desc": "Return one order with its line items and payments (batched queries, one connection).",
+    },
     "orders:update_shipping_address": {
         "fn": lambda order_id, shipping_address: db.set_order_shipping_address(
             order_id, shipping_address
@@ -54,13 +73,6 @@ TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {
 }
 
 
-# ---------- Regex helpers ----------
-
-EMAIL_REGEX = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
-ORDER_REGEX = re.compile(r"\bord_\d{3,7}\b", re.IGNORECASE)
-ORDER_ADDRESS_REGEX = re.compile(r"\b\d{1,6}\s+[A-Za-z0-9 .'-]+,\s*[A-Za-z .'-]+,\s*[A-Za-z]{2}\s+\d{5}(?:-\d{4})?\b", re.IGNORECASE,) #US address
-
-
 def _resolve_order_id(state: AgentState) -> str: # Try to find an order ID from memory agent
 
     orderid = (state.get("order_id") or "").strip().lower()
@@ -74,13 +86,8 @@ def _resolve_order_id(state: AgentState) -> str: # Try to find an order ID from
         # use the last mentioned order
         return orders_from_mem[-1].lower()
 
-    text = state.get("input") or ""
-    if "ORDER_REGEX" in globals():
-        m = ORDER_REGEX.search(text)
-        if m:
-            return m.group(0).lower()
-
-    return ""
+    order_id = first(state, "orders")
+    return order_id.lower() if order_id else ""
 
 
 def _format_money(cents: Any) -> str: # needed for formatting money amounts so that they show up as $xx.xx and not $xx.x
@@ -102,6 +109,7 @@ class OrderAgent:
     def __init__(self, max_retries: int = 2, backoff_s: float = 0.4):
         self.max_retries = max_retries
         self.backoff_s = backoff_s
+        self.tools = ToolRuntime(TOOL_REGISTRY, retry=RetryPolicy(max_retries=max_retries, base_s=backoff_s))
 
     def run(self, state: AgentState) -> AgentState:
         self._ensure_lists(state)
@@ -141,7 +149,7 @@ class OrderAgent:
         # 3) Act
         observations: List[Dict[str, Any]] = []
         for step in plan:
-            obs = self._call_tool_with_retries(step["tool"], step["args"], state)
+            obs = self.tools.call(step["tool"], step["args"], state, max_retries=state.get("max_retries"))
             observations.append({"step": step, "obs": obs})
 
         # 4) Interpret
@@ -164,10 +172,9 @@ class OrderAgent:
     def _extract_email(self, state: AgentState) -> None:
         if state.get("email"):
             return
-        text = (state.get("input") or "").strip()
-        m = EMAIL_REGEX.search(text)
-        if m:
-            state["email"] = m.group(0).lower()
+        email = first(state, "emails")
+        if email:
+            state["email"] = email.lower()
 
     def _extract_order_id(self, state: AgentState) -> None:
         """
@@ -187,57 +194,32 @@ class OrderAgent:
             state["order_id"] = orders_from_mem[0]
             return
 
-        # From current text
-        text = (state.get("input") or "")
-        m = ORDER_REGEX.search(text)
-        if m:
-            state["order_id"] = m.group(0)
+        # From current text (extracted once per turn by the supervisor)
+        order_id = first(state, "orders")
+        if order_id:
+            state["order_id"] = order_id
 
     # ----------------- Planning -----------------
     def _plan(self, state: AgentState, *, email: str, order_id: str) -> List[Dict[str, Any]]:
         
+        if order_id and email:
+            return [{"tool": "orders:get_full", "args": {"order_id": order_id, "email": email}}]
+
         if order_id:
-            return [{"tool": "orders:get_by_id", "args": {"order_id": order_id}}]
+            return [{"tool": "orders:get_full", "args": {"order_id": order_id}}]
 
         if email:
-            return [{"tool": "orders:list_for_user", "args": {"email": email}}]
+            # "show more orders" continues from the last page shown; anything else starts over
+            text = state.get("input") or ""
+            cursor = state.get("orders_cursor") if _MORE_RE.search(text) else None
+            return [{"tool": "orders:list_page",
+                     "args": {"email": email, "limit": ORDER_PAGE_SIZE, "cursor": cursor}}]
 
         return []
 
 
-    def _call_tool_with_retries(self, tool_name: str, args: Dict[str, Any], state: AgentState):
-        if tool_name not in TOOL_REGISTRY:
-            raise ValueError(f"Unknown tool: {tool_name}")
-        fn: Tool = TOOL_REGISTRY[tool_name]["fn"]
-
-        retries = int(state.get("max_retries", self.max_retries))
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                state["tool_calls"].append(
-                    f"{tool_name}({', '.join(f'{k}={v!r}' for k, v in args.items())})"
-                )
-                result = fn(**args)
-                safe_result = self._safe_preview(result)
-                state["tool_results"].append(self._truncate_for_log(safe_result))
-                return result
-            except Exception as e:
-                state["tool_results"].append(f"[ERROR] {tool_name}: {e!r}")
-                if attempt > retries:
-                    raise
-                time.sleep(self.backoff_s * attempt)
-
     # ---------- helper functions ----------
 
-    def _safe_preview(self, value: Any) -> Any:
-        try:
-            if isinstance(value, list):
-                return [self._row_to_dict(r) for r in value[:5]]
-            return value
-        except Exception:
-            return "<unserializable>"
-
     def _row_to_dict(self, row: Any) -> Dict[str, Any]:
         try:
             if isinstance(row, dict):
@@ -246,10 +228,6 @@ class OrderAgent:
         except Exception:
             return {"_repr": repr(row)}
 
-    def _truncate_for_log(self, obj: Any, limit: int = 300) -> str:
-        s = repr(obj)
-        return s if len(s) <= limit else s[:limit] + "…"
-
     def _interpret(self, observations: List[Dict[str, Any]], state: AgentState) -> Dict[str, Any]:
         """
         Normalize into a list of order dicts + confidence.
@@ -258,6 +236,13 @@ class OrderAgent:
             return {"orders": [], "confidence": 0.3}
 
         obs = observations[0]["obs"]
+        step = observations[0]["step"]
+
+        # list_orders_page returns (rows, next cursor)
+        next_cursor = None
+        if step["tool"] == "orders:list_page":
+            obs, next_cursor = obs
+            state["orders_cursor"] = next_cursor
 
         # db.get_order_by_id might return a single row or a list
         rows: List[Dict[str, Any]] = []
@@ -270,18 +255,22 @@ class OrderAgent:
 
         return {
             "orders": rows,
+            "more": next_cursor is not None,
+            "continued": bool(step["args"].get("cursor")),
             "confidence": 0.9 if rows else 0.5,
         }
 
     def _format_user_message(self, result: Dict[str, Any]) -> str:
         orders = result.get("orders") or []
         if not orders:
+            if result.get("continued"):
+                return "There are no older orders to show."
             return "I couldn’t find any orders that match your request."
 
-        # If multiple orders, a short list is shown
-        if len(orders) > 1:
-            lines = ["Here are your recent orders:"]
-            for r in orders[:5]:
+        # If multiple orders (or a later page), a short list is shown
+        if len(orders) > 1 or result.get("more") or result.get("continued"):
+            lines = ["Here are more of your orders:" if result.get("continued") else "Here are your recent orders:"]
+            for r in orders[:ORDER_PAGE_SIZE]:
                 oid = r.get("order_id", "Unknown")
                 status = (r.get("status") or "Unknown").strip().capitalize()
                 subtotal = r.get("subtotal_cents")
@@ -296,6 +285,8 @@ class OrderAgent:
 
                 money = _format_money(total) if total is not None else "N/A"
                 lines.append(f"- **{oid}** — {status}, total {money}")
+            if result.get("more"):
+                lines.append("Say “show more orders” to see older ones.")
             return "\n".join(lines)
         
         # Single order: richer description
@@ -319,6 +310,17 @@ class OrderAgent:
         if total is not None:
             parts.append(f"Estimated total: {_format_money(total)}.")
 
+        # line items / payments come with orders:get_full
+        items = o.get("items") or []
+        if items:
+            parts.append("Items: " + ", ".join(
+                f"{it.get('qty') or 1} × {it.get('name') or it.get('sku') or 'item'}" for it in items) + ".")
+        payments = o.get("payments") or []
+        if payments:
+            p = payments[-1]
+            parts.append(f"Payment: {_format_money(p.get('amount_cents'))} by {p.get('method') or 'card'} "
+                         f"({(p.get('status') or 'unknown').strip()}).")
+
         addr = o.get("shipping_address")
         if addr:
             parts.append(f"Shipping to: {addr}")
@@ -328,7 +330,6 @@ class OrderAgent:
 def change_order_shipping_address_agent(state: AgentState) -> AgentState:
     
 
-    text = (state.get("input") or "").strip()
     email = (state.get("email") or "").strip().lower()
 
     # 1) Resolve order_id (prefer state, else parse from text)
@@ -352,7 +353,7 @@ def change_order_shipping_address_agent(state: AgentState) -> AgentState:
 
     # 2) Look up the order
     try:
-        row = db.get_order_by_id(order_id)
+        row = db.get_order_for_user(email, order_id) if email else db.get_order_by_id(order_id)
     except Exception as e:
         state["output"] = f"Sorry, I couldn't look up order `{order_id}` ({e})."
         return state
@@ -381,9 +382,9 @@ def change_order_shipping_address_agent(state: AgentState) -> AgentState:
 
     # 4) Try to detect a new address in THIS message
     updates_addr = None
-    addr = ORDER_ADDRESS_REGEX.search(text)
+    addr = first(state, "addresses")
     if addr:
-        updates_addr = addr.group(0).strip()
+        updates_addr = addr.strip()
 
     # 5) If we found a new address, update and confirm
     if updates_addr:
@@ -1,10 +1,18 @@
 # agents/policy_agent.py
 from __future__ import annotations
 
-from typing import TypedDict, Optional, List, Dict, Any
+import re
+import time
+from datetime import datetime
+from itertools import islice
+from typing import TypedDict, Optional, List, Dict, Any, Iterable, Iterator, Tuple
 from pathlib import Path
 
-from agents.general_agent import model #uses gemini as backup
+import db
+
+from agents.general_agent import model, model_fast #uses gemini as backup
+from agents import prompt_builder, llm_runtime, policy_index, policy_cache, policy_rules
+from agents.prompt_builder import PromptBuilder, SECTION_BUDGETS, truncate_to_tokens
 
 
 class AgentState(TypedDict, total=False):
@@ -55,6 +63,27 @@ def _load_policy_text(state: AgentState) -> str:
         )
 
 
+def _select_policy_text(state: AgentState, query: str) -> str:
+    """
+    Only the policy sections relevant to `query` (agents/policy_index.py); the general
+    eligibility section is always included. Falls back to the whole file.
+    """
+    try:
+        text, tokens, total = policy_index.relevant_policy(query, pin_first=True)
+        print(f"[POLICY] sections selected: ~{tokens} of ~{total} policy tokens")
+        return text
+    except Exception as e:
+        print(f"[POLICY] section index unavailable ({e}); sending the full policy")
+        return _load_policy_text(state)
+
+
+def _policy_version() -> Optional[str]:
+    try:
+        return policy_index.get_index().version
+    except Exception:
+        return None
+
+
 def _has_order_context(state: AgentState) -> bool: #checks if any order-related fields are present
     keys = [
         "order_id",
@@ -97,60 +126,71 @@ def _build_order_context(state: AgentState) -> str: #builds a text summary of or
     return "\n".join(lines) if lines else "No order context provided."
 
 
+def _invoke(builder: PromptBuilder) -> str:
+    built = builder.build()
+    start = time.perf_counter()
+    resp = llm_runtime.invoke(
+        model, built.text,
+        hedge_model=model_fast,
+        deadline_s=llm_runtime.CALL_DEADLINE_S,
+        fallback=llm_runtime.BUSY_MESSAGE,
+    )
+    prompt_builder.record(built, time.perf_counter() - start)
+    return getattr(resp, "content", str(resp))
+
+
 def _answer_policy_question(policy_text: str, question: str) -> str:
 
     if not question.strip():
         return "I can answer questions about our return and warranty policy. What would you like to know?"
 
-    prompt = f"""
-        You are a customer support assistant. You MUST answer using ONLY the policy text below.
-
-        Return & Warranty Policy:
-        \"\"\"{policy_text}\"\"\"
-
-        User's question:
-        \"\"\"{question}\"\"\"
-
-        Instructions:
-        - Base your answer solely on the policy text above.
-        - If the policy explicitly answers the question, quote or paraphrase the relevant part.
-        - If the policy does NOT clearly specify the answer, respond with something like:
-        "The policy text does not specify this clearly. Please contact support for clarification."
-        - Be concise (2–5 short sentences).
-        """
-
-    resp = model.invoke(prompt)
-    return getattr(resp, "content", str(resp))
+    builder = PromptBuilder("policy_agent.qa")
+    builder.add(
+        "intro",
+        "You are a customer support assistant. You MUST answer using ONLY the policy text below.",
+        kind="system", required=True,
+    )
+    builder.add("policy", f'"""{policy_text}"""', header="Return & Warranty Policy:")
+    builder.add("question", f'"""{question}"""', kind="user", header="User's question:",
+                keep="both", required=True)
+    builder.add(
+        "instructions",
+        "- Base your answer solely on the policy text above.\n"
+        "- If the policy explicitly answers the question, quote or paraphrase the relevant part.\n"
+        "- If the policy does NOT clearly specify the answer, respond with something like:\n"
+        "\"The policy text does not specify this clearly. Please contact support for clarification.\"\n"
+        "- Be concise (2–5 short sentences).",
+        kind="system", header="Instructions:", required=True,
+    )
+    return _invoke(builder)
 
 
 def _check_eligibility(policy_text: str, question: str, order_context: str) -> str:
     """
     Eligibility check using ONLY the policy text + the order context.
     """
-    prompt = f"""
-    You are an assistant that determines return/warranty eligibility using ONLY the policy text below.
-
-    Return & Warranty Policy:
-    \"\"\"{policy_text}\"\"\"
-
-    Order context:
-    \"\"\"{order_context}\"\"\"
-
-    User's question or request:
-    \"\"\"{question}\"\"\"
-
-    Tasks:
-    1. Decide if the request is clearly **Eligible**, **Not eligible**, or **Unclear** based ONLY on the policy text.
-    2. Briefly explain which parts of the policy you used.
-    3. If anything is missing (e.g., dates or information), say the decision is **Unclear** and note what additional information is needed.
-
-    OUTPUT FORMAT (exactly):
-    Decision: <Eligible / Not eligible / Unclear>
-    Reason: <short explanation in 2–4 sentences, referencing the policy text>
-    """
-
-    resp = model.invoke(prompt)
-    return getattr(resp, "content", str(resp))
+    builder = PromptBuilder("policy_agent.eligibility")
+    builder.add(
+        "intro",
+        "You are an assistant that determines return/warranty eligibility using ONLY the policy text below.",
+        kind="system", required=True,
+    )
+    builder.add("policy", f'"""{policy_text}"""', header="Return & Warranty Policy:")
+    builder.add("order_context", f'"""{order_context}"""', kind="user", header="Order context:",
+                required=True)
+    builder.add("question", f'"""{question}"""', kind="user", header="User's question or request:",
+                keep="both", required=True)
+    builder.add(
+        "instructions",
+        "1. Decide if the request is clearly **Eligible**, **Not eligible**, or **Unclear** based ONLY on the policy text.\n"
+        "2. Briefly explain which parts of the policy you used.\n"
+        "3. If anything is missing (e.g., dates or information), say the decision is **Unclear** and note what additional information is needed.\n\n"
+        "OUTPUT FORMAT (exactly):\n"
+        "Decision: <Eligible / Not eligible / Unclear>\n"
+        "Reason: <short explanation in 2–4 sentences, referencing the policy text>",
+        kind="system", header="Tasks:", required=True,
+    )
+    return _invoke(builder)
 
 
 def policy_agent(state: AgentState) -> AgentState:
@@ -163,14 +203,17 @@ def policy_agent(state: AgentState) -> AgentState:
     print("[AGENT] policy_agent selected")
     _ensure_lists(state)
 
-    policy_text = _load_policy_text(state)
-
     # 🔹 Combine memory context + current question
     base_question = (state.get("input") or "").strip()
+    policy_text = _select_policy_text(state, " ".join(
+        str(state.get(k) or "") for k in ("item_category", "reason_for_return")
+    ) + " " + base_question)
     preface = (state.get("preface") or "").strip()
 
     if preface:
-        # Let the LLM see prior conversation context + current question
+        # Let the LLM see prior conversation context + current question.
+        # Context gets the memory budget; the newest context is kept.
+        preface = truncate_to_tokens(preface, SECTION_BUDGETS["memory"], keep="tail")
         user_question = (
             "Conversation context from previous messages:\n"
             f"{preface}\n\n"
@@ -193,10 +236,147 @@ def policy_agent(state: AgentState) -> AgentState:
         state["tool_results"].append("policy_agent: eligibility check completed")
         state["output"] = result
     else:
-        # Pure Q&A mode
+        # Pure Q&A mode; answers to self-contained questions are shared across customers
+        version = _policy_version()
+        cached = policy_cache.CACHE.get(base_question, version) if version else None
+        if cached is not None:
+            day = policy_cache.CACHE.report()
+            print(f"[POLICY_CACHE] hit; today {day['hits'] + day['near_hits']} hits ({day['hit_rate_pct']}%)")
+            state["tool_results"].append("policy_agent: qa answered from cache")
+            state["output"] = cached
+            return state
         result = _answer_policy_question(policy_text, user_question)
+        if version and result != llm_runtime.BUSY_MESSAGE:
+            policy_cache.CACHE.put(base_question, version, result)
         state["tool_results"].append("policy_agent: qa completed")
         state["output"] = result
 
     return state
 
+
+# ------------ Batch eligibility ------------
+BATCH_CHUNK = 500        # orders per pass over a list/stream (one items query per chunk)
+LLM_BATCH_SIZE = 10      # undecided orders per multi-order prompt
+
+_BATCH_LINE_RE = re.compile(r"^[\s*•-]*([A-Za-z0-9_-]+)\s*\|\s*(Eligible|Not eligible|Unclear)\s*\|\s*(.*)$",
+                            re.IGNORECASE | re.MULTILINE)
+
+
+def check_eligibility_batch(orders: Iterable[Any], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Return eligibility for many orders at once (support tools, nightly jobs).
+
+    `orders` is a list or stream of order rows/dicts (order_id, created_at, optionally
+    category, items [(sku, name)], reason, text, is_clearance). Items are loaded with one
+    query per chunk, orders are grouped by (category, purchase age, reason, ...) and each
+    group is decided once by the local rules; only undecided orders reach the model,
+    LLM_BATCH_SIZE per prompt. Each result: order_id, category, days_since_purchase,
+    eligible (True/False), reason, decided_by ("rules", "model" or "manual").
+    """
+    return list(iter_eligibility_batch(orders, now))
+
+
+def iter_eligibility_batch(orders: Iterable[Any], now: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """Streaming form of check_eligibility_batch: results are yielded chunk by chunk."""
+    try:
+        rules = policy_rules.load_rules()
+    except (OSError, ValueError) as e:
+        print(f"[POLICY_BATCH] rules table unavailable: {e}")
+        rules = None
+    it = iter(orders)
+    while True:
+        chunk = [dict(o) for o in islice(it, BATCH_CHUNK)]
+        if not chunk:
+            return
+        yield from _eligibility_chunk(chunk, rules, now or datetime.now())
+
+
+def _eligibility_chunk(chunk: List[Dict[str, Any]], rules: Optional[policy_rules.Rules],
+                       now: datetime) -> List[Dict[str, Any]]:
+    missing = [o["order_id"] for o in chunk if not o.get("category") and "items" not in o]
+    items = db.list_items_for_orders(missing) if missing else {}
+
+    results: List[Dict[str, Any]] = []
+    groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+    for o in chunk:
+        if o.get("category"):
+            category = o["category"]
+        elif "items" in o:
+            category = policy_rules.categorize_items(
+                (i.get("sku"), i.get("name")) if isinstance(i, dict) else (i[0], i[1]) for i in o["items"] or ())
+        else:
+            category = policy_rules.categorize_items(
+                (r["sku"], r["name"], r["category"]) for r in items.get(o["order_id"], []))
+        res = {
+            "order_id": o["order_id"],
+            "category": category,
+            "days_since_purchase": policy_rules.days_since(o.get("created_at"), now),
+            "eligible": None, "reason": "", "decided_by": None,
+        }
+        results.append(res)
+        key = (category, res["days_since_purchase"], o.get("reason") or "customer initiated return",
+               ("clearance",) if o.get("is_clearance") else (), o.get("text") or "")
+        groups.setdefault(key, []).append(res)
+
+    undecided: List[Tuple[Dict[str, Any], str, str]] = []
+    for (category, days, reason, flags, text), members in groups.items():
+        if rules is not None:
+            d = policy_rules.evaluate(category, days, reason, text, flags, rules)
+        else:
+            d = policy_rules.Decision(None, "rules table unavailable", "no_rules")
+        for res in members:
+            if d.eligible is None:
+                undecided.append((res, reason, text))
+            else:
+                res.update(eligible=d.eligible, reason=d.reason, decided_by="rules")
+    policy_rules.count(local=len(results) - len(undecided), llm=len(undecided))
+
+    prompts = 0
+    for i in range(0, len(undecided), LLM_BATCH_SIZE):
+        _ask_model_batch(undecided[i:i + LLM_BATCH_SIZE], rules)
+        prompts += 1
+    print(f"[POLICY_BATCH] {len(results)} orders in {len(groups)} groups; "
+          f"{len(undecided)} undecided sent in {prompts} prompts")
+    return results
+
+
+def _ask_model_batch(part: List[Tuple[Dict[str, Any], str, str]], rules: Optional[policy_rules.Rules]) -> None:
+    """One multi-order eligibility prompt; unanswered or Unclear orders fall back to the table."""
+    query = " ".join(sorted({res["category"] for res, _, _ in part} | {reason for _, reason, _ in part}))
+    lines = []
+    for res, reason, text in part:
+        line = (f"- {res['order_id']}: category {res['category']}; "
+                f"purchased {res['days_since_purchase']} days ago; reason: {reason}")
+        if text:
+            line += f'; customer wrote: "{text}"'
+        lines.append(line)
+
+    builder = PromptBuilder("policy_agent.eligibility_batch")
+    builder.add(
+        "intro",
+        "You are an assistant that determines return/warranty eligibility using ONLY the policy text below.",
+        kind="system", required=True,
+    )
+    builder.add("policy", f'"""{_select_policy_text({}, query)}"""', header="Return & Warranty Policy:")
+    builder.add("orders", "\n".join(lines), kind="user", header="Orders:", required=True)
+    builder.add(
+        "instructions",
+        "For EACH order decide if a return is clearly Eligible, Not eligible, or Unclear based ONLY on the policy text.\n\n"
+        "OUTPUT FORMAT (exactly one line per order, nothing else):\n"
+        "<order_id> | <Eligible / Not eligible / Unclear> | <one-sentence reason>",
+        kind="system", header="Tasks:", required=True,
+    )
+    output = _invoke(builder)
+    answers = {m.group(1).lower(): (m.group(2).lower(), m.group(3).strip())
+               for m in _BATCH_LINE_RE.finditer(output or "")}
+
+    for res, reason, text in part:
+        decision, why = answers.get(str(res["order_id"]).lower(), ("unclear", ""))
+        if decision != "unclear":
+            res.update(eligible=(decision == "eligible"), reason=why, decided_by="model")
+        elif rules is not None:
+            d = policy_rules.evaluate(res["category"], res["days_since_purchase"], reason, text,
+                                      rules=rules, strict=False)
+            res.update(eligible=d.eligible, reason=d.reason, decided_by="rules")
+        else:
+            res.update(eligible=False, reason="Return eligibility requires manual review.", decided_by="manual")
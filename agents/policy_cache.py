@@ -0,0 +1,198 @@
+# agents/policy_cache.py
+"""
+Answer cache for policy Q&A.
+
+Policy questions repeat across customers, so answers are cached per policy version
+(hash of return_policy.txt, see policy_index.PolicyIndex.version). Questions are
+normalised (lowercase, stopwords dropped, light stemming, word order ignored); an
+exact normalised match is a hit, otherwise MinHash signatures over word + bigram
+shingles find near-duplicates through LSH buckets, confirmed by exact Jaccard
+similarity and by the same product-category, number and negation words ("apparel"
+vs "electronics", "7 days" vs "30 days"). Negations and modals are kept as tokens, so
+"can clearance items be returned" and "clearance items can not be returned" differ.
+LRU-bounded; a new policy version drops every older entry. Hits and
+misses are counted per day.
+
+Only self-contained questions are cached: too few content words, or a pronoun that
+points back into the conversation ("does that apply to it?"), skips the cache.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from agents.policy_index import STOPWORDS, _stem
+from agents.policy_rules import BUNDLE_KEYWORDS, CATEGORY_KEYWORDS
+
+MAX_ENTRIES = 1000
+MIN_TOKENS = 2
+SIMILARITY = 0.7          # Jaccard over shingles for a near-duplicate hit
+NUM_PERM = 64
+BANDS = 16                # LSH: 16 bands x 4 rows
+ROWS = NUM_PERM // BANDS
+ANAPHORA = {"it", "its", "that", "this", "those", "these", "them", "they", "one", "same"}
+# policy_index drops these as stopwords; here they change the answer
+KEEP_WORDS = {"not", "no", "must", "may", "can", "will", "would", "should"}
+CACHE_STOPWORDS = STOPWORDS - KEEP_WORDS
+NEGATIONS = {"not", "no", "never"}
+_CONTRACTIONS = (
+    (re.compile(r"\bcan'?t\b|\bcannot\b"), "can not"),
+    (re.compile(r"\bwon'?t\b"), "will not"),
+    (re.compile(r"n't\b"), " not"),
+)
+
+_PRIME = (1 << 61) - 1
+_PERMS = [((2 * i + 1) * 0x9E3779B97F4A7C15 % _PRIME, (i + 1) * 0x632BE59BD9B4E019 % _PRIME)
+          for i in range(NUM_PERM)]
+
+
+# ------------ Normalisation / MinHash ------------
+def tokens(question: str) -> List[str]:
+    """Stemmed content tokens, keeping negations, modals and numbers."""
+    text = (question or "").lower().replace("\u2019", "'")
+    for rx, repl in _CONTRACTIONS:
+        text = rx.sub(repl, text)
+    return [_stem(w) for w in re.findall(r"[a-z0-9]+", text)
+            if w not in CACHE_STOPWORDS and (len(w) > 1 or w.isdigit())]
+
+# Words naming what a question is about; a near-duplicate must agree on all of them
+CATEGORY_TERMS = frozenset(tokens(" ".join(
+    [w for _, words in CATEGORY_KEYWORDS for w in words] + list(BUNDLE_KEYWORDS)
+    + ["accessories", "wearables", "clearance", "final", "sale", "digital", "perishable",
+       "personalized", "gift"]
+)))
+
+def facets(toks) -> FrozenSet[str]:
+    """Category, number and negation tokens of a question."""
+    return frozenset(t for t in toks if t in CATEGORY_TERMS or t in NEGATIONS or t.isdigit())
+
+def normalize(question: str) -> Optional[Tuple[str, ...]]:
+    """Sorted content tokens of a self-contained question; None if it should not be cached."""
+    raw = (question or "").lower().replace("'", " ").split()
+    if ANAPHORA & {w.strip("?.!,") for w in raw}:
+        return None
+    toks = sorted(set(tokens(question)))
+    return tuple(toks) if len(toks) >= MIN_TOKENS else None
+
+def shingles(question: str) -> FrozenSet[str]:
+    toks = tokens(question)
+    return frozenset(toks + [a + " " + b for a, b in zip(toks, toks[1:])])
+
+def minhash(sh: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in sh]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+@dataclass
+class Entry:
+    key: Tuple[str, ...]
+    shingles: FrozenSet[str]
+    bands: Tuple[Tuple[int, ...], ...]
+    answer: str
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version: Optional[str] = None
+        self.entries: "OrderedDict[Tuple[str, ...], Entry]" = OrderedDict()
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], Set[Tuple[str, ...]]] = {}
+        self.daily: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    # --- bookkeeping ---
+    def _count(self, what: str) -> None:
+        day = self.daily.setdefault(date.today().isoformat(), {"hits": 0, "near_hits": 0, "misses": 0, "skipped": 0})
+        day[what] += 1
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            if self.entries:
+                print(f"[POLICY_CACHE] policy changed ({self.version} -> {version}); dropped {len(self.entries)} answers")
+            self.entries.clear()
+            self.buckets.clear()
+            self.version = version
+
+    def _drop(self, key: Tuple[str, ...]) -> None:
+        entry = self.entries.pop(key)
+        for i, band in enumerate(entry.bands):
+            bucket = self.buckets.get((i, band))
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[(i, band)]
+
+    # --- API ---
+    def get(self, question: str, version: str) -> Optional[str]:
+        key = normalize(question)
+        with self.lock:
+            self._check_version(version)
+            if key is None:
+                self._count("skipped")
+                return None
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self._count("hits")
+                return entry.answer
+
+            sh = shingles(question)
+            sig = minhash(sh)
+            candidates: Set[Tuple[str, ...]] = set()
+            for i in range(BANDS):
+                candidates |= self.buckets.get((i, sig[i * ROWS:(i + 1) * ROWS]), set())
+            want = facets(key)
+            best, best_sim = None, 0.0
+            for c in candidates:
+                if facets(c) != want:
+                    continue
+                sim = jaccard(sh, self.entries[c].shingles)
+                if sim > best_sim:
+                    best, best_sim = c, sim
+            if best is not None and best_sim >= SIMILARITY:
+                self.entries.move_to_end(best)
+                self._count("near_hits")
+                return self.entries[best].answer
+            self._count("misses")
+            return None
+
+    def put(self, question: str, version: str, answer: str) -> None:
+        key = normalize(question)
+        if key is None or not answer:
+            return
+        sh = shingles(question)
+        sig = minhash(sh)
+        bands = tuple(sig[i * ROWS:(i + 1) * ROWS] for i in range(BANDS))
+        with self.lock:
+            self._check_version(version)
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = Entry(key, sh, bands, answer)
+            for i, band in enumerate(bands):
+                self.buckets.setdefault((i, band), set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+
+    def report(self, day: Optional[str] = None) -> Dict[str, int]:
+        """Counts for `day` (ISO date, default today) plus the hit rate over cacheable lookups."""
+        with self.lock:
+            counts = dict(self.daily.get(day or date.today().isoformat(),
+                                         {"hits": 0, "near_hits": 0, "misses": 0, "skipped": 0}))
+        lookups = counts["hits"] + counts["near_hits"] + counts["misses"]
+        counts["hit_rate_pct"] = round(100 * (counts["hits"] + counts["near_hits"]) / lookups) if lookups else 0
+        return counts
+
+
+CACHE = AnswerCache()
+
+def daily_report() -> List[Tuple[str, Dict[str, int]]]:
+    """(day, counts) for every day with lookups, oldest first."""
+    return [(d, CACHE.report(d)) for d in sorted(CACHE.daily)]
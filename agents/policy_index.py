@@ -0,0 +1,169 @@
+# agents/policy_index.py
+"""
+Section index over return_policy.txt.
+
+The policy is split once into sections and each policy prompt carries only the
+sections relevant to the question (BM25 over section titles + text) instead of the
+whole file. The parsed index is cached per path and rebuilt when the file's mtime or
+size changes.
+
+Sectioning: ALL-CAPS headings ("WARRANTY POLICY") start a section that is kept whole;
+outside those, "Heading:" lines start a section, and a heading with no text of its own
+("Return Categories:") names the group of headings under it.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from agents.prompt_builder import estimate_tokens
+
+POLICY_PATH = "return_policy.txt"
+DEFAULT_K = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3        # title terms count this many times in a section's term counts
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "for", "with", "at", "by",
+    "is", "are", "was", "be", "it", "this", "that", "my", "i", "me", "you", "your", "we", "our",
+    "can", "do", "does", "what", "how", "when", "will", "would", "should", "please", "there", "all",
+    "any", "not", "no", "have", "has", "from", "as", "must", "may", "about",
+}
+
+STATS: Dict[str, int] = {"builds": 0, "hits": 0, "queries": 0}
+
+_MAJOR_RE = re.compile(r"^[A-Z][A-Z0-9 ,&/()'-]{2,}$")          # RETURN PROCESS
+_HEADING_RE = re.compile(r"^[A-Z][^.:]{0,60}:$")                  # Electronics:
+
+
+# ------------ Text helpers ------------
+def _stem(t: str) -> str:
+    for suf in ("ing", "ed", "es", "s"):
+        if len(t) > len(suf) + 3 and t.endswith(suf):
+            return t[: -len(suf)]
+    return t
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in STOPWORDS]
+
+
+# ------------ Sections ------------
+@dataclass
+class Section:
+    pos: int            # order in the file
+    title: str          # "Return Categories > Electronics"
+    text: str           # heading line + body, as in the file
+    tf: Counter = field(default_factory=Counter)
+    length: int = 0
+
+def parse_sections(text: str) -> List[Section]:
+    sections: List[Tuple[str, List[str]]] = []
+    group = ""
+    in_major = False
+    for line in (text or "").splitlines():
+        s = line.strip()
+        if _MAJOR_RE.match(s):
+            sections.append((s.title(), [s]))
+            group, in_major = "", True
+        elif _HEADING_RE.match(s) and not in_major:
+            name = s[:-1]
+            if sections and not any(l.strip() for l in sections[-1][1][1:]) and not sections[-1][0].startswith(group + " >"):
+                # previous heading had no body of its own: it names a group
+                group = sections.pop()[0]
+            sections.append((f"{group} > {name}" if group else name, [s]))
+        elif not sections:
+            sections.append(("General", [line]))
+        else:
+            sections[-1][1].append(line)
+
+    out: List[Section] = []
+    for title, lines in sections:
+        body = "\n".join(lines).strip()
+        if not body:
+            continue
+        tf = Counter(tokenize(body))
+        for t in tokenize(title):
+            tf[t] += TITLE_WEIGHT
+        out.append(Section(len(out), title, body, tf, sum(tf.values())))
+    return out
+
+
+class PolicyIndex:
+    """BM25 over the sections of one policy text."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]   # keys policy_cache entries
+        self.sections = parse_sections(text)
+        self.df: Counter = Counter()
+        for s in self.sections:
+            self.df.update(s.tf.keys())
+        self.avg_len = (sum(s.length for s in self.sections) / len(self.sections)) if self.sections else 1.0
+        self.tokens = estimate_tokens(text)
+
+    def search(self, query: str, k: int = DEFAULT_K) -> List[Tuple[Section, float]]:
+        n = len(self.sections)
+        terms = set(tokenize(query))
+        scored = []
+        for s in self.sections:
+            score = 0.0
+            for t in terms:
+                f = s.tf.get(t)
+                if not f:
+                    continue
+                idf = math.log(1 + (n - self.df[t] + 0.5) / (self.df[t] + 0.5))
+                score += idf * f * (BM25_K1 + 1) / (f + BM25_K1 * (1 - BM25_B + BM25_B * s.length / self.avg_len))
+            if score > 0:
+                scored.append((s, score))
+        scored.sort(key=lambda x: -x[1])
+        return scored[:k]
+
+    def select(self, query: str, k: int = DEFAULT_K, pin_first: bool = False) -> str:
+        """
+        Text of the top-k sections for `query`, in file order. With pin_first the first
+        section (general eligibility rules) is always included. No match: the first k sections.
+        """
+        hits = [s for s, _ in self.search(query, k)]
+        if not hits:
+            hits = self.sections[:k]
+        if pin_first and self.sections and self.sections[0] not in hits:
+            hits = [self.sections[0]] + hits
+        return "\n\n".join(s.text for s in sorted(hits, key=lambda s: s.pos))
+
+
+# ------------ Cached index per file ------------
+_CACHE: Dict[str, Tuple[Tuple[int, int], PolicyIndex]] = {}
+_LOCK = threading.Lock()
+
+def get_index(path: Optional[str] = None) -> PolicyIndex:
+    """Index for `path` (default return_policy.txt), rebuilt when the file changes. Raises OSError if unreadable."""
+    p = Path(path or POLICY_PATH)
+    st = os.stat(p)
+    key, sig = str(p.resolve()), (st.st_mtime_ns, st.st_size)
+    with _LOCK:
+        cached = _CACHE.get(key)
+        if cached and cached[0] == sig:
+            STATS["hits"] += 1
+            return cached[1]
+    index = PolicyIndex(p.read_text(encoding="utf-8"))
+    with _LOCK:
+        _CACHE[key] = (sig, index)
+        STATS["builds"] += 1
+    print(f"[POLICY] indexed {p} ({len(index.sections)} sections, ~{index.tokens} tokens)")
+    return index
+
+def relevant_policy(query: str, k: int = DEFAULT_K, pin_first: bool = False,
+                    path: Optional[str] = None) -> Tuple[str, int, int]:
+    """(selected section text, its tokens, tokens of the whole policy)."""
+    index = get_index(path)
+    STATS["queries"] += 1
+    text = index.select(query, k=k, pin_first=pin_first)
+    return text, estimate_tokens(text), index.tokens
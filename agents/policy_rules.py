@@ -0,0 +1,262 @@
+# agents/policy_rules.py
+"""
+Deterministic return-eligibility rules.
+
+return_policy_rules.json holds the machine-readable part of return_policy.txt
+(per-category return windows, final-sale exclusions, defect and warranty periods). It is
+compiled once into a category -> Rule table, re-read when the file changes, and
+evaluate() decides a return locally. It returns eligible=None only when the request's
+free text mentions something the table cannot judge (item condition, gifts, warranty
+...); those are the cases that still go to policy_agent.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+RULES_PATH = "return_policy_rules.json"
+DATE_FMT = "%Y-%m-%d %H:%M:%S"          # orders.created_at / return_deadline
+
+# keyword -> category for order items, first match wins (first item, then in this order)
+CATEGORY_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("Electronics", ("iphone", "ipad", "laptop", "computer", "phone", "tablet",
+                     "headphones", "speaker", "camera", "tv", "monitor", "electronics")),
+    ("Apparel and Wearables", ("shirt", "pants", "dress", "jacket", "shoes", "clothing",
+                               "apparel", "wear", "jeans", "sweater", "hoodie")),
+    ("Footwear", ("shoes", "boots", "sneakers", "sandals", "footwear")),
+    ("Home Goods", ("kitchen", "home", "decor", "furniture", "lamp", "table")),
+    ("Accessories (Non-Electronics)", ("wallet", "belt", "bag", "purse", "handbag", "backpack",
+                                       "tool", "tools", "hammer", "screwdriver", "wrench",
+                                       "watch", "jewelry", "necklace", "bracelet", "ring",
+                                       "sunglasses", "hat", "cap", "scarf", "gloves")),
+    ("Consumables", ("cleaning", "cleaner", "soap", "detergent", "oil", "oils",
+                     "coating", "polish", "wax", "spray", "liquid", "cream",
+                     "lotion", "shampoo", "conditioner", "food", "snack",
+                     "supplement", "vitamin", "medicine", "consumable")),
+)
+BUNDLE_KEYWORDS = ("bundle", "kit", "set", "pack", "combo", "collection")
+
+STATS: Dict[str, int] = {"checks": 0, "local": 0, "llm": 0}
+
+
+@dataclass(frozen=True)
+class Rule:
+    category: str
+    window_days: int
+    returnable: bool = True
+    unless_reasons: Tuple[str, ...] = ()
+    warranty_days: int = 0
+    restocking_fee_pct: int = 0
+    note: str = ""
+
+@dataclass(frozen=True)
+class Rules:
+    default: Rule
+    categories: Dict[str, Rule]          # lower-cased category -> Rule
+    final_sale_flags: Tuple[str, ...]
+    defect_reasons: Tuple[str, ...]
+    defect_report_days: int
+    ambiguous_re: Optional[re.Pattern]
+    version: str = ""                    # hash of the spec; orders.deadlines_version
+
+    def rule_for(self, category: Optional[str]) -> Rule:
+        return self.categories.get((category or "").strip().lower(), self.default)
+
+@dataclass(frozen=True)
+class Decision:
+    eligible: Optional[bool]      # None: needs the policy model
+    reason: str
+    rule: str                     # which rule decided, for logs/metrics
+
+
+# ------------ Loading ------------
+def compile_rules(spec: Dict[str, Any]) -> Rules:
+    default_days = int(spec.get("default_window_days", 60))
+    cats: Dict[str, Rule] = {}
+    for name, c in (spec.get("categories") or {}).items():
+        cats[name.lower()] = Rule(
+            category=name,
+            window_days=int(c.get("window_days", default_days)),
+            returnable=bool(c.get("returnable", True)),
+            unless_reasons=tuple(c.get("unless_reasons") or ()),
+            warranty_days=int(c.get("warranty_days", 0)),
+            restocking_fee_pct=int(c.get("restocking_fee_pct", 0)),
+            note=c.get("note", ""),
+        )
+    terms = [t for t in spec.get("ambiguous_terms") or [] if t]
+    return Rules(
+        default=cats.get("general merchandise") or Rule("general merchandise", default_days),
+        categories=cats,
+        final_sale_flags=tuple(spec.get("final_sale_flags") or ()),
+        defect_reasons=tuple(spec.get("defect_reasons") or ()),
+        defect_report_days=int(spec.get("defect_report_days", 7)),
+        ambiguous_re=re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE)
+        if terms else None,
+        version=hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16],
+    )
+
+_CACHE: Dict[str, Tuple[Tuple[int, int], Rules]] = {}
+_LOCK = threading.Lock()
+
+def load_rules(path: Optional[str] = None) -> Rules:
+    """Compiled rules for `path` (default return_policy_rules.json), recompiled when the file changes."""
+    p = Path(path or RULES_PATH)
+    st = os.stat(p)
+    key, sig = str(p.resolve()), (st.st_mtime_ns, st.st_size)
+    with _LOCK:
+        cached = _CACHE.get(key)
+        if cached and cached[0] == sig:
+            return cached[1]
+    rules = compile_rules(json.loads(p.read_text(encoding="utf-8")))
+    with _LOCK:
+        _CACHE[key] = (sig, rules)
+    print(f"[RULES] compiled {p} ({len(rules.categories)} categories)")
+    return rules
+
+
+# ------------ Categories ------------
+# One regex for every keyword. Each alternative sits in a lookahead, so a match is
+# attempted at every position (substring semantics, overlaps included); categories are
+# alternatives in priority order, so at any position the highest-priority keyword wins.
+CATEGORY_RE = re.compile(
+    "(?=(?:" + "|".join(
+        f"(?P<c{i}>{'|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))})"
+        for i, (_, words) in enumerate(CATEGORY_KEYWORDS)
+    ) + "))"
+)
+_BUNDLE_RE = re.compile("|".join(re.escape(w) for w in BUNDLE_KEYWORDS))
+
+def classify_item(sku: Optional[str], name: Optional[str]) -> str:
+    """Category of one item from its SKU + name ("" if no keyword matches)."""
+    best = len(CATEGORY_KEYWORDS)
+    for m in CATEGORY_RE.finditer(f"{(sku or '').lower()} {(name or '').lower()}"):
+        best = min(best, int(m.lastgroup[1:]))
+        if best == 0:
+            break
+    return CATEGORY_KEYWORDS[best][0] if best < len(CATEGORY_KEYWORDS) else ""
+
+def categorize_items(items: Iterable[Tuple[Any, ...]]) -> str:
+    """
+    Policy category for an order from its items: (sku, name) pairs, or (sku, name,
+    category) rows where category comes from the sku_categories table (None: not
+    classified yet, "": no keyword).
+    """
+    items = list(items)
+    for item in items:
+        category = item[2] if len(item) > 2 and item[2] is not None else classify_item(item[0], item[1])
+        if category:
+            return category
+    if len(items) > 1:
+        return "Bundles and Kits"
+    if items and _BUNDLE_RE.search(f"{(items[0][0] or '').lower()} {(items[0][1] or '').lower()}"):
+        return "Bundles and Kits"
+    return "general merchandise"
+
+
+def days_since(created_at: Any, now: Optional[datetime] = None) -> Optional[int]:
+    """Whole days since an orders.created_at value ('%Y-%m-%d %H:%M:%S'); None if unparseable."""
+    try:
+        return ((now or datetime.now()) - datetime.strptime(created_at, DATE_FMT)).days
+    except (TypeError, ValueError):
+        return None
+
+def deadlines(category: Optional[str], created_at: Any,
+              rules: Optional[Rules] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (return_deadline, warranty_deadline) for an order: the last second at which days_since()
+    is still within the window, formatted like created_at so `now <= deadline` is a string
+    comparison. warranty_deadline is None without a warranty; both None if created_at is unparseable.
+    """
+    try:
+        created = datetime.strptime(created_at, DATE_FMT)
+    except (TypeError, ValueError):
+        return None, None
+    rule = (rules or load_rules()).rule_for(category)
+
+    def last(days: int) -> str:
+        return (created + timedelta(days=days + 1, seconds=-1)).strftime(DATE_FMT)
+
+    return last(rule.window_days), (last(rule.warranty_days) if rule.warranty_days else None)
+
+def stored_deadlines(order: Dict[str, Any], rules: Rules) -> Optional[Tuple[str, Optional[str]]]:
+    """An order row's precomputed (return_deadline, warranty_deadline), if current for `rules`."""
+    if order.get("deadlines_version") == rules.version and order.get("return_deadline"):
+        return order["return_deadline"], order.get("warranty_deadline")
+    return None
+
+
+# ------------ Evaluation ------------
+def evaluate(category: Optional[str], days_since_purchase: Optional[int], reason: str = "",
+             text: str = "", flags: Iterable[str] = (), rules: Optional[Rules] = None,
+             strict: bool = True, deadlines: Optional[Tuple[str, Optional[str]]] = None,
+             now: Optional[datetime] = None) -> Decision:
+    """
+    Decide a return from the rules table. `reason` is the normalised return reason
+    (return_agent._extract_return_reason), `text` the customer's own words, `flags`
+    item flags such as "clearance". With strict=False free-text ambiguity is ignored
+    (used when the policy model itself could not decide). `deadlines` are the order's
+    precomputed (return_deadline, warranty_deadline); given them, the window checks compare
+    against `now` and days_since_purchase may be None.
+    """
+    rules = rules or load_rules()
+    rule = rules.rule_for(category)
+    flags = {f.lower() for f in flags}
+    defect = reason in rules.defect_reasons
+
+    final_sale = flags & set(rules.final_sale_flags)
+    if final_sale:
+        return Decision(False, "Clearance and final sale items are non-returnable.", "final_sale")
+    if strict and rules.ambiguous_re and text:
+        m = rules.ambiguous_re.search(text)
+        if m:
+            return Decision(None, f"Request mentions '{m.group(0)}', which the rules table cannot judge.", "ambiguous_text")
+    if deadlines is not None:
+        now_s = (now or datetime.now()).strftime(DATE_FMT)
+        in_window = now_s <= deadlines[0]
+        in_warranty = bool(deadlines[1]) and now_s <= deadlines[1]
+    elif days_since_purchase is None:
+        return Decision(False, "Unable to determine order date for policy check.", "no_date")
+    else:
+        in_window = days_since_purchase <= rule.window_days
+        in_warranty = bool(rule.warranty_days) and days_since_purchase <= rule.warranty_days
+
+    if not rule.returnable and reason not in rule.unless_reasons:
+        return Decision(False, f"{rule.category} are non-returnable once opened unless defective.", "non_returnable")
+    if in_window:
+        reason_text = f"{rule.category} return within the {rule.window_days}-day policy limit."
+        if rule.note:
+            reason_text += f" {rule.note}"
+        if rule.restocking_fee_pct and not defect:
+            reason_text += f" A restocking fee of up to {rule.restocking_fee_pct}% may apply if not in like-new condition."
+        return Decision(True, reason_text, "window")
+    if defect and in_warranty:
+        if strict:
+            # outside the return window but inside the warranty: a claim, not a return
+            return Decision(None, "Outside the return window but within the warranty period.", "warranty")
+        return Decision(False, f"The {rule.window_days}-day return window has passed; this may be covered "
+                               f"by the {rule.warranty_days // 365}-year limited warranty instead.", "warranty")
+    age = (f"This order is {days_since_purchase} days old." if days_since_purchase is not None
+           else f"The window for this order closed on {deadlines[0][:10]}.")
+    return Decision(False, f"Return window expired. {rule.category} must be returned within "
+                           f"{rule.window_days} days. {age}", "expired")
+
+def count(local: int = 0, llm: int = 0) -> None:
+    STATS["checks"] += local + llm
+    STATS["local"] += local
+    STATS["llm"] += llm
+
+def record(decision: Decision) -> None:
+    count(local=int(decision.eligible is not None), llm=int(decision.eligible is None))
+    print(f"[RULES] {decision.rule}: eligible={decision.eligible} "
+          f"(local {local_ratio():.0%} of {STATS['checks']} checks)")
+
+def local_ratio() -> float:
+    """Share of eligibility checks decided without the policy model."""
+    return STATS["local"] / STATS["checks"] if STATS["checks"] else 0.0
@@ -0,0 +1,205 @@
+# agents/prompt_builder.py
+from __future__ import annotations
+
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Any
+
+# ------------ Token budgets ------------
+# Rough average for English text on Gemini-style tokenizers. Good enough for
+# budgeting; we never need an exact count.
+CHARS_PER_TOKEN = 4
+
+# Per-section budgets in (approximate) tokens
+SECTION_BUDGETS: Dict[str, int] = {
+    "system": 400,
+    "policy": 1800,
+    "memory": 350,
+    "user": 700,
+}
+
+# Lower number = more important = dropped/truncated last
+SECTION_PRIORITY: Dict[str, int] = {
+    "system": 0,
+    "user": 1,
+    "policy": 2,
+    "memory": 3,
+}
+
+MAX_PROMPT_TOKENS = 3000
+MIN_SECTION_TOKENS = 32   # below this a truncated section is not worth sending
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Approximate token count (chars / 4, rounded up)."""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Clip text to roughly max_tokens.
+    keep="head"  -> keep the beginning (documents, instructions)
+    keep="tail"  -> keep the end (conversation context, newest last)
+    keep="both"  -> keep beginning and end (long pasted user messages)
+    """
+    text = text or ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(ELLIPSIS))
+    if max_chars <= 0:
+        return ""
+    if keep == "tail":
+        return ELLIPSIS + text[-max_chars:]
+    if keep == "both":
+        half = max_chars // 2
+        return text[:half] + ELLIPSIS + text[-(max_chars - half):]
+    return text[:max_chars] + ELLIPSIS
+
+
+# ------------ Builder ------------
+@dataclass
+class Section:
+    name: str
+    kind: str
+    text: str
+    header: Optional[str] = None
+    budget: Optional[int] = None
+    priority: int = 5
+    keep: str = "head"
+    required: bool = False
+
+    def render(self) -> str:
+        if self.header:
+            return f"{self.header}\n{self.text}"
+        return self.text
+
+
+@dataclass
+class BuiltPrompt:
+    agent: str
+    text: str
+    tokens: int
+    sections: Dict[str, int] = field(default_factory=dict)   # kind -> tokens
+    truncated: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class PromptBuilder:
+    """
+    Assembles a prompt from named sections, each with a token budget.
+    If the whole prompt is still over max_tokens, the lowest-priority sections
+    are truncated further or dropped entirely (required sections are never dropped).
+    """
+
+    def __init__(self, agent: str, max_tokens: int = MAX_PROMPT_TOKENS, separator: str = "\n\n"):
+        self.agent = agent
+        self.max_tokens = max_tokens
+        self.separator = separator
+        self._sections: List[Section] = []
+
+    def add(self, name: str, text: Optional[str], *, kind: Optional[str] = None,
+            header: Optional[str] = None, budget: Optional[int] = None,
+            keep: str = "head", required: bool = False) -> "PromptBuilder":
+        text = (text or "").strip()
+        if not text:
+            return self
+        kind = kind or name
+        self._sections.append(Section(
+            name=name,
+            kind=kind,
+            text=text,
+            header=header,
+            budget=budget if budget is not None else SECTION_BUDGETS.get(kind, self.max_tokens),
+            priority=SECTION_PRIORITY.get(kind, 5),
+            keep=keep,
+            required=required,
+        ))
+        return self
+
+    def build(self) -> BuiltPrompt:
+        truncated: List[str] = []
+        dropped: List[str] = []
+        sep_tokens = estimate_tokens(self.separator)
+
+        # 1) Per-section budgets
+        live: List[Section] = []
+        for s in self._sections:
+            header_tokens = estimate_tokens(s.header)
+            room = max(0, s.budget - header_tokens)
+            clipped = truncate_to_tokens(s.text, room, s.keep)
+            if clipped != s.text:
+                truncated.append(s.name)
+                s.text = clipped
+            if s.text:
+                live.append(s)
+            else:
+                dropped.append(s.name)
+
+        # 2) Global budget: shrink/drop lowest priority first
+        def total() -> int:
+            return sum(estimate_tokens(s.render()) for s in live) + sep_tokens * max(0, len(live) - 1)
+
+        over = total() - self.max_tokens
+        for s in sorted(live, key=lambda s: (s.required, -s.priority)):
+            if over <= 0:
+                break
+            cur = estimate_tokens(s.text)
+            target = cur - over
+            if target >= MIN_SECTION_TOKENS or s.required:
+                s.text = truncate_to_tokens(s.text, max(target, 1), s.keep)
+                if s.name not in truncated:
+                    truncated.append(s.name)
+            else:
+                live.remove(s)
+                dropped.append(s.name)
+            over = total() - self.max_tokens
+
+        text = self.separator.join(s.render() for s in live)
+        per_kind: Dict[str, int] = {}
+        for s in live:
+            per_kind[s.kind] = per_kind.get(s.kind, 0) + estimate_tokens(s.render())
+
+        return BuiltPrompt(
+            agent=self.agent,
+            text=text,
+            tokens=estimate_tokens(text),
+            sections=per_kind,
+            truncated=truncated,
+            dropped=dropped,
+        )
+
+
+# ------------ Reporting ------------
+# Recent prompt sizes + latencies so prompt size can be correlated with latency.
+PROMPT_LOG: Deque[Dict[str, Any]] = deque(maxlen=500)
+
+
+def record(built: BuiltPrompt, elapsed_s: Optional[float] = None) -> Dict[str, Any]:
+    """Log the token count (and optionally latency) of one LLM call."""
+    entry = {
+        "agent": built.agent,
+        "tokens": built.tokens,
+        "sections": dict(built.sections),
+        "truncated": list(built.truncated),
+        "dropped": list(built.dropped),
+        "latency_s": round(elapsed_s, 3) if elapsed_s is not None else None,
+    }
+    PROMPT_LOG.append(entry)
+
+    parts = ", ".join(f"{k}={v}" for k, v in built.sections.items())
+    line = f"[PROMPT] {built.agent} tokens={built.tokens} ({parts})"
+    if built.truncated:
+        line += f" truncated={built.truncated}"
+    if built.dropped:
+        line += f" dropped={built.dropped}"
+    if elapsed_s is not None:
+        line += f" latency={elapsed_s:.2f}s"
+    print(line)
+    return entry
@@ -3,8 +3,8 @@ from typing import TypedDict, Optional, List, Dict, Any
 from datetime import datetime
 
 import db
-from agents import message_agent as msg
-from agents import policy_agent
+from agents.entity_extractor import extract, get_entities
+from agents import policy_agent, policy_rules
 
 
 class AgentState(TypedDict):
@@ -21,6 +21,7 @@ class AgentState(TypedDict):
     context_refs: Optional[List[str]]
     preface: Optional[str]
     memory: Optional[Dict[str, Any]]
+    entities: Optional[Dict[str, List[str]]]
 
 def return_agent(state: AgentState) -> AgentState:
     print("[AGENT] return_agent selected")
@@ -35,7 +36,7 @@ def return_agent(state: AgentState) -> AgentState:
         return state
 
     # Attempt to extract order ID from user input
-    order_id = _get_orderid(text)
+    order_id = _get_orderid(text, get_entities(state))
     print(f"[RETURN] Extracted order_id: '{order_id}' from text: '{text}'")
     if order_id:
         # Get order details
@@ -62,14 +63,9 @@ def return_agent(state: AgentState) -> AgentState:
             return state
 
         # process the return
-        if _process_return(email, order_id):
-            state["output"] = (
-                f"Your return request has been submitted.\n\n"
-                f"{order_info}\n\n"
-                f"**Return Policy Check:** ✅ Approved\n"
-                f"{eligibility_result['reason']}\n\n"
-                f"You should receive a confirmation email with return instructions shortly."
-            )
+        ret = _process_return(email, order_id, _extract_return_reason(text), eligibility_result)
+        if ret:
+            state["output"] = _format_return_opened(ret, order_info, eligibility_result)
         else:
             state["output"] = (
                 "Something went wrong processing this return. Please try again or contact support."
@@ -83,18 +79,42 @@ def return_agent(state: AgentState) -> AgentState:
         )
         return state
 
-def _get_orderid(text: str) -> str:
+def _format_return_opened(ret: Dict[str, Any], order_info: str, eligibility: Dict[str, Any]) -> str:
+    """Reply for an opened (or already open) return, worded from the RMA's actual state."""
+    rma_id = ret.get("rma_id")
+    rma_state = ret.get("state") or "requested"
+    if rma_state == "approved":
+        opened = f"We've opened return **{rma_id}** for this order; you'll get an email with return instructions."
+        check = "✅ Approved"
+    elif rma_state == "requested":
+        opened = (f"We've opened return **{rma_id}** for this order. Our team will review it and "
+                  f"you'll get an email with the decision and return instructions.")
+        check = "Pending review"
+    else:
+        opened = f"Return **{rma_id}** for this order is {rma_state.replace('_', ' ')}."
+        check = rma_state.replace("_", " ").capitalize()
+    if ret.get("created") is False:
+        opened = f"This order already has an open return. {opened}"
+    return (
+        f"{opened}\n\n"
+        f"{order_info}\n\n"
+        f"**Return Policy Check:** {check}\n"
+        f"{eligibility.get('reason', '')}"
+    )
+
+def _get_orderid(text: str, entities: Optional[Dict[str, List[str]]] = None) -> str:
     """
     Parse order IDs from free-form text.
     Accepts patterns like: ord_123, ord_electronics_40d, or just numbers like 123
+    `entities` are the supervisor's pre-extracted entities for `text`, if available.
     """
     if not text:
         return ""
     
     # first try to find full order IDs that already start with ord_
-    ord_pattern = re.findall(r'ord_[a-zA-Z0-9_]+', text.lower())
-    if ord_pattern:
-        return ord_pattern[0]
+    orders = (entities if entities is not None else extract(text))["orders"]
+    if orders:
+        return orders[0].lower()
     
     # if no full ord_ pattern found, look for numbers and add ord_ prefix
     lowered = text.lower()
@@ -108,12 +128,8 @@ def _get_orderid(text: str) -> str:
 
 def _get_order_details(email: str, order_id: str) -> Optional[Dict[str, Any]]:
     """Get order details for the specified order ID and email."""
-    orders = db.list_orders_for_user(email)
-    for order in orders:
-        order_dict = dict(order)
-        if order_dict['order_id'] == order_id:
-            return order_dict
-    return None
+    order = db.get_order_for_user(email, order_id)
+    return dict(order) if order else None
 
 
 def _format_order_details(order: Dict[str, Any]) -> str:
@@ -161,34 +177,59 @@ def _format_order_details(order: Dict[str, Any]) -> str:
     return "\n".join(details)
 
 def _check_return_eligibility(order: Dict[str, Any], user_input: str) -> Dict[str, Any]:
-    """Check if the order is eligible for return according to policy."""
-    # build order context for policy agent
-    item_category = _determine_item_category(order)
-    
-    # calculate days since purchase
-    from datetime import datetime
+    """
+    Check if the order is eligible for return according to policy. The rules table
+    (agents/policy_rules.py) decides locally; policy_agent is only asked when the
+    customer's text is something the table cannot judge.
+    """
+    reason = _extract_return_reason(user_input)
+    flags = ["clearance"] if _is_clearance_item(order) else []
     created_at = order.get('created_at', '')
+
     try:
-        purchase_date = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-        days_since_purchase = (datetime.now() - purchase_date).days
-    except:
-        days_since_purchase = 0
-    
+        rules = policy_rules.load_rules()
+    except (OSError, ValueError) as e:
+        print(f"[RETURN_POLICY] rules table unavailable: {e}")
+        rules = None
+
+    # deadlines precomputed by the nightly job make the window check a comparison;
+    # orders it has not seen yet (or whose rules changed) are computed here
+    deadlines = policy_rules.stored_deadlines(order, rules) if rules is not None else None
+    if deadlines is not None:
+        item_category = order["item_category"]
+        days_since_purchase = None
+    else:
+        item_category = _determine_item_category(order)
+        days_since_purchase = policy_rules.days_since(created_at)
+
+    if rules is not None:
+        decision = policy_rules.evaluate(item_category, days_since_purchase, reason, user_input, flags, rules,
+                                         deadlines=deadlines)
+    else:
+        decision = policy_rules.Decision(None, "rules table unavailable", "no_rules")
+    policy_rules.record(decision)
+    if decision.eligible is not None:
+        return {"eligible": decision.eligible, "reason": decision.reason, "decided_by": "rules"}
+
     order_context = {
         "order_id": order.get('order_id'),
         "status": order.get('status'),
         "created_at": created_at,
         "purchase_date": created_at,
         "item_category": item_category,
-        "is_clearance": _is_clearance_item(order),
-        "reason_for_return": _extract_return_reason(user_input)
+        "is_clearance": bool(flags),
+        "reason_for_return": reason
     }
     
+    if days_since_purchase is None:
+        days_since_purchase = policy_rules.days_since(created_at)
+
     # create a more explicit input for the policy agent
     policy_input = (
         f"Customer wants to return order {order.get('order_id')} purchased {days_since_purchase} days ago. "
         f"Item category: {item_category}. "
-        f"Reason: {_extract_return_reason(user_input)}. "
+        f"Reason: {reason}. "
+        f"Customer wrote: {user_input}. "
         f"Is this return eligible under our policy?"
     )
     
@@ -208,46 +249,30 @@ def _check_return_eligibility(order: Dict[str, Any], user_input: str) -> Dict[st
     print(f"[RETURN_POLICY] Policy agent output: {policy_output}")
     print(f"[RETURN_POLICY] Order context: {order_context}")
     
-    #pParse the policy decision
+    # parse the policy decision
     if "Decision: Eligible" in policy_output:
         return {
             "eligible": True,
-            "reason": _extract_policy_reason(policy_output)
+            "reason": _extract_policy_reason(policy_output),
+            "decided_by": "model",
         }
     elif "Decision: Not eligible" in policy_output:
         return {
             "eligible": False,
-            "reason": _extract_policy_reason(policy_output)
+            "reason": _extract_policy_reason(policy_output),
+            "decided_by": "model",
         }
-    elif "Decision: Unclear" in policy_output:
-        # for unclear cases, let's do a basic check ourselves
-        # if it's within 60 days and not a restricted category, approve it
-        from datetime import datetime
-        created_at = order.get('created_at', '')
-        try:
-            purchase_date = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-            days_since_purchase = (datetime.now() - purchase_date).days
-            category = _determine_item_category(order)
-            
-            # basic eligibility logic
-            if days_since_purchase <= 60:
-                if category == "Electronics" and days_since_purchase <= 30:
-                    return {"eligible": True, "reason": "Electronics return within 30-day policy limit."}
-                elif category in ["Consumables"]:
-                    return {"eligible": False, "reason": "Consumables are non-returnable once opened unless defective."}
-                elif category not in ["Electronics"]:
-                    return {"eligible": True, "reason": "Return within 60-day policy limit for general merchandise."}
-                else:
-                    return {"eligible": False, "reason": f"Electronics must be returned within 30 days. This item is {days_since_purchase} days old."}
-            else:
-                return {"eligible": False, "reason": f"Return window expired. Items must be returned within 60 days. This order is {days_since_purchase} days old."}
-        except:
-            return {"eligible": False, "reason": "Unable to determine order date for policy check."}
+    elif "Decision: Unclear" in policy_output and rules is not None:
+        # the model could not decide either: apply the table, ignoring the free text
+        decision = policy_rules.evaluate(item_category, days_since_purchase, reason, user_input, flags,
+                                         rules, strict=False, deadlines=deadlines)
+        return {"eligible": decision.eligible, "reason": decision.reason, "decided_by": "rules"}
     else:
         # if no decision format found, default to requiring manual review
         return {
             "eligible": False,
-            "reason": f"Return eligibility requires manual review. Please contact customer support with your order details. (Debug: {policy_output[:100]}...)"
+            "reason": f"Return eligibility requires manual review. Please contact customer support with your order details. (Debug: {policy_output[:100]}...)",
+            "decided_by": "manual",
         }
 
 
@@ -255,77 +280,10 @@ def _determine_item_category(order: Dict[str, Any]) -> str:
     """Determine the category of items in the order for policy checking."""
     order_id = order.get('order_id', '')
     
-    # get order items to determine category
+    # items joined with their precomputed SKU categories (unclassified SKUs are classified on the fly)
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT sku, name 
-            FROM order_items 
-            WHERE order_id = ?
-        """, (order_id,))
-        items = cursor.fetchall()
-        conn.close()
-        
-        # analyze item names/SKUs to determine category
-        for item in items:
-            sku = (item[0] or '').lower()
-            name = (item[1] or '').lower()
-            
-            # Electronics keywords
-            if any(word in sku + ' ' + name for word in [
-                'iphone', 'ipad', 'laptop', 'computer', 'phone', 'tablet', 
-                'headphones', 'speaker', 'camera', 'tv', 'monitor', 'electronics'
-            ]):
-                return "Electronics"
-            
-            # Apparel keywords  
-            elif any(word in sku + ' ' + name for word in [
-                'shirt', 'pants', 'dress', 'jacket', 'shoes', 'clothing',
-                'apparel', 'wear', 'jeans', 'sweater', 'hoodie'
-            ]):
-                return "Apparel and Wearables"
-            
-            # Footwear keywords
-            elif any(word in sku + ' ' + name for word in [
-                'shoes', 'boots', 'sneakers', 'sandals', 'footwear'
-            ]):
-                return "Footwear"
-            
-            # Home goods keywords
-            elif any(word in sku + ' ' + name for word in [
-                'kitchen', 'home', 'decor', 'furniture', 'lamp', 'table'
-            ]):
-                return "Home Goods"
-            
-            # Accessories (Non-Electronics) keywords
-            elif any(word in sku + ' ' + name for word in [
-                'wallet', 'belt', 'bag', 'purse', 'handbag', 'backpack',
-                'tool', 'tools', 'hammer', 'screwdriver', 'wrench',
-                'watch', 'jewelry', 'necklace', 'bracelet', 'ring',
-                'sunglasses', 'hat', 'cap', 'scarf', 'gloves'
-            ]):
-                return "Accessories (Non-Electronics)"
-            
-            # Consumables keywords
-            elif any(word in sku + ' ' + name for word in [
-                'cleaning', 'cleaner', 'soap', 'detergent', 'oil', 'oils',
-                'coating', 'polish', 'wax', 'spray', 'liquid', 'cream',
-                'lotion', 'shampoo', 'conditioner', 'food', 'snack',
-                'supplement', 'vitamin', 'medicine', 'consumable'
-            ]):
-                return "Consumables"
-        
-        # check if it's a bundle/kit
-        if len(items) > 1:
-            return "Bundles and Kits"
-        elif any(word in sku + ' ' + name for word in [
-            'bundle', 'kit', 'set', 'pack', 'combo', 'collection'
-        ]):
-            return "Bundles and Kits"
-        
-        # default to general merchandise if no specific category found
-        return "general merchandise"
+        items = db.get_order_item_categories(order_id)
+        return policy_rules.categorize_items((r["sku"], r["name"], r["category"]) for r in items)
         
     except Exception as e:
         print(f"Error determining item category: {e}")
@@ -367,22 +325,32 @@ def _extract_policy_reason(policy_output: str) -> str:
     # if no specific reason found, return the full output cleaned up
     return policy_output.replace("Decision: Eligible", "").replace("Decision: Not eligible", "").strip()
 
-def _process_return(email: str, orderid: str) -> bool:
-    """Process the return request for the given order ID and email."""
+def _process_return(email: str, orderid: str, reason: str = "",
+                    eligibility: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Open a return (RMA) for the given order ID and email. The order is marked "return
+    requested" and the confirmation email is queued in the notification outbox in the same
+    transaction (sent by `python jobs.py send-notifications`). Asking again for an order with
+    an open return reuses it. Returns the returns row (plus "created"), or None if the order
+    is not the user's.
+    """
     print("Attempting to process return for order: ", orderid)
     
     # Validate order exists and belongs to user
     order = _get_order_details(email, orderid)
     if not order:
         print("Couldn't find order by extracted ID or doesn't belong to user: ", orderid)
-        return False
-
-    db.set_order_status(orderid, "return requested")
-    print(orderid, " marked as returned in database.")
-    msg.message_agent({
-        "email": email,
-        "order_id": orderid,
-        "name": db.get_user_first_name(email) or "",
-        "event_type": "return_requested",
-    })
-    return True
\ No newline at end of file
+        return None
+
+    eligibility = eligibility or {}
+    items = [{"sku": r["sku"], "name": r["name"], "qty": r["qty"]}
+             for r in db.list_items_for_orders([orderid]).get(orderid, [])]
+    ret, created = db.create_return(
+        orderid, email, items, reason=reason,
+        eligible=eligibility.get("eligible"),
+        decision_reason=eligibility.get("reason", ""),
+        decided_by=eligibility.get("decided_by", ""),
+        state="approved" if eligibility.get("eligible") else "requested",
+    )
+    print(orderid, f" return {ret['rma_id']} {'opened' if created else 'already open'}.")
+    return {**dict(ret), "created": created}
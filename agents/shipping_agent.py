@@ -1,8 +1,9 @@
 from __future__ import annotations
 import re
-import time
 from typing import TypedDict, Optional, List, Dict, Any, Callable
 import db
+from agents.entity_extractor import first, get_entities
+from agents.tool_runtime import RetryPolicy, ToolRuntime
 
 class AgentState(TypedDict, total=False):
     input: str
@@ -19,10 +20,13 @@ class AgentState(TypedDict, total=False):
     context_refs: Optional[List[str]]
     preface: Optional[str]
     memory: Optional[Dict[str, Any]]
+    entities: Optional[Dict[str, List[str]]]
 
 # ---------- Tool Layer --------------
 Tool = Callable[..., Any]
 
+MAX_ORDERS = 10          # orders covered by one combined answer
+
 TOOL_REGISTRY: Dict[str, Dict[str, Any]] = { #Add more tools as needed
     "orders:list_for_user": {
         "fn": lambda email: db.list_orders_for_user(email),
@@ -30,11 +34,48 @@ TOOL_REGISTRY: Dict[str, Dict[str, Any]] = { #Add more tools as needed
         "desc": "Return orders for a given user email, newest first.",
     },
 
+    "orders:get_latest": {
+        "fn": lambda email: db.get_latest_order(email),
+        "schema": {"email": "str (required)"},
+        "desc": "Return the user's most recent order (one index lookup).",
+    },
+
     "orders:get_by_id": {
         "fn": lambda order_id: db.get_order_by_id(order_id),
         "schema": {"order_id": "str (required)"},
         "desc": "Return details for a specific order by its ID.",
     },
+    "orders:get_for_user": {
+        "fn": lambda email, order_id: db.get_order_for_user(email, order_id),
+        "schema": {"email": "str (required)", "order_id": "str (required)"},
+        "desc": "Return one order by ID, only if it belongs to the user (primary-key lookup).",
+    },
+
+    "orders:get_many": {
+        "fn": lambda order_ids, email=None: db.get_orders_by_ids(order_ids, email=email),
+        "schema": {"order_ids": "list[str] (required)", "email": "str (only this user's orders)"},
+        "desc": "Return several orders by ID in one batched query (order_id -> order).",
+    },
+    "orders:open_for_user": {
+        "fn": lambda email, limit=MAX_ORDERS: db.list_open_orders_for_user(email, limit=limit),
+        "schema": {"email": "str (required)", "limit": "int"},
+        "desc": "Return the user's orders that are not delivered or closed yet, newest first.",
+    },
+    "shipments:latest_many": {
+        "fn": lambda order_ids: db.list_latest_shipment_events(order_ids),
+        "schema": {"order_ids": "list[str] (required)"},
+        "desc": "Return the newest tracking event of several orders in one query (order_id -> event).",
+    },
+    "shipments:latest": {
+        "fn": lambda order_id: db.get_latest_shipment_event(order_id),
+        "schema": {"order_id": "str (required)"},
+        "desc": "Return the newest carrier tracking event for an order (one index lookup).",
+    },
+    "shipments:timeline": {
+        "fn": lambda order_id, limit=20: db.list_shipment_events(order_id, limit=limit),
+        "schema": {"order_id": "str (required)", "limit": "int"},
+        "desc": "Return an order's carrier tracking events, oldest first.",
+    },
 
     "orders:update_address": {
         "fn": lambda order_id, new_address: db.update_order_address(order_id, new_address),
@@ -53,10 +94,23 @@ STATUS_NORMALIZATION = {
     "label created": "Preparing",
     "shipped": "Shipped",
     "delivered": "Delivered",
+    "out for delivery": "Out for Delivery",
     "unknown": "Unknown",
 }
 
-EMAIL_REGEX = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+# shipment_events.code -> status shown to the user (the latest scan wins over orders.status)
+EVENT_STATUS = {
+    "label_created": "Preparing",
+    "picked_up": "Shipped",
+    "departed_facility": "In Transit",
+    "arrived_at_facility": "In Transit",
+    "exception": "Delayed",
+    "out_for_delivery": "Out for Delivery",
+    "delivered": "Delivered",
+}
+
+_TIMELINE_RE = re.compile(r"\b(timeline|history|journey)\b|\ball (scans|updates)\b", re.I)
+TIMELINE_LIMIT = 20
 
 class ShippingAgent:
     """
@@ -71,6 +125,7 @@ class ShippingAgent:
     def __init__(self, max_retries: int = 2, backoff_s: float = 0.4):
         self.max_retries = max_retries
         self.backoff_s = backoff_s
+        self.tools = ToolRuntime(TOOL_REGISTRY, retry=RetryPolicy(max_retries=max_retries, base_s=backoff_s))
 
     # --------- entrypoint ---------
     def run(self, state: AgentState) -> AgentState:
@@ -80,15 +135,28 @@ class ShippingAgent:
         # 1) Perception / memory
         self._extract_email(state)
         # Extract order ID from input
-        order_id = None
-        text = (state.get("input") or "").strip()
-        match = re.search(r"ord_\d{3,7}", text, re.IGNORECASE)
-        if match:
-            order_id = match.group(0)
+        order_id = first(state, "orders")
+        if order_id:
             state["order_id"] = order_id
 
         email = (state.get("email") or "").strip().lower()
 
+        # Several order IDs pasted ("ord_201 and ord_203"): one combined answer
+        order_ids = list(dict.fromkeys(o.lower() for o in get_entities(state).get("orders") or []))
+        if len(order_ids) > 1:
+            return self._run_many(state, order_ids[:MAX_ORDERS], email)
+
+        # No order named: every open order of the user if there is more than one, the open
+        # order if there is exactly one, and the latest order only when none is open
+        if email and not order_id and state["intent"] == "shipping status":
+            open_orders = self.tools.call("orders:open_for_user", {"email": email, "limit": MAX_ORDERS},
+                                          state, max_retries=state.get("max_retries")) or []
+            if len(open_orders) > 1:
+                rows = {r["order_id"]: r for r in open_orders}
+                return self._run_many(state, list(rows), email, rows=rows)
+            if open_orders:
+                order_id = state["order_id"] = open_orders[0]["order_id"]
+
         if not email and not order_id:
             state["output"] = (
                 "To check your shipping status, please provide your order number (for example `ord_001`)."
@@ -102,11 +170,12 @@ class ShippingAgent:
         # 3) Act: execute tools (with retries) and collect observations
         observations = []
         for step in plan:
-            obs = self._call_tool_with_retries(step["tool"], step["args"], state)
+            obs = self.tools.call(step["tool"], step["args"], state, max_retries=state.get("max_retries"))
             observations.append({"step": step, "obs": obs})
 
         # 4) Observe/Reason: turn observations into normalized shipping status
         result = self._interpret(observations, state)
+        self._add_tracking(result, state)
 
         # 5) Communicate
         state["output"] = self._format_user_message(result)
@@ -124,10 +193,9 @@ class ShippingAgent:
     def _extract_email(self, state: AgentState) -> None:
         if state.get("email"):
             return
-        text = (state.get("input") or "").strip()
-        m = EMAIL_REGEX.search(text)
-        if m:
-            state["email"] = m.group(0).lower()
+        email = first(state, "emails")
+        if email:
+            state["email"] = email.lower()
 
 # ----------------- Planning -----------------
     def _plan(self, state: AgentState) -> List[Dict[str, Any]]:
@@ -137,12 +205,18 @@ class ShippingAgent:
         intent = (state.get("intent") or "").lower()
         text = (state.get("input") or "").lower()
 
-        # Prefer order_id for shipping status if present
+        # Prefer order_id for shipping status if present (scoped to the user when logged in)
+        if intent == "shipping status" and order_id and email:
+            return [{"tool": "orders:get_for_user", "args": {"email": email, "order_id": order_id}}]
+
         if intent == "shipping status" and order_id:
             return [{"tool": "orders:get_by_id", "args": {"order_id": order_id}}]
 
         if intent == "shipping status" and email:
-            return [{"tool": "orders:list_for_user", "args": {"email": email}}]
+            return [{"tool": "orders:get_latest", "args": {"email": email}}]
+
+        if intent == "check order" and order_id and email:
+            return [{"tool": "orders:get_for_user", "args": {"email": email, "order_id": order_id}}]
 
         if intent == "check order" and order_id:
             return [{"tool": "orders:get_by_id", "args": {"order_id": order_id}}]
@@ -150,39 +224,8 @@ class ShippingAgent:
         if intent == "update address" and email:
             return [{"tool": "orders:update_address", "args": {"order_id": order_id, "shipping_address": address}}]
 
-    def _call_tool_with_retries(self, tool_name: str, args: Dict[str, Any], state: AgentState):
-        if tool_name not in TOOL_REGISTRY:
-            raise ValueError(f"Unknown tool: {tool_name}")
-        fn: Tool = TOOL_REGISTRY[tool_name]["fn"]
-
-        retries = int(state.get("max_retries", self.max_retries))
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
-                state["tool_calls"].append(f"{tool_name}({', '.join(f'{k}={v!r}' for k,v in args.items())})")
-                result = fn(**args)
-                # Try to coerce iterables of row-like objects to plain dicts for traceability
-                safe_result = self._safe_preview(result)
-                state["tool_results"].append(self._truncate_for_log(safe_result))
-                return result
-            except Exception as e:
-                state["tool_results"].append(f"[ERROR] {tool_name}: {e!r}")
-                if attempt > retries:
-                    raise
-                # basic backoff
-                time.sleep(self.backoff_s * attempt)
-
     # ---------- helper functions ----------
 
-    def _safe_preview(self, value: Any) -> Any:
-        try:
-            if isinstance(value, list):
-                return [self._row_to_dict(r) for r in value[:5]]  # limit preview
-            return value
-        except Exception:
-            return "<unserializable>"
-
     def _row_to_dict(self, row: Any) -> Dict[str, Any]:
         try:
             if isinstance(row, dict):
@@ -191,10 +234,6 @@ class ShippingAgent:
         except Exception:
             return {"_repr": repr(row)}
 
-    def _truncate_for_log(self, obj: Any, limit: int = 300) -> str:
-        s = repr(obj)
-        return s if len(s) <= limit else s[:limit] + "…"
-
     def _interpret(self, observations: List[Dict[str, Any]], state: AgentState) -> Dict[str, Any]:
         """
         Normalize status and pick latest order. Returns a structured dict suitable for UI.
@@ -237,6 +276,81 @@ class ShippingAgent:
             "confidence": confidence,
         }
 
+    def _run_many(self, state: AgentState, order_ids: List[str], email: str,
+                  rows: Optional[Dict[str, Any]] = None) -> AgentState:
+        """
+        Status of several orders: the orders (unless already loaded) and their latest
+        tracking events are each fetched with one batched query, so the number of round
+        trips does not grow with the number of orders.
+        """
+        if rows is None:
+            args: Dict[str, Any] = {"order_ids": order_ids}
+            if email:
+                args["email"] = email
+            rows = self.tools.call("orders:get_many", args, state, max_retries=state.get("max_retries")) or {}
+        events: Dict[str, Any] = {}
+        if rows:
+            try:
+                events = self.tools.call("shipments:latest_many", {"order_ids": list(rows)},
+                                         state, max_retries=state.get("max_retries")) or {}
+            except Exception:
+                pass        # tracking is optional; answer from orders.status
+
+        lines = ["Here is the status of your orders:"]
+        for oid in order_ids:
+            order = rows.get(oid)
+            if order is None:
+                lines.append(f"- **{oid}**: I couldn’t find this order.")
+                continue
+            order = self._row_to_dict(order)
+            raw_status = (order.get("status") or "Unknown").strip().lower()
+            status = STATUS_NORMALIZATION.get(raw_status, raw_status.capitalize())
+            event = events.get(oid)
+            if event is not None:
+                event = self._row_to_dict(event)
+                status = EVENT_STATUS.get(event.get("code"), status)
+                where = f", {event['location']}" if event.get("location") else ""
+                lines.append(f"- **{oid}** is **{status}** — {event.get('description') or event.get('code')}"
+                             f"{where} ({event.get('ts')})")
+            else:
+                placed = f" (placed on {order['created_at']})" if order.get("created_at") else ""
+                lines.append(f"- **{oid}** is **{status}**{placed}")
+
+        state["order_ids"] = order_ids
+        state["output"] = "\n".join(lines)
+        state["confidence"] = 0.9 if len(rows) == len(order_ids) else (0.7 if rows else 0.5)
+        return state
+
+    def _add_tracking(self, result: Dict[str, Any], state: AgentState) -> None:
+        """
+        Carrier scans for the order found, if any have been ingested: the latest event
+        (one index probe), or the whole timeline when the user asks for tracking history.
+        The latest scan replaces the coarse orders.status.
+        """
+        order_id = result.get("order_id")
+        if not order_id:
+            return
+        want_timeline = bool(_TIMELINE_RE.search(state.get("input") or ""))
+        try:
+            if want_timeline:
+                events = self.tools.call("shipments:timeline", {"order_id": order_id, "limit": TIMELINE_LIMIT},
+                                         state, max_retries=state.get("max_retries"))
+                events = [self._row_to_dict(e) for e in events or []]
+            else:
+                latest = self.tools.call("shipments:latest", {"order_id": order_id},
+                                         state, max_retries=state.get("max_retries"))
+                events = [self._row_to_dict(latest)] if latest else []
+        except Exception:
+            return      # tracking is optional; answer from orders.status
+        if not events:
+            return
+        latest = events[-1]
+        result["event"] = latest
+        if want_timeline:
+            result["timeline"] = events
+        result["status"] = EVENT_STATUS.get(latest.get("code"), result["status"])
+        result["confidence"] = max(result.get("confidence", 0.7), 0.9)
+
     def _format_user_message(self, result: Dict[str, Any]) -> str:
         status = result["status"]
         order_id = result.get("order_id")
@@ -259,6 +373,20 @@ class ShippingAgent:
             parts.append(f"Your most recent order is **{status}**.")
         if created_at:
             parts.append(f"(Placed on {created_at}.)")
+
+        event = result.get("event")
+        if event:
+            parts.append(f"Latest update: {event.get('description') or event.get('code')}"
+                         f"{', ' + event['location'] if event.get('location') else ''} ({event.get('ts')}).")
+            if event.get("tracking_number"):
+                parts.append(f"{event.get('carrier')} tracking number: {event['tracking_number']}.")
+        timeline = result.get("timeline")
+        if timeline:
+            lines = [" ".join(parts), "", "Tracking history:"]
+            for e in timeline:
+                where = f" — {e['location']}" if e.get("location") else ""
+                lines.append(f"- {e.get('ts')}: {e.get('description') or e.get('code')}{where}")
+            return "\n".join(lines)
         return " ".join(parts)
 
 # ---------- Backward-compatible function ----------
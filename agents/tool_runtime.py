@@ -0,0 +1,261 @@
+# agents/tool_runtime.py
+"""
+Shared tool execution for the plan-act-observe agents (order, shipping, message).
+
+A tool registry is the dict each agent already has ({name: {"fn", "schema", "desc"}});
+an entry may also set "timeout_s" and "retry" (a RetryPolicy). ToolRuntime.call():
+- rejects unknown tools and bad arguments at once (permanent errors are never retried)
+- runs the tool with a per-tool timeout
+- retries transient errors (timeouts, connection errors, a locked database, HTTP 429/5xx)
+  with capped exponential backoff and full jitter
+- records the call in state["tool_calls"] / state["tool_results"] (plain strings: the
+  state is checkpointed by the supervisor's graph; results are previewed, first rows only)
+- keeps per-tool latency and error metrics (tool_stats())
+ToolRuntime.acall() is the asyncio variant: it awaits coroutine tools, runs plain
+functions in a thread and backs off with asyncio.sleep.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_TIMEOUT_S = float(os.environ.get("TOOL_TIMEOUT_S", "10"))     # <= 0: no timeout
+PREVIEW_ROWS = 5
+PREVIEW_CHARS = 300
+
+
+class ToolError(Exception):
+    """Base class for errors raised by the tool runtime itself."""
+
+
+class UnknownTool(ToolError, ValueError):
+    """The plan named a tool that is not in the registry (permanent)."""
+
+
+class ToolTimeout(ToolError, TimeoutError):
+    """The tool did not return within its timeout (transient)."""
+
+
+# ------------ Retry policy ------------
+def is_transient(exc: BaseException) -> bool:
+    """True for errors worth retrying: timeouts, dropped connections, a busy database, HTTP 429/5xx."""
+    if isinstance(exc, UnknownTool):
+        return False
+    if isinstance(exc, sqlite3.OperationalError):
+        msg = str(exc).lower()
+        return "locked" in msg or "busy" in msg
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = 2
+    base_s: float = 0.4            # first backoff cap; doubles per attempt
+    max_s: float = 4.0
+    retry_timeouts: bool = True    # False for tools that must not run twice (sending a message)
+    classify: Callable[[BaseException], bool] = is_transient
+
+    def should_retry(self, exc: BaseException, attempt: int, max_retries: Optional[int] = None) -> bool:
+        limit = self.max_retries if max_retries is None else max_retries
+        if attempt > limit:
+            return False
+        if isinstance(exc, ToolTimeout) and not self.retry_timeouts:
+            return False
+        return self.classify(exc)
+
+    def delay(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_s, base_s * 2**(attempt-1))]."""
+        return random.uniform(0, min(self.max_s, self.base_s * (2 ** (attempt - 1))))
+
+
+# ------------ Log previews ------------
+def _row_to_dict(row: Any) -> Any:
+    try:
+        return row if isinstance(row, dict) else dict(row)    # e.g. sqlite Row
+    except Exception:
+        return {"_repr": repr(row)}
+
+def preview(value: Any) -> str:
+    """Log text for a tool result: first PREVIEW_ROWS rows, repr truncated to PREVIEW_CHARS."""
+    try:
+        if isinstance(value, list):
+            value = [_row_to_dict(r) for r in value[:PREVIEW_ROWS]]
+        s = repr(value)
+    except Exception:
+        s = "<unserializable>"
+    return s if len(s) <= PREVIEW_CHARS else s[:PREVIEW_CHARS] + "…"
+
+
+# ------------ Metrics ------------
+class ToolMetrics:
+    """Per-tool call counts, errors by kind, retries and rolling latency."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._tools: Dict[str, Dict[str, Any]] = {}
+
+    def _get(self, tool: str) -> Dict[str, Any]:
+        t = self._tools.get(tool)
+        if t is None:
+            t = self._tools[tool] = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "retries": 0,
+                                     "permanent": 0, "samples": deque(maxlen=self._window)}
+        return t
+
+    def record(self, tool: str, latency_s: float, error: Optional[BaseException] = None,
+               retried: bool = False) -> None:
+        with self._lock:
+            t = self._get(tool)
+            t["calls"] += 1
+            t["samples"].append(latency_s)
+            if error is None:
+                t["ok"] += 1
+                return
+            t["errors"] += 1
+            t["timeouts"] += int(isinstance(error, ToolTimeout))
+            t["retries"] += int(retried)
+            t["permanent"] += int(not is_transient(error))
+
+    @staticmethod
+    def _pct(ordered: List[float], p: float) -> float:
+        if not ordered:
+            return 0.0
+        return round(ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))], 4)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for tool, t in self._tools.items():
+                ordered = sorted(t["samples"])
+                out[tool] = {k: v for k, v in t.items() if k != "samples"}
+                out[tool].update(
+                    error_rate=round(t["errors"] / t["calls"], 3) if t["calls"] else 0.0,
+                    p50_s=self._pct(ordered, 0.50), p95_s=self._pct(ordered, 0.95),
+                )
+            return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tools.clear()
+
+
+METRICS = ToolMetrics()
+
+# Threads for timed calls. A call that times out keeps running until the tool returns
+# (Python threads cannot be cancelled); its result is dropped.
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool")
+
+
+# ------------ Runtime ------------
+class ToolRuntime:
+    def __init__(self, registry: Dict[str, Dict[str, Any]], *, retry: Optional[RetryPolicy] = None,
+                 timeout_s: float = DEFAULT_TIMEOUT_S, metrics: Optional[ToolMetrics] = None):
+        self.registry = registry
+        self.retry = retry or RetryPolicy()
+        self.timeout_s = timeout_s
+        self.metrics = metrics or METRICS
+
+    # --- shared bookkeeping ---
+    def _resolve(self, tool_name: str, args: Dict[str, Any]):
+        spec = self.registry.get(tool_name)
+        if spec is None:
+            raise UnknownTool(f"Unknown tool: {tool_name}")
+        fn = spec["fn"]
+        try:
+            inspect.signature(fn).bind(**args)
+        except TypeError as e:
+            raise TypeError(f"{tool_name}: bad arguments ({e})") from None
+        except ValueError:
+            pass    # builtins without a signature: let the call decide
+        timeout = spec.get("timeout_s", self.timeout_s)
+        return fn, (timeout if timeout and timeout > 0 else None), spec.get("retry") or self.retry
+
+    @staticmethod
+    def _log_call(state: Optional[Dict[str, Any]], tool_name: str, args: Dict[str, Any]) -> None:
+        if state is not None:
+            state.setdefault("tool_calls", []).append(
+                f"{tool_name}({', '.join(f'{k}={v!r}' for k, v in args.items())})")
+
+    def _after(self, state: Optional[Dict[str, Any]], tool_name: str, start: float, policy: RetryPolicy,
+               attempt: int, max_retries: Optional[int], result: Any = None,
+               error: Optional[BaseException] = None) -> bool:
+        """Record one attempt; True if it failed and should be retried."""
+        retry = error is not None and policy.should_retry(error, attempt, max_retries)
+        self.metrics.record(tool_name, time.monotonic() - start, error, retried=retry)
+        if state is not None:
+            results = state.setdefault("tool_results", [])
+            if error is None:
+                results.append(preview(result))
+            else:
+                results.append(f"[ERROR] {tool_name}: {error!r}")
+        return retry
+
+    # --- sync ---
+    def call(self, tool_name: str, args: Dict[str, Any], state: Optional[Dict[str, Any]] = None,
+             *, max_retries: Optional[int] = None) -> Any:
+        """Run a registered tool with timeout and retries; raises the last error if it never succeeds."""
+        fn, timeout, policy = self._resolve(tool_name, args)
+        attempt = 0
+        while True:
+            attempt += 1
+            self._log_call(state, tool_name, args)
+            start = time.monotonic()
+            try:
+                if timeout is None:
+                    result = fn(**args)
+                else:
+                    try:
+                        # copied context: the tool sees the caller's turn cache (agents/turn_cache.py)
+                        ctx = contextvars.copy_context()
+                        result = _EXECUTOR.submit(ctx.run, fn, **args).result(timeout=timeout)
+                    except FutureTimeout:
+                        raise ToolTimeout(f"{tool_name} did not return within {timeout:.1f}s") from None
+            except Exception as e:
+                if not self._after(state, tool_name, start, policy, attempt, max_retries, error=e):
+                    raise
+                time.sleep(policy.delay(attempt))
+                continue
+            self._after(state, tool_name, start, policy, attempt, max_retries, result=result)
+            return result
+
+    # --- async ---
+    async def acall(self, tool_name: str, args: Dict[str, Any], state: Optional[Dict[str, Any]] = None,
+                    *, max_retries: Optional[int] = None) -> Any:
+        """asyncio variant of call(): coroutine tools are awaited, others run in a thread."""
+        fn, timeout, policy = self._resolve(tool_name, args)
+        attempt = 0
+        while True:
+            attempt += 1
+            self._log_call(state, tool_name, args)
+            start = time.monotonic()
+            try:
+                coro = fn(**args) if inspect.iscoroutinefunction(fn) else asyncio.to_thread(fn, **args)
+                try:
+                    result = await asyncio.wait_for(coro, timeout)
+                except asyncio.TimeoutError:
+                    raise ToolTimeout(f"{tool_name} did not return within {timeout:.1f}s") from None
+            except Exception as e:
+                if not self._after(state, tool_name, start, policy, attempt, max_retries, error=e):
+                    raise
+                await asyncio.sleep(policy.delay(attempt))
+                continue
+            self._after(state, tool_name, start, policy, attempt, max_retries, result=result)
+            return result
+
+
+def tool_stats() -> Dict[str, Dict[str, Any]]:
+    return METRICS.stats()
@@ -0,0 +1,200 @@
+# agents/turn_cache.py
+"""
+Request-scoped memoization of DB reads.
+
+One user turn (a graph run, see supervisor.ask_agent_events) often reads the same
+rows several times: the supervisor's memory pass and the agents both load the
+conversation, order tools re-read an order, account_agent re-reads the user. Inside
+`with turn():` every db function decorated with @reads is memoized by
+(function name, arguments); outside a turn the decorators do nothing.
+
+Invalidation is by tag. A read declares the tags it depends on as templates over its
+arguments ("user:{email}"), and optionally over each returned row
+(rows="order:{order_id}"); a @writes function names the tags it changes and drops
+exactly the cached reads that carry one of them. Tags are lowercased, so an email
+written in another case still matches.
+
+The cache is held in a ContextVar: graph nodes and ToolRuntime threads run in a copy
+of the caller's context and share the same TurnCache. Counts (hits = redundant
+queries eliminated) are printed as [TURN_CACHE] and returned by TurnCache.summary().
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+_CURRENT: ContextVar[Optional["TurnCache"]] = ContextVar("turn_cache", default=None)
+
+
+class TurnCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, Any] = {}
+        self._tags: Dict[Tuple, Set[str]] = {}          # cache key -> tags it depends on
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0                          # cached reads dropped by writes
+        self.redundant: Dict[str, int] = {}             # function name -> hits
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                self.redundant[key[0]] = self.redundant.get(key[0], 0) + 1
+                return True, self._values[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Tuple, value: Any, tags: Set[str]) -> None:
+        with self._lock:
+            self._values[key] = value
+            self._tags[key] = tags
+
+    def invalidate(self, tags: Set[str]) -> int:
+        with self._lock:
+            stale = [k for k, t in self._tags.items() if t & tags]
+            for k in stale:
+                del self._values[k], self._tags[k]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._values)
+            self._values.clear()
+            self._tags.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"reads": self.hits + self.misses, "queries": self.misses, "hits": self.hits,
+                    "invalidations": self.invalidations, "redundant": dict(self.redundant)}
+
+
+def current() -> Optional[TurnCache]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def turn(label: str = "") -> Iterator[TurnCache]:
+    """Scope a fresh TurnCache to the enclosed block (one user turn)."""
+    cache = TurnCache()
+    token = _CURRENT.set(cache)
+    try:
+        yield cache
+    finally:
+        try:
+            _CURRENT.reset(token)
+        except ValueError:              # closed from another context (abandoned generator)
+            _CURRENT.set(None)
+        s = cache.summary()
+        if s["reads"]:
+            print(f"[TURN_CACHE] {label + ': ' if label else ''}{s['reads']} reads, {s['queries']} queries, "
+                  f"{s['hits']} redundant eliminated {s['redundant'] or ''}, {s['invalidations']} invalidated")
+
+
+def invalidate_all() -> None:
+    """Drop everything cached this turn (after a write no @writes tag describes)."""
+    cache = _CURRENT.get()
+    if cache is not None:
+        cache.clear()
+
+
+# ------------ Decorators ------------
+def _bind(fn: Callable, sig: inspect.Signature, args: tuple, kwargs: dict) -> Optional[Dict[str, Any]]:
+    try:
+        bound = sig.bind(*args, **kwargs)
+    except TypeError:
+        return None                     # let the real call raise
+    bound.apply_defaults()
+    return bound.arguments
+
+def _tags(templates: Tuple[str, ...], values: Dict[str, Any]) -> Set[str]:
+    out = set()
+    for t in templates:
+        try:
+            out.add(t.format(**values).lower())
+        except (KeyError, IndexError, AttributeError):
+            pass
+    return out
+
+def _row_tags(template: Optional[str], result: Any) -> Set[str]:
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]              # (rows, cursor)
+    if not template or result is None:
+        return set()
+    rows = result if isinstance(result, list) else [result]
+    out = set()
+    for r in rows:
+        try:
+            out |= _tags((template,), dict(r))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], list):
+        return (list(value[0]), *value[1:])
+    return value
+
+
+def reads(*tags: str, rows: Optional[str] = None) -> Callable:
+    """
+    Memoize the decorated function within a turn. `tags` are templates over its
+    arguments; `rows` is a template over each returned row (the single row returned, or
+    the rows of a (rows, cursor) page). Lists are copied on the way out so callers cannot
+    change the cached value.
+    """
+    def deco(fn: Callable) -> Callable:
+        sig = inspect.signature(fn)
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = _CURRENT.get()
+            if cache is None:
+                return fn(*args, **kwargs)
+            values = _bind(fn, sig, args, kwargs)
+            key = (name, tuple(values.items())) if values is not None else None
+            try:
+                hash(key)
+            except TypeError:
+                key = None
+            if key is None:
+                return fn(*args, **kwargs)
+            found, value = cache.get(key)
+            if not found:
+                value = fn(*args, **kwargs)
+                cache.put(key, value, _tags(tags, values) | _row_tags(rows, value))
+            return _copy(value)
+
+        return wrapper
+    return deco
+
+
+def writes(*tags: str) -> Callable:
+    """Invalidate cached reads carrying any of `tags` (templates over the arguments) after the call."""
+    def deco(fn: Callable) -> Callable:
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cache = _CURRENT.get()
+                if cache is not None:
+                    values = _bind(fn, sig, args, kwargs)
+                    if values is None:
+                        cache.clear()
+                    else:
+                        cache.invalidate(_tags(tags, values))
+
+        return wrapper
+    return deco
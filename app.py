@@ -9,6 +9,7 @@ import base64
 from pathlib import Path
 from datetime import datetime
 from agents.general_agent import summarize_conversation
+from agents.conversation_compactor import maybe_compact
 from agents import message_agent as msg
 
 
@@ -218,6 +219,15 @@ if not st.session_state.user_email:
 
 # ------- Chat History Functions -------
 
+def _save_conversation():
+    """Persist the session's messages (only the hot, uncompacted part is written), then compact if due."""
+    cid = st.session_state.conversation_id
+    db.save_conversation_messages(cid, st.session_state.user_email, st.session_state.messages)
+    try:
+        maybe_compact(cid)
+    except Exception as e:
+        print(f"[COMPACT] failed for {cid}: {e}")
+
 def _parse_conversation_text(raw: str):
     """
     Accepts either the JSON we save (list[{"role","content"}]) or a plain text seed like:
@@ -268,7 +278,7 @@ if st.session_state.get("page") == "history":
         with st.spinner("Loading chat history..."):
             email = st.session_state.get("user_email")
             rows = db.list_conversations_for_user(email) if email else []
-            prepared = []  # (header, started_at, messages)
+            prepared = []  # (header, started_at, earlier, messages)
 
             for row in rows or []:
                 r = dict(row)
@@ -276,7 +286,11 @@ if st.session_state.get("page") == "history":
                 started_at = r.get("started_at") or ""
                 header = summarize_conversation(conv_id)  # fast model; cached if you like
                 messages = _parse_conversation_text(r.get("conversation_text") or "")
-                prepared.append((header, started_at, messages))
+                # compacted conversations keep only recent turns; older ones are summarized
+                earlier = ""
+                if r.get("compacted_count"):
+                    earlier = f"_{r['compacted_count']} earlier messages, summarized:_\n\n{r.get('rolling_summary') or ''}"
+                prepared.append((header, started_at, earlier, messages))
 
     
     ph.empty()
@@ -291,9 +305,11 @@ if st.session_state.get("page") == "history":
             st.session_state.page = "chat"
             st.rerun()
     else:
-        for header, started_at, messages in prepared:
+        for header, started_at, earlier, messages in prepared:
             title = header + (f" — {started_at}" if started_at else "")
             with st.expander(title, expanded=False):
+                if earlier:
+                    st.markdown(earlier)
                 if not messages:
                     st.write("_(empty conversation)_")
                 else:
@@ -670,11 +686,7 @@ def send_message_to_agent(prompt: str):
                 st.session_state.messages.append({"role": "assistant", "content": text})
                 final_reply = text
 
-    db.add_conversation(
-        conversation_id=st.session_state.conversation_id,
-        email=st.session_state.user_email,
-        conversation_text=json.dumps(st.session_state.messages)
-    )
+    _save_conversation()
 
     st.rerun()
 
@@ -716,11 +728,7 @@ def handle_option(option, from_chat=False): ####Modified to handle quick option
                 st.session_state.messages.append({"role": "assistant", "content": text})
                 final_reply = text
 
-    db.add_conversation(
-        conversation_id=st.session_state.conversation_id,
-        email=st.session_state.user_email,
-        conversation_text=json.dumps(st.session_state.messages)
-    )
+    _save_conversation()
     st.rerun()
     return final_reply
 
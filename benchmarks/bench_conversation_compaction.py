@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Bytes read per turn as a conversation grows, with and without rolling compaction.
+
+Each turn appends a user + assistant message and saves the session's full list the way
+app.py does (db.save_conversation_messages, then conversation_compactor.maybe_compact).
+Per turn it then reads what the consumers read:
+
+  full     - the stored conversation_text (summaries, history page, a cold memory index)
+  tail     - memory_agent's incremental read of the blob (from the last indexed element)
+
+Uses a throwaway SQLite file.
+
+    python benchmarks/bench_conversation_compaction.py
+    python benchmarks/bench_conversation_compaction.py --turns 2000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db                                            # noqa: E402
+from agents import conversation_compactor as comp    # noqa: E402
+from agents import memory_agent as mem               # noqa: E402
+from benchmarks.bench_memory_retrieval import conversation   # noqa: E402
+
+
+def run(turns: int, compact: bool, report: list[int]) -> dict[int, tuple[float, float, float]]:
+    comp.COMPACT_AFTER = 40 if compact else 10 ** 9
+    mem.reset_index()
+    cid = f"bench-{'on' if compact else 'off'}"
+    msgs: list[dict] = []
+    rng = random.Random(3)
+    out = {}
+    for t in range(1, turns + 1):
+        msgs += conversation(2, rng)
+        t0 = time.perf_counter()
+        db.save_conversation_messages(cid, "demo@example.com", msgs)
+        comp.maybe_compact(cid)
+        save_ms = (time.perf_counter() - t0) * 1000
+
+        idx = mem.get_index(cid)
+        got = db.get_conversation_tail(cid, idx.last_start or 0)
+        full = db.get_compacted_conversation(cid)["conversation_text"]
+        if t in report:
+            out[t] = (len(full) / 1024, len(got["tail"] or "") / 1024, save_ms)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=1000)
+    args = ap.parse_args()
+    report = sorted({t for t in (10, 50, 100, 250, 500, 1000, 2000, 5000) if t <= args.turns} | {args.turns})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        off = run(args.turns, compact=False, report=report)
+        on = run(args.turns, compact=True, report=report)
+
+    print(f"{'turns':>6} | {'full KiB':>9}{'tail KiB':>9}{'save ms':>9} | {'full KiB':>9}{'tail KiB':>9}{'save ms':>9}")
+    print(f"{'':>6} | {'no compaction':^27} | {'compaction (40 / keep 20)':^27}")
+    for t in report:
+        a, b = off[t], on[t]
+        print(f"{t:>6} | {a[0]:>9.1f}{a[1]:>9.2f}{a[2]:>9.2f} | {b[0]:>9.1f}{b[1]:>9.2f}{b[2]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Per-turn memory_agent cost on long conversations: full rebuild vs incremental index.
+
+Seeds a throwaway SQLite DB with an N-message conversation, then simulates turns
+that append one user + one assistant message and runs memory_agent after each.
+
+  full rebuild  - json.loads the whole blob and index every message (what running
+                  entity sets cost without incrementality)
+  last-20       - the previous memory_agent: json.loads the whole blob, index last 20
+  incremental   - memory_agent.get_index: read from the last indexed element onwards,
+                  index only the appended messages
+
+    python benchmarks/bench_memory_index.py
+    python benchmarks/bench_memory_index.py --messages 5000 --turns 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db                                   # noqa: E402
+from agents import memory_agent as mem      # noqa: E402
+
+SAMPLES = [
+    ("user", "Hi, where is my order ORD_{n}? I paid with PAY_{n} on 2025-10-{d:02d}."),
+    ("assistant", "Order ORD_{n} shipped yesterday; tracking shows it arrives in 2 days."),
+    ("user", "Can I change the shipping address to 12 Oak St, Austin, TX 78701?"),
+    ("assistant", "Sure, I updated the address for ORD_{n}. Anything else?"),
+    ("user", "What is the return policy for opened items?"),
+    ("assistant", "Opened items can be returned within 30 days for store credit."),
+]
+
+
+def message(i: int) -> dict:
+    role, text = SAMPLES[i % len(SAMPLES)]
+    return {"role": role, "content": text.format(n=1000 + i // 6, d=1 + i % 28)}
+
+
+def legacy_last20(conversation_id: str) -> None:
+    msgs = json.loads(db.get_conversation(conversation_id))
+    mem._build_index(msgs[-20:])
+
+
+def full_rebuild(conversation_id: str) -> None:
+    msgs = json.loads(db.get_conversation(conversation_id))
+    mem._build_index(msgs)
+
+
+def incremental(conversation_id: str) -> None:
+    mem.memory_agent({"conversation_id": conversation_id})
+
+
+def run(strategy, n_messages: int, turns: int) -> list[float]:
+    msgs = [message(i) for i in range(n_messages)]
+    db.add_conversation("bench", "demo@example.com", json.dumps(msgs))
+    mem.reset_index()
+    strategy("bench")            # warm: first load is a full parse for every strategy
+    timings = []
+    for t in range(turns):
+        msgs += [message(n_messages + 2 * t), message(n_messages + 2 * t + 1)]
+        db.add_conversation("bench", "demo@example.com", json.dumps(msgs))
+        t0 = time.perf_counter()
+        strategy("bench")
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=1000)
+    ap.add_argument("--turns", type=int, default=30)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        print(f"\nmemory_agent per-turn cost, {args.messages}-message conversation, {args.turns} turns")
+        print(f"{'strategy':16}{'mean ms':>10}{'p95 ms':>10}")
+        for name, fn in (("full rebuild", full_rebuild), ("last-20", legacy_last20), ("incremental", incremental)):
+            ms = sorted(run(fn, args.messages, args.turns))
+            print(f"{name:16}{statistics.mean(ms):>10.2f}{ms[int(0.95 * (len(ms) - 1))]:>10.2f}")
+        print(f"index stats: {mem.index_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+memory_agent link retrieval: legacy 20-message window vs BM25 over the whole conversation.
+
+Builds synthetic support conversations (varied vocabulary, order/payment IDs, dates)
+of increasing length. Each query asks about an order mentioned 30 messages earlier,
+outside the old window (every query appends 31 messages, so conversations end
+slightly longer than --sizes). Reports query latency and whether the earlier mention
+was linked (recall@5).
+
+    python benchmarks/bench_memory_retrieval.py
+    python benchmarks/bench_memory_retrieval.py --sizes 1000 5000 20000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents import memory_agent as mem      # noqa: E402
+
+TOPICS = [
+    "refund", "exchange", "warranty", "tracking", "carrier", "label", "charger", "keyboard",
+    "mouse", "monitor", "invoice", "coupon", "discount", "address", "delivery", "damaged",
+    "missing", "replacement", "subscription", "gift", "wrapping", "battery", "cable", "headset",
+]
+FOLLOW_UPS = [
+    "any news on {order}? still waiting on the refund",
+    "what happened with {order}",
+    "is {order} going to arrive this week?",
+    "I never got an update about {order}, can you look again",
+]
+TEMPLATES = [
+    "Can you check {topic} for {order}? It was placed on {date}.",
+    "The {topic} on my {topic2} looks wrong, I paid with {pay}.",
+    "Thanks, I will wait for the {topic} update.",
+    "Your {topic} request for {order} is being processed and the {topic2} team will follow up.",
+    "I also have a question about {topic2} and {topic}.",
+    "We have noted the {topic} issue; a {topic2} specialist will email you.",
+]
+
+
+def conversation(n: int, rng: random.Random) -> list[dict]:
+    # add a long tail of rarer words so the vocabulary grows with the conversation
+    vocab = TOPICS + [f"w{i}" for i in range(max(50, n // 4))]
+    msgs = []
+    for i in range(n):
+        t = rng.choice(TEMPLATES)
+        text = t.format(
+            topic=rng.choice(vocab), topic2=rng.choice(vocab),
+            order=f"ORD_{rng.randint(1000, 1000 + n)}", pay=f"PAY_{rng.randint(1000, 9999)}",
+            date=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        )
+        msgs.append({"role": "user" if i % 2 == 0 else "assistant", "content": text})
+    return msgs
+
+
+def run(n: int, queries: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    idx = mem.ConversationIndex()
+    idx.append(conversation(n, rng))
+
+    legacy_ms, bm25_ms, legacy_hits, bm25_hits = [], [], 0, 0
+    for q in range(queries):
+        # mention an order, 29 unrelated messages, then ask about it again
+        order = f"ORD_{90000 + q}"
+        target = len(idx.msgs)
+        idx.append([{"role": "user", "content": f"My {rng.choice(TOPICS)} order is {order}."}])
+        idx.append(conversation(29, rng))
+        idx.append([{"role": "user", "content": rng.choice(FOLLOW_UPS).format(order=order)}])
+
+        t0 = time.perf_counter()
+        legacy = mem._topk_links(idx.msgs[-mem.LINK_WINDOW:], k=5)
+        legacy_ms.append((time.perf_counter() - t0) * 1000)
+        legacy_hits += any(m.idx == target for m in legacy)
+
+        t0 = time.perf_counter()
+        found = idx.search(k=5)
+        bm25_ms.append((time.perf_counter() - t0) * 1000)
+        bm25_hits += any(m.idx == target for m, _ in found)
+
+    def p95(xs):
+        return sorted(xs)[int(0.95 * (len(xs) - 1))]
+
+    return {
+        "legacy_ms": statistics.mean(legacy_ms), "legacy_p95": p95(legacy_ms), "legacy_recall": legacy_hits / queries,
+        "bm25_ms": statistics.mean(bm25_ms), "bm25_p95": p95(bm25_ms), "bm25_recall": bm25_hits / queries,
+        "terms": len(idx.postings), "final": len(idx.msgs),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 10000])
+    ap.add_argument("--queries", type=int, default=50)
+    args = ap.parse_args()
+
+    print(f"{'messages':>9}{'terms':>8} | {'window ms':>10}{'p95':>8}{'recall@5':>10} | {'bm25 ms':>9}{'p95':>8}{'recall@5':>10}")
+    for n in args.sizes:
+        r = run(n, args.queries)
+        print(f"{r['final']:>9}{r['terms']:>8} | {r['legacy_ms']:>10.3f}{r['legacy_p95']:>8.3f}{r['legacy_recall']:>10.2f}"
+              f" | {r['bm25_ms']:>9.3f}{r['bm25_p95']:>8.3f}{r['bm25_recall']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Crossover between the set-based _score loop and the numpy hashed-vector scorer.
+
+For each conversation size, times one top-5 link query against the newest message:
+
+  overlap  - memory_agent._topk_links: _score per message (set intersections), full sort
+  vector   - memory_vectors.HashedVectors: one sparse mat-vec + argpartition
+  bm25     - ConversationIndex.search (the default scorer), for reference
+
+The vector matrix is built incrementally in production, so build time is reported
+separately and not included in the query time.
+
+    pip install numpy
+    python benchmarks/bench_memory_vectors.py
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents import memory_agent as mem      # noqa: E402
+from agents import memory_vectors            # noqa: E402
+from benchmarks.bench_memory_retrieval import conversation   # noqa: E402
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(runs)
+
+
+def main() -> None:
+    if not memory_vectors.HAS_NUMPY:
+        sys.exit("numpy is not installed (pip install numpy)")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+",
+                    default=[5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000])
+    ap.add_argument("--repeat", type=int, default=30)
+    args = ap.parse_args()
+
+    print(f"{'messages':>9}{'overlap us':>12}{'vector us':>11}{'bm25 us':>10}{'build ms':>10}  faster")
+    crossover = None
+    for n in args.sizes:
+        idx = mem.ConversationIndex()
+        idx.append(conversation(n, random.Random(n)))
+        t0 = time.perf_counter()
+        idx.vector_search(k=5)                      # builds the matrix once
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        overlap = timed(lambda: mem._topk_links(idx.msgs, k=5), args.repeat)
+        vector = timed(lambda: idx.vector_search(k=5), args.repeat)
+        bm25 = timed(lambda: idx.search(k=5), args.repeat)
+        faster = "vector" if vector < overlap else "overlap"
+        if crossover is None and vector < overlap:
+            crossover = n
+        print(f"{n:>9}{overlap:>12.1f}{vector:>11.1f}{bm25:>10.1f}{build_ms:>10.2f}  {faster}")
+    print(f"\nvector scoring beats the set loop from ~{crossover} messages" if crossover
+          else "\nvector scoring never beat the set loop in this range")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Compare general_agent latency and cost with and without adaptive model selection.
+
+By default the models are simulated from published per-token prices and typical
+latencies (no API calls), so the numbers show the *shape* of the saving.
+Pass --live to time real Gemini calls instead (needs GOOGLE_API_KEY).
+
+    python benchmarks/bench_model_selection.py
+    python benchmarks/bench_model_selection.py --live
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents import model_selector                      # noqa: E402
+from agents.prompt_builder import estimate_tokens      # noqa: E402
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "primary": (0.30, 2.50),   # gemini-2.5-flash
+    "fast": (0.10, 0.40),      # gemini-2.5-flash-lite
+}
+# modeled latency: fixed overhead + per output token (seconds)
+LATENCY = {
+    "primary": (0.90, 0.006),
+    "fast": (0.35, 0.002),
+}
+
+TURNS = [
+    ("Hi!", 0.0, 30),
+    ("hello there", 0.0, 30),
+    ("thanks", 0.0, 20),
+    ("ok great, thank you", 0.0, 20),
+    ("bye", 0.0, 15),
+    ("what are your hours?", 0.6, 60),
+    ("do you ship to Canada?", 0.6, 80),
+    ("yes", 0.0, 20),
+    ("Can you explain the difference between store credit and a refund to my card?", 0.6, 180),
+    ("My order ORD_1042 arrived damaged and the replacement ORD_1043 never shipped, what now?", 0.6, 220),
+    ("I was charged twice for PAY_2211 on 2025-10-01, and my address 12 Oak St, Austin, TX 78701 is wrong too", 0.6, 220),
+    ("why does my account say my email is wrong and also my payment failed?", 0.6, 200),
+    ("cool", 0.0, 15),
+    ("good morning", 0.0, 25),
+    ("what products do you sell", 0.6, 150),
+]
+
+
+def simulate(tier: str, prompt_tokens: int, out_tokens: int) -> tuple[float, float]:
+    base, per_tok = LATENCY[tier]
+    p_in, p_out = PRICES[tier]
+    latency = base + per_tok * out_tokens
+    cost = (prompt_tokens * p_in + out_tokens * p_out) / 1_000_000
+    return latency, cost
+
+
+def run(adaptive: bool, live: bool) -> dict:
+    latencies, costs, tiers = [], [], {"fast": 0, "primary": 0}
+    select_us = []
+    if live:
+        from agents.general_agent import model, model_fast, _build_prompt
+    for text, conf, out_tokens in TURNS:
+        state = {"input": text, "intent_confidence": conf}
+        t0 = time.perf_counter()
+        if adaptive:
+            score, _ = model_selector.estimate_complexity(text, intent_confidence=conf)
+            tier = "fast" if score <= model_selector.FAST_MAX_SCORE else "primary"
+        else:
+            tier = "primary"
+        select_us.append((time.perf_counter() - t0) * 1e6)
+        tiers[tier] += 1
+
+        if live:
+            prompt = _build_prompt(state).text
+            chosen = model_fast if tier == "fast" else model
+            t1 = time.perf_counter()
+            resp = chosen.invoke(prompt)
+            latencies.append(time.perf_counter() - t1)
+            out = estimate_tokens(getattr(resp, "content", "") or "")
+            p_in, p_out = PRICES[tier]
+            costs.append((estimate_tokens(prompt) * p_in + out * p_out) / 1_000_000)
+        else:
+            prompt_tokens = 120 + estimate_tokens(text)   # system prompt + message
+            lat, cost = simulate(tier, prompt_tokens, out_tokens)
+            latencies.append(lat)
+            costs.append(cost)
+
+    return {
+        "tiers": tiers,
+        "mean_latency_s": statistics.mean(latencies),
+        "p95_latency_s": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "cost_usd_per_1k_turns": sum(costs) / len(costs) * 1000,
+        "selector_overhead_us": statistics.mean(select_us),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--live", action="store_true", help="time real Gemini calls")
+    args = ap.parse_args()
+
+    base = run(adaptive=False, live=args.live)
+    adaptive = run(adaptive=True, live=args.live)
+    mode = "live" if args.live else "simulated"
+    print(f"general_agent model selection ({mode}, {len(TURNS)} turns)")
+    print(f"{'':22}{'always primary':>16}{'adaptive':>12}")
+    print(f"{'fast / primary turns':22}{base['tiers']['fast']:>7} / {base['tiers']['primary']:<6}"
+          f"{adaptive['tiers']['fast']:>5} / {adaptive['tiers']['primary']:<4}")
+    print(f"{'mean latency (s)':22}{base['mean_latency_s']:>16.3f}{adaptive['mean_latency_s']:>12.3f}")
+    print(f"{'p95 latency (s)':22}{base['p95_latency_s']:>16.3f}{adaptive['p95_latency_s']:>12.3f}")
+    print(f"{'cost / 1k turns ($)':22}{base['cost_usd_per_1k_turns']:>16.4f}{adaptive['cost_usd_per_1k_turns']:>12.4f}")
+    print(f"{'selector overhead (us)':22}{'-':>16}{adaptive['selector_overhead_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
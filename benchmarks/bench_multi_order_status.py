@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Status of several orders at once: one lookup per order vs batched IN queries.
+
+Seeds a throwaway SQLite file with one user owning --orders orders, each with a carrier
+scan history from carrier_sim, then times answering "where are my orders" for k of them:
+
+  per-order - db.get_order_for_user + db.get_latest_shipment_event for each order
+              (two round trips per order)
+  batched   - db.get_orders_by_ids + db.list_latest_shipment_events (what
+              ShippingAgent._run_many does: two round trips for any k)
+
+    python benchmarks/bench_multi_order_status.py
+    python benchmarks/bench_multi_order_status.py --orders 20000 --k 1 5 20 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import carrier_sim  # noqa: E402
+import db           # noqa: E402
+
+EMAIL = "bulk.buyer@example.com"
+
+
+def per_order(ids):
+    out = {}
+    for oid in ids:
+        order = db.get_order_for_user(EMAIL, oid)
+        if order:
+            out[oid] = (order, db.get_latest_shipment_event(oid))
+    return out
+
+
+def batched(ids):
+    orders = db.get_orders_by_ids(ids, email=EMAIL)
+    events = db.list_latest_shipment_events(list(orders))
+    return {oid: (o, events.get(oid)) for oid, o in orders.items()}
+
+
+def seed(n: int) -> None:
+    ids = [f"ord_m{i:06d}" for i in range(n)]
+    with closing(db.get_connection()) as conn:
+        conn.execute("INSERT INTO users (email) VALUES (?)", (EMAIL,))
+        conn.executemany(
+            "INSERT INTO orders (order_id, email, status, created_at) VALUES (?, ?, 'shipped', ?)",
+            [(oid, EMAIL, f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00") for i, oid in enumerate(ids)],
+        )
+        conn.commit()
+    shipments = [carrier_sim.Shipment(oid, f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00", "Austin, TX")
+                 for i, oid in enumerate(ids)]
+    db.ingest_shipment_events(carrier_sim.poll(shipments, None, "2026-01-01 00:00:00"))
+
+
+def timed(fn, batches) -> float:
+    out = []
+    for ids in batches:
+        t0 = time.perf_counter()
+        assert len(fn(ids)) == len(ids)
+        out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=5_000)
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 2, 5, 10, 25, 50])
+    ap.add_argument("--reps", type=int, default=20)
+    args = ap.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        seed(args.orders)
+        print(f"{args.orders} orders with tracking scans for one user; median of {args.reps} answers")
+        print(f"  {'orders':>6}  {'per-order ms':>12}  {'batched ms':>10}")
+        for k in args.k:
+            batches = [[f"ord_m{i:06d}" for i in rng.sample(range(args.orders), k)] for _ in range(args.reps)]
+            print(f"  {k:>6}  {timed(per_order, batches):>12.2f}  {timed(batched, batches):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
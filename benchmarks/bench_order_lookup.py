@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Order lookup for one high-volume customer: list-and-scan vs keyed point query.
+
+Seeds a throwaway SQLite file with one user owning --orders orders (default 50k), then
+times looking up orders spread across the list:
+
+  scan   - the old return_agent._get_order_details: db.list_orders_for_user(email),
+           dict() every row until the order_id matches
+  keyed  - db.get_order_for_user(email, order_id): primary-key lookup + owner check
+
+    python benchmarks/bench_order_lookup.py
+    python benchmarks/bench_order_lookup.py --orders 200000 --lookups 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db      # noqa: E402
+
+EMAIL = "bulk.buyer@example.com"
+
+
+def scan(email: str, order_id: str):
+    for order in db.list_orders_for_user(email):
+        order_dict = dict(order)
+        if order_dict["order_id"] == order_id:
+            return order_dict
+    return None
+
+
+def keyed(email: str, order_id: str):
+    order = db.get_order_for_user(email, order_id)
+    return dict(order) if order else None
+
+
+def seed(n: int) -> None:
+    with closing(db.get_connection()) as conn:
+        conn.execute("INSERT INTO users (email) VALUES (?)", (EMAIL,))
+        conn.executemany(
+            "INSERT INTO orders (order_id, email, status, total_cents, created_at) VALUES (?, ?, 'delivered', ?, ?)",
+            [(f"ord_b{i:06d}", EMAIL, 1000 + i % 5000,
+              f"20{20 + i * 5 // n:02d}-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00") for i in range(n)],
+        )
+        conn.commit()
+
+
+def timed(fn, ids) -> list[float]:
+    out = []
+    for oid in ids:
+        t0 = time.perf_counter()
+        assert fn(EMAIL, oid) is not None
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=50_000)
+    ap.add_argument("--lookups", type=int, default=20)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        seed(args.orders)
+        ids = [f"ord_b{i:06d}" for i in random.Random(1).sample(range(args.orders), args.lookups)]
+        s, k = timed(scan, ids), timed(keyed, ids)
+
+    print(f"{args.orders} orders for one user, {args.lookups} lookups")
+    print(f"  scan   median {statistics.median(s):9.2f} ms   max {max(s):9.2f} ms")
+    print(f"  keyed  median {statistics.median(k):9.3f} ms   max {max(k):9.3f} ms")
+    print(f"  speed-up x{statistics.median(s) / statistics.median(k):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
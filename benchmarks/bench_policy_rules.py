@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Return-eligibility rules table: evaluation time and share of checks decided without the model.
+
+Generates synthetic return requests (category, order age, reason, customer text with
+an occasional condition detail) and runs policy_rules.evaluate on each, the way
+return_agent._check_return_eligibility does. Before the rules table every one of
+these checks was a policy_agent model call.
+
+    python benchmarks/bench_policy_rules.py --requests 20000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents import policy_rules            # noqa: E402
+
+CATEGORIES = ["Electronics", "Apparel and Wearables", "Footwear", "Home Goods",
+              "Accessories (Non-Electronics)", "Consumables", "Bundles and Kits", "general merchandise"]
+REASONS = ["changed mind", "defective item", "incorrect item received", "sizing issue", "customer initiated return"]
+TEXTS = [
+    "I want to return order {o}",
+    "please return {o}, it is broken",
+    "return {o}, wrong size",
+    "I don't need {o} anymore",
+    "return {o}, I wore it once",            # condition detail: needs the model
+    "{o} was a gift, can I send it back",    # needs the model
+]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=10000)
+    args = ap.parse_args()
+
+    rules = policy_rules.load_rules()
+    rng = random.Random(5)
+    by_rule, times = Counter(), []
+    for i in range(args.requests):
+        cat, reason = rng.choice(CATEGORIES), rng.choice(REASONS)
+        days = rng.choice([None] + list(range(0, 400))) if rng.random() < 0.01 else rng.randint(0, 120)
+        text = rng.choice(TEXTS).format(o=f"ord_{i}")
+        flags = ["clearance"] if rng.random() < 0.03 else []
+        t0 = time.perf_counter()
+        d = policy_rules.evaluate(cat, days, reason, text, flags, rules)
+        times.append((time.perf_counter() - t0) * 1e6)
+        by_rule[d.rule] += 1
+
+    local = sum(n for r, n in by_rule.items() if r not in ("ambiguous_text", "warranty"))
+    print(f"{args.requests} checks, median {statistics.median(times):.2f} us, "
+          f"p99 {sorted(times)[int(0.99 * (len(times) - 1))]:.2f} us")
+    print(f"decided without the model: {local / args.requests:.1%}")
+    for rule, n in by_rule.most_common():
+        print(f"  {rule:<16}{n:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Policy prompt size: whole return_policy.txt vs the sections selected by agents/policy_index.py.
+
+For a set of typical policy questions, reports the policy tokens each prompt would carry
+(prompt_builder.estimate_tokens), the section-selection time, and the input-token cost
+per 1000 questions at --usd-per-mtok. Only the policy part of the prompt changes; the
+instructions and question are the same in both cases.
+
+Live numbers (prompt tokens + latency per call) are logged by prompt_builder.record as
+"[PROMPT] policy_agent.qa tokens=..." lines.
+
+    python benchmarks/bench_policy_sections.py
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents import policy_index            # noqa: E402
+
+QUESTIONS = [
+    "What is the return window for electronics?",
+    "How long do refunds take if I paid with PayPal?",
+    "Is my laptop covered by warranty after 8 months?",
+    "Can I cancel my order? It was placed an hour ago.",
+    "Who pays return shipping if I changed my mind?",
+    "Can I return shoes I wore outside once?",
+    "My blender arrived damaged, what do I do?",
+    "Can I exchange a shirt for a different size?",
+    "Do you accept returns of opened cleaning products?",
+    "I live in Canada, do I pay duties on a return?",
+    "Can I return one item from a bundle?",
+    "Is there a restocking fee?",
+]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--k", type=int, default=policy_index.DEFAULT_K)
+    ap.add_argument("--usd-per-mtok", type=float, default=0.30, help="input price, USD per 1M tokens")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    index = policy_index.get_index()
+    full = index.tokens
+    print(f"{'question':<52}{'full':>6}{'sections':>10}{'saved':>8}{'select us':>11}")
+    sel_tokens, sel_us = [], []
+    for q in QUESTIONS:
+        text, tokens, _ = policy_index.relevant_policy(q, k=args.k, pin_first=True)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            index.select(q, k=args.k, pin_first=True)
+        us = (time.perf_counter() - t0) / args.repeat * 1e6
+        sel_tokens.append(tokens)
+        sel_us.append(us)
+        print(f"{q[:50]:<52}{full:>6}{tokens:>10}{1 - tokens / full:>8.0%}{us:>11.1f}")
+
+    mean = statistics.mean(sel_tokens)
+    cost = lambda tok: tok * 1000 / 1e6 * args.usd_per_mtok
+    print(f"\nmean policy tokens per prompt: {full} -> {mean:.0f} ({1 - mean / full:.0%} fewer)")
+    print(f"policy input cost per 1000 questions: ${cost(full):.4f} -> ${cost(mean):.4f}")
+    print(f"section selection: median {statistics.median(sel_us):.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a carrier tracking feed.
+
+Every shipment gets a realistic scan history that is deterministic per order id: label
+created at the warehouse, pickup, line-haul scans through one or two carrier hubs, an
+occasional weather or address exception (which costs a day), out for delivery and
+delivered. Scans have timestamps in the future until they "happen"; poll() returns the
+scans with since < ts <= until, the way a carrier's polling API returns new events, so
+`jobs.py sync-shipments` can ingest incrementally into db.shipment_events.
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+DATE_FMT = "%Y-%m-%d %H:%M:%S"         # sqlite datetime('now'), UTC
+ORIGIN = "Atlanta, GA"                 # the warehouse
+CARRIERS = ("UPS", "FedEx", "USPS")
+HUBS = {
+    "UPS": ["Louisville, KY", "Dallas, TX", "Chicago, IL", "Ontario, CA"],
+    "FedEx": ["Memphis, TN", "Indianapolis, IN", "Fort Worth, TX", "Oakland, CA"],
+    "USPS": ["Jacksonville, FL", "Denver, CO", "Philadelphia, PA", "Los Angeles, CA"],
+}
+EXCEPTIONS = ("Weather delay in the area", "Address information needed; delivery rescheduled",
+              "Package delayed in transit")
+EXCEPTION_RATE = 0.15
+
+
+@dataclass(frozen=True)
+class Shipment:
+    order_id: str
+    shipped_at: str                    # DATE_FMT; must not change between polls (jobs uses orders.created_at)
+    destination: str                   # "Austin, TX"
+
+
+def destination_of(address: Optional[str]) -> str:
+    """'9 Charger Way, Austin, TX 78701' -> 'Austin, TX'."""
+    parts = [p.strip() for p in (address or "").split(",") if p.strip()]
+    if len(parts) >= 3:
+        return f"{parts[-2]}, {parts[-1].split()[0].upper()}"
+    return parts[-1] if parts else "Destination"
+
+
+def _rng(order_id: str) -> random.Random:
+    return random.Random(int(hashlib.sha1(order_id.encode("utf-8")).hexdigest()[:12], 16))
+
+def carrier_for(order_id: str) -> str:
+    return CARRIERS[_rng(order_id).randrange(len(CARRIERS))]
+
+def tracking_number(order_id: str, carrier: str) -> str:
+    digits = str(int(hashlib.sha1(f"{carrier}:{order_id}".encode("utf-8")).hexdigest()[:15], 16))[:12]
+    return {"UPS": "1Z" + digits, "FedEx": digits, "USPS": "9400" + digits}.get(carrier, digits)
+
+
+def timeline(shipment: Shipment) -> List[Dict[str, str]]:
+    """The shipment's full scan history, oldest first (later scans may lie in the future)."""
+    rng = _rng(shipment.order_id)
+    carrier = CARRIERS[rng.randrange(len(CARRIERS))]
+    number = tracking_number(shipment.order_id, carrier)
+    try:
+        t = datetime.strptime(shipment.shipped_at, DATE_FMT)
+    except (TypeError, ValueError):
+        t = datetime.now(timezone.utc).replace(tzinfo=None)
+    events: List[Dict[str, str]] = []
+
+    def scan(hours: tuple, code: str, description: str, location: str) -> None:
+        nonlocal t
+        t += timedelta(minutes=rng.randint(int(hours[0] * 60), int(hours[1] * 60)))
+        events.append({"order_id": shipment.order_id, "carrier": carrier, "tracking_number": number,
+                       "code": code, "description": description, "location": location,
+                       "ts": t.strftime(DATE_FMT)})
+
+    scan((1, 6), "label_created", "Shipping label created", ORIGIN)
+    scan((4, 20), "picked_up", f"Picked up by {carrier}", ORIGIN)
+    scan((2, 6), "departed_facility", f"Departed {carrier} facility", ORIGIN)
+    for hub in rng.sample(HUBS[carrier], k=rng.randint(1, 2)):
+        scan((8, 30), "arrived_at_facility", f"Arrived at {carrier} hub", hub)
+        scan((1, 6), "departed_facility", f"Departed {carrier} hub", hub)
+    if rng.random() < EXCEPTION_RATE:
+        scan((2, 8), "exception", rng.choice(EXCEPTIONS), events[-1]["location"])
+        t += timedelta(hours=24)
+    scan((6, 20), "arrived_at_facility", "Arrived at local delivery facility", shipment.destination)
+    scan((8, 14), "out_for_delivery", "Out for delivery", shipment.destination)
+    scan((1, 8), "delivered", "Delivered", shipment.destination)
+    return events
+
+
+def poll(shipments: Iterable[Shipment], since: Optional[str], until: str) -> List[Dict[str, str]]:
+    """Scans of `shipments` with since < ts <= until (since None: from the start), oldest first."""
+    out = [e for s in shipments for e in timeline(s)
+           if e["ts"] <= until and (since is None or e["ts"] > since)]
+    out.sort(key=lambda e: (e["ts"], e["order_id"]))
+    return out
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
+import json
+import re
 import sqlite3
+import uuid
 from pathlib import Path
 from contextlib import closing
 from typing import Optional, Iterable, Any
 
+from agents import turn_cache
+from agents.policy_rules import classify_item
+
 DB_PATH = Path(__file__).parent / "agentic_ai.db"
 
 # ---------------------------------------------------------------
@@ -41,9 +47,21 @@ CREATE TABLE IF NOT EXISTS orders (
     shipping_name       TEXT,
     shipping_address    TEXT,
     created_at          TEXT DEFAULT (datetime('now')),
-    updated_at          TEXT
+    updated_at          TEXT,
+    -- precomputed by `jobs.py refresh-return-deadlines` (agents/policy_rules.deadlines); last
+    -- instant the order can still be returned / claimed under warranty, same format as created_at
+    item_category       TEXT,
+    return_deadline     TEXT,
+    warranty_deadline   TEXT,
+    deadlines_version   TEXT                -- rules version they were computed with; NULL = stale
 );
 
+-- list_orders_for_user() / list_orders_page() / get_latest_order() filter by email and walk
+-- (created_at, order_id) newest first; order_id breaks ties so keyset cursors are exact.
+-- Supersedes idx_orders_email_created (a prefix of it).
+DROP INDEX IF EXISTS idx_orders_email_created;
+CREATE INDEX IF NOT EXISTS idx_orders_email_created_id ON orders(email, created_at, order_id);
+
 CREATE TABLE IF NOT EXISTS order_items (
     order_item_id       INTEGER PRIMARY KEY AUTOINCREMENT,
     order_id            TEXT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
@@ -54,6 +72,18 @@ CREATE TABLE IF NOT EXISTS order_items (
     line_total_cents    INTEGER
 );
 
+-- Policy category per SKU (agents/policy_rules.classify_item), written when an item is added;
+-- '' means no category keyword matched. jobs.py backfills SKUs ingested before this table.
+-- list_items_for_orders() / get_orders_full() fetch items by order_id
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, order_item_id);
+
+CREATE TABLE IF NOT EXISTS sku_categories (
+    sku                 TEXT PRIMARY KEY,
+    name                TEXT,
+    category            TEXT NOT NULL,
+    classified_at       TEXT DEFAULT (datetime('now'))
+);
+
 CREATE TABLE IF NOT EXISTS payments (
     payment_id          TEXT PRIMARY KEY,
     email               TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE,
@@ -67,14 +97,224 @@ CREATE TABLE IF NOT EXISTS payments (
     created_at          TEXT DEFAULT (datetime('now'))
 );
 
+-- get_orders_full() fetches payments by order_id
+CREATE INDEX IF NOT EXISTS idx_payments_order ON payments(order_id, created_at);
+
+-- One row per return (RMA). State changes go through transition_return(), which checks
+-- RETURN_TRANSITIONS and logs every change to return_events.
+CREATE TABLE IF NOT EXISTS returns (
+    rma_id              TEXT PRIMARY KEY,
+    order_id            TEXT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+    email               TEXT NOT NULL,
+    items               TEXT,               -- JSON [{sku, name, qty}] at the time of the request
+    reason              TEXT,
+    eligible            INTEGER,            -- 1 / 0, NULL if undecided
+    decision_reason     TEXT,
+    decided_by          TEXT,               -- rules / model / manual
+    state               TEXT NOT NULL,
+    created_at          TEXT DEFAULT (datetime('now')),
+    updated_at          TEXT DEFAULT (datetime('now'))
+);
+-- list_open_returns_older_than(): state IN (open states) AND created_at < cutoff
+CREATE INDEX IF NOT EXISTS idx_returns_state_created ON returns(state, created_at);
+CREATE INDEX IF NOT EXISTS idx_returns_email ON returns(email, created_at);
+-- at most one open return per order: create_return() is idempotent on this
+CREATE UNIQUE INDEX IF NOT EXISTS uq_returns_open_order ON returns(order_id)
+    WHERE state IN ('requested', 'approved', 'label_sent', 'in_transit', 'received');
+
+CREATE TABLE IF NOT EXISTS return_events (
+    event_id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    rma_id              TEXT NOT NULL REFERENCES returns(rma_id) ON DELETE CASCADE,
+    from_state          TEXT,
+    to_state            TEXT NOT NULL,
+    note                TEXT,
+    created_at          TEXT DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_return_events_rma ON return_events(rma_id, event_id);
+
+-- Customer notifications written in the same transaction as the change they announce and
+-- sent later by jobs.py send-notifications. dedupe_key makes enqueueing idempotent.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    notification_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key          TEXT UNIQUE,
+    email               TEXT NOT NULL,
+    event_type          TEXT NOT NULL,
+    payload             TEXT,               -- JSON state for agents/message_agent.message_agent
+    status              TEXT DEFAULT 'pending',   -- pending / sent / failed
+    attempts            INTEGER DEFAULT 0,
+    last_error          TEXT,
+    next_attempt_at     TEXT DEFAULT (datetime('now')),
+    created_at          TEXT DEFAULT (datetime('now')),
+    sent_at             TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox(status, next_attempt_at);
+
+-- Carrier tracking scans, ingested by `jobs.py sync-shipments` (carrier_sim.py stands in for
+-- the carrier feed). The UNIQUE key makes re-ingesting an overlapping window a no-op.
+CREATE TABLE IF NOT EXISTS shipment_events (
+    event_id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id            TEXT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+    carrier             TEXT NOT NULL,
+    tracking_number     TEXT,
+    code                TEXT NOT NULL,      -- label_created / picked_up / departed_facility / arrived_at_facility /
+                                            -- exception / out_for_delivery / delivered
+    description         TEXT,
+    location            TEXT,
+    ts                  TEXT NOT NULL,      -- scan time (UTC), same format as created_at
+    ingested_at         TEXT DEFAULT (datetime('now')),
+    UNIQUE (order_id, carrier, code, ts)
+);
+-- latest event / timeline of one order
+CREATE INDEX IF NOT EXISTS idx_shipment_events_order_ts ON shipment_events(order_id, ts);
+
+-- How far each tracking feed has been ingested (the `until` of its last successful poll).
+CREATE TABLE IF NOT EXISTS shipment_feeds (
+    feed                TEXT PRIMARY KEY,
+    cursor              TEXT,
+    synced_at           TEXT
+);
+
 CREATE TABLE IF NOT EXISTS ai_conversations (
     conversation_id     TEXT PRIMARY KEY,
     email               TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE,
     started_at          TEXT DEFAULT (datetime('now')),
     ended_at            TEXT,
-    conversation_text   TEXT
+    conversation_text   TEXT,               -- JSON list of the hot (not yet compacted) messages
+    rolling_summary     TEXT,               -- summary of the compacted turns (agents/conversation_compactor.py)
+    summary_entities    TEXT,               -- JSON {kind: [values]} extracted from the compacted turns
+    compacted_count     INTEGER DEFAULT 0   -- messages moved to conversation_archive; msg_seq of the first hot message
 );
 
+-- Raw turns folded out of ai_conversations.conversation_text, so compaction can be undone.
+CREATE TABLE IF NOT EXISTS conversation_archive (
+    conversation_id     TEXT NOT NULL,
+    msg_seq             INTEGER NOT NULL,
+    role                TEXT,
+    content             TEXT,
+    archived_at         TEXT DEFAULT (datetime('now')),
+    PRIMARY KEY (conversation_id, msg_seq)
+);
+
+
+-- Incremental memory index (agents/memory_agent.py). No FK to ai_conversations on purpose:
+-- add_conversation() uses INSERT OR REPLACE, which would cascade-delete the index every turn.
+CREATE TABLE IF NOT EXISTS memory_index (
+    conversation_id     TEXT PRIMARY KEY,
+    last_start          INTEGER,
+    msg_count           INTEGER DEFAULT 0,
+    updated_at          TEXT DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS memory_index_msgs (
+    conversation_id     TEXT NOT NULL,
+    idx                 INTEGER NOT NULL,
+    role                TEXT,
+    content             TEXT,
+    ents                TEXT,
+    tags                TEXT,
+    toks                TEXT,               -- JSON {term: count}, stopwords removed
+    PRIMARY KEY (conversation_id, idx)
+);
+
+-- One row per message of every conversation, kept in sync with ai_conversations by the
+-- triggers below and mirrored into an FTS5 index for cross-conversation memory.
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    message_id          INTEGER PRIMARY KEY,
+    conversation_id     TEXT NOT NULL,
+    msg_seq             INTEGER NOT NULL,
+    email               TEXT,
+    role                TEXT,
+    content             TEXT,
+    UNIQUE (conversation_id, msg_seq)
+);
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_email ON conversation_messages(email);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS conversation_messages_fts USING fts5(
+    content, email,
+    content = 'conversation_messages', content_rowid = 'message_id',
+    tokenize = 'porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS conversation_messages_fts_ai AFTER INSERT ON conversation_messages BEGIN
+    INSERT INTO conversation_messages_fts (rowid, content, email) VALUES (NEW.message_id, NEW.content, NEW.email);
+END;
+CREATE TRIGGER IF NOT EXISTS conversation_messages_fts_ad AFTER DELETE ON conversation_messages BEGIN
+    INSERT INTO conversation_messages_fts (conversation_messages_fts, rowid, content, email)
+    VALUES ('delete', OLD.message_id, OLD.content, OLD.email);
+END;
+
+-- The app re-saves the whole hot JSON list every turn, so only elements past the last
+-- stored msg_seq are inserted. msg_seq is global: element j of conversation_text is message
+-- compacted_count + j, and rows of compacted (archived) turns stay searchable.
+-- If the stored last message no longer matches, the hot part was rewritten: start it over.
+DROP TRIGGER IF EXISTS ai_conversations_msgs_ai;
+CREATE TRIGGER ai_conversations_msgs_ai AFTER INSERT ON ai_conversations
+WHEN json_valid(NEW.conversation_text) AND json_type(NEW.conversation_text) = 'array'
+BEGIN
+    DELETE FROM conversation_messages
+    WHERE conversation_id = NEW.conversation_id
+      AND msg_seq >= COALESCE(NEW.compacted_count, 0)
+      AND (SELECT content FROM conversation_messages WHERE conversation_id = NEW.conversation_id
+           ORDER BY msg_seq DESC LIMIT 1)
+          IS NOT json_extract(NEW.conversation_text, '$[' || max((SELECT MAX(msg_seq) FROM conversation_messages
+                                                                  WHERE conversation_id = NEW.conversation_id)
+                                                                 - COALESCE(NEW.compacted_count, 0), 0) || '].content');
+    INSERT INTO conversation_messages (conversation_id, msg_seq, email, role, content)
+    SELECT NEW.conversation_id, COALESCE(NEW.compacted_count, 0) + j.key, NEW.email,
+           json_extract(j.value, '$.role'), json_extract(j.value, '$.content')
+    FROM json_each(NEW.conversation_text) AS j
+    WHERE COALESCE(NEW.compacted_count, 0) + j.key
+          > COALESCE((SELECT MAX(msg_seq) FROM conversation_messages WHERE conversation_id = NEW.conversation_id), -1)
+      AND j.type = 'object' AND json_extract(j.value, '$.content') IS NOT NULL;
+END;
+
+-- plain-text transcripts (seed data) are indexed as a single message
+CREATE TRIGGER IF NOT EXISTS ai_conversations_msgs_ai_text AFTER INSERT ON ai_conversations
+WHEN NEW.conversation_text IS NOT NULL
+ AND NOT (json_valid(NEW.conversation_text) AND json_type(NEW.conversation_text) = 'array')
+BEGIN
+    DELETE FROM conversation_messages WHERE conversation_id = NEW.conversation_id;
+    INSERT INTO conversation_messages (conversation_id, msg_seq, email, role, content)
+    VALUES (NEW.conversation_id, 0, NEW.email, NULL, NEW.conversation_text);
+END;
+
+-- save_conversation_messages() and compaction update the row in place: same rules as on insert
+DROP TRIGGER IF EXISTS ai_conversations_msgs_au;
+CREATE TRIGGER ai_conversations_msgs_au AFTER UPDATE OF conversation_text ON ai_conversations
+WHEN json_valid(NEW.conversation_text) AND json_type(NEW.conversation_text) = 'array'
+BEGIN
+    DELETE FROM conversation_messages
+    WHERE conversation_id = NEW.conversation_id
+      AND msg_seq >= COALESCE(NEW.compacted_count, 0)
+      AND (SELECT content FROM conversation_messages WHERE conversation_id = NEW.conversation_id
+           ORDER BY msg_seq DESC LIMIT 1)
+          IS NOT json_extract(NEW.conversation_text, '$[' || max((SELECT MAX(msg_seq) FROM conversation_messages
+                                                                  WHERE conversation_id = NEW.conversation_id)
+                                                                 - COALESCE(NEW.compacted_count, 0), 0) || '].content');
+    INSERT INTO conversation_messages (conversation_id, msg_seq, email, role, content)
+    SELECT NEW.conversation_id, COALESCE(NEW.compacted_count, 0) + j.key, NEW.email,
+           json_extract(j.value, '$.role'), json_extract(j.value, '$.content')
+    FROM json_each(NEW.conversation_text) AS j
+    WHERE COALESCE(NEW.compacted_count, 0) + j.key
+          > COALESCE((SELECT MAX(msg_seq) FROM conversation_messages WHERE conversation_id = NEW.conversation_id), -1)
+      AND j.type = 'object' AND json_extract(j.value, '$.content') IS NOT NULL;
+END;
+
+DROP TRIGGER IF EXISTS ai_conversations_msgs_au_text;
+CREATE TRIGGER ai_conversations_msgs_au_text AFTER UPDATE OF conversation_text ON ai_conversations
+WHEN NEW.conversation_text IS NOT NULL
+ AND NOT (json_valid(NEW.conversation_text) AND json_type(NEW.conversation_text) = 'array')
+BEGIN
+    DELETE FROM conversation_messages WHERE conversation_id = NEW.conversation_id;
+    INSERT INTO conversation_messages (conversation_id, msg_seq, email, role, content)
+    VALUES (NEW.conversation_id, 0, NEW.email, NULL, NEW.conversation_text);
+END;
+
+DROP TRIGGER IF EXISTS ai_conversations_msgs_ad;
+CREATE TRIGGER ai_conversations_msgs_ad AFTER DELETE ON ai_conversations BEGIN
+    DELETE FROM conversation_messages WHERE conversation_id = OLD.conversation_id;
+    DELETE FROM conversation_archive WHERE conversation_id = OLD.conversation_id;
+END;
 
 CREATE TABLE IF NOT EXISTS feedback (
     feedback_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -145,6 +385,9 @@ def init_db() -> None:
         conn.commit()
         migrate_add_address_columns()  # call a method to add address columns if they don't exist
         migrate_add_phone_unique_index()  # enforce unique non-null phone numbers when possible
+        migrate_add_compaction_columns()  # rolling_summary / summary_entities / compacted_count
+        migrate_add_return_deadline_columns()  # orders.return_deadline / warranty_deadline + index
+        migrate_backfill_conversation_messages()  # index conversations saved before the FTS triggers existed
         ensure_example_data()
     print(f"Database initialized at {DB_PATH}")
 
@@ -193,6 +436,7 @@ def ensure_example_data():
 # ---------------------------------------------------------------
 # USERS
 # ---------------------------------------------------------------
+@turn_cache.writes("user:{email}", "phone:{phone}")
 def add_user(email: str, password_hash: Optional[str] = None,
              first_name: Optional[str] = None, last_name: Optional[str] = None,
              phone: Optional[str] = None, is_active: int = 1) -> None:
@@ -202,11 +446,13 @@ def add_user(email: str, password_hash: Optional[str] = None,
     """, (email.lower(), password_hash, first_name, last_name, phone, is_active))
     print(f"User {email} added/updated.")
 
+@turn_cache.reads("user:{email}")
 def get_user(email: str) -> Optional[sqlite3.Row]:
     rows = _query("SELECT * FROM users WHERE email = ?", (email.lower(),))
     print(f"User {email} retrieved.")
     return rows[0] if rows else None
 
+@turn_cache.reads("phone:{phone}", rows="user:{email}")
 def get_user_by_phone(phone: str) -> Optional[sqlite3.Row]:
     rows = _query("SELECT * FROM users WHERE phone = ?", (phone,))
     print(f"User with phone {phone} retrieved.")
@@ -224,6 +470,7 @@ def get_user_by_email_or_phone(identifier: str) -> Optional[sqlite3.Row]:
 def get_all_users() -> list[sqlite3.Row]:
     return _query("SELECT * FROM users")
 
+@turn_cache.reads("user:{email}")
 def get_user_phone_number(email: str) -> str | None:
     rows = _query("SELECT phone FROM users WHERE email = ?", (email.lower(),))
     if not rows:
@@ -242,26 +489,39 @@ def get_user_phone_number(email: str) -> str | None:
 
 
 
+@turn_cache.writes("user:{email}")
 def set_user_password_hash(email: str, password_hash: str): _exec("UPDATE users SET password_hash=? WHERE email=?", (password_hash, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_first_name(email: str, first_name: str): _exec("UPDATE users SET first_name=? WHERE email=?", (first_name, email.lower()))
+@turn_cache.reads("user:{email}")
 def get_user_first_name(email: str) -> Optional[str]:
     rows = _query("SELECT first_name FROM users WHERE email = ?", (email,))
     return rows[0]["first_name"] if rows else None
+@turn_cache.writes("user:{email}")
 def set_user_last_name(email: str, last_name: str): _exec("UPDATE users SET last_name=? WHERE email=?", (last_name, email.lower()))
+@turn_cache.reads("user:{email}")
 def get_user_last_name(email: str) -> Optional[str]:
     rows = _query("SELECT last_name FROM users WHERE email = ?", (email,))
     return rows[0]["last_name"] if rows else None
+@turn_cache.writes("user:{email}", "phone:{phone}")
 def set_user_phone(email: str, phone: str): _exec("UPDATE users SET phone=? WHERE email=?", (phone, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_address_line(email: str, address_line: str): _exec("UPDATE users SET address_line=? WHERE email=?", (address_line, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_city(email: str, city: str): _exec("UPDATE users SET city=? WHERE email=?", (city, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_state(email: str, state: str): _exec("UPDATE users SET state=? WHERE email=?", (state, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_country(email: str, country: str): _exec("UPDATE users SET country=? WHERE email=?", (country, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_zip_code(email: str, zip_code: str): _exec("UPDATE users SET zip_code=? WHERE email=?", (zip_code, email.lower()))
+@turn_cache.writes("user:{email}")
 def set_user_is_active(email: str, is_active: int): _exec("UPDATE users SET is_active=? WHERE email=?", (int(is_active), email.lower()))
 
 # ---------------------------------------------------------------
 # ORDERS
 # ---------------------------------------------------------------
+@turn_cache.writes("order:{order_id}", "orders:{email}")
 def add_order(order_id: str, email: str, subtotal_cents: int = 0, tax_cents: int = 0,
               shipping_cents: int = 0, discount_cents: int = 0, currency: str = "USD",
               status: str = "pending", shipping_name: Optional[str] = None,
@@ -278,29 +538,242 @@ def add_order(order_id: str, email: str, subtotal_cents: int = 0, tax_cents: int
     print(f"Order {order_id} for user {email} added/updated.")
 
 # --- Key setters for Orders ---
+@turn_cache.writes("order:{order_id}")
 def set_order_status(order_id: str, status: str): _exec("UPDATE orders SET status=?, updated_at=datetime('now') WHERE order_id=?", (status, order_id))
+@turn_cache.writes("order:{order_id}")
 def set_order_shipping_name(order_id: str, name: str): _exec("UPDATE orders SET shipping_name=?, updated_at=datetime('now') WHERE order_id=?", (name, order_id))
+@turn_cache.writes("order:{order_id}")
 def set_order_shipping_address(order_id: str, address: str): _exec("UPDATE orders SET shipping_address=?, updated_at=datetime('now') WHERE order_id=?", (address, order_id))
+@turn_cache.writes("order:{order_id}")
 def set_order_total(order_id: str, total_cents: int): _exec("UPDATE orders SET total_cents=?, updated_at=datetime('now') WHERE order_id=?", (total_cents, order_id))
 
+@turn_cache.reads("order:{order_id}")
 def get_order_by_id(order_id: str) -> Optional[sqlite3.Row]:
     rows = _query("SELECT * FROM orders WHERE order_id = ?", (order_id,))
     return rows[0] if rows else None  
 
+@turn_cache.reads("order:{order_id}")
+def get_order_for_user(email: str, order_id: str) -> Optional[sqlite3.Row]:
+    """One order by primary key, only if it belongs to `email`."""
+    rows = _query("SELECT * FROM orders WHERE order_id = ? AND email = ?", (order_id, (email or "").lower()))
+    return rows[0] if rows else None
+
+@turn_cache.reads("orders:{email}", rows="order:{order_id}")
 def list_orders_for_user(email: str): return _query("SELECT * FROM orders WHERE email=? ORDER BY created_at DESC", (email.lower(),))
 
+# --- Order listing: projected columns, keyset pagination ---
+ORDER_COLUMNS = frozenset({
+    "order_id", "email", "status", "subtotal_cents", "tax_cents", "shipping_cents", "discount_cents",
+    "total_cents", "currency", "shipping_name", "shipping_address", "created_at", "updated_at",
+    "item_category", "return_deadline", "warranty_deadline", "deadlines_version",
+})
+ORDER_SUMMARY_COLUMNS = ("order_id", "status", "created_at", "subtotal_cents", "tax_cents",
+                         "shipping_cents", "total_cents", "currency")
+
+def _order_select(columns: Iterable[str]) -> str:
+    cols = list(dict.fromkeys(("order_id", "created_at", *columns)))    # the cursor needs both
+    unknown = [c for c in cols if c not in ORDER_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown order columns: {unknown}")
+    return ", ".join(cols)
+
+@turn_cache.reads("orders:{email}", rows="order:{order_id}")
+def list_orders_page(email: str, limit: int = 5, cursor: Optional[str] = None,
+                     columns: tuple = ORDER_SUMMARY_COLUMNS) -> tuple[list[sqlite3.Row], Optional[str]]:
+    """
+    One page of a user's orders, newest first, with only `columns` (order_id and
+    created_at are always included). `cursor` is the value returned with the previous
+    page; walks idx_orders_email_created_id from that point, so later pages cost the
+    same as the first. Returns (rows, next cursor or None when there are no more).
+    """
+    sql = f"SELECT {_order_select(columns)} FROM orders WHERE email = ?"
+    params: list[Any] = [(email or "").lower()]
+    if cursor:
+        created_at, _, order_id = cursor.partition("|")
+        sql += " AND (created_at, order_id) < (?, ?)"
+        params += [created_at, order_id]
+    rows = _query(sql + " ORDER BY created_at DESC, order_id DESC LIMIT ?", (*params, int(limit) + 1))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, f"{rows[-1]['created_at']}|{rows[-1]['order_id']}"
+
+@turn_cache.reads("orders:{email}", rows="order:{order_id}")
+def get_latest_order(email: str, columns: tuple = ORDER_SUMMARY_COLUMNS) -> Optional[sqlite3.Row]:
+    """The user's newest order (first entry of idx_orders_email_created_id for `email`)."""
+    rows = _query(f"SELECT {_order_select(columns)} FROM orders WHERE email = ? "
+                  "ORDER BY created_at DESC, order_id DESC LIMIT 1", ((email or "").lower(),))
+    return rows[0] if rows else None
+
+# statuses after which an order no longer needs tracking
+CLOSED_ORDER_STATUSES = ("delivered", "cancelled", "returned", "refunded", "return requested")
+
+@turn_cache.reads("orders:{email}", rows="order:{order_id}")
+def list_open_orders_for_user(email: str, limit: int = 10,
+                              columns: tuple = ORDER_SUMMARY_COLUMNS) -> list[sqlite3.Row]:
+    """The user's orders not yet delivered or closed (CLOSED_ORDER_STATUSES), newest first."""
+    return _query(f"""
+        SELECT {_order_select(columns)} FROM orders
+        WHERE email = ? AND COALESCE(status, '') NOT IN ({','.join('?' * len(CLOSED_ORDER_STATUSES))})
+        ORDER BY created_at DESC, order_id DESC LIMIT ?
+    """, ((email or "").lower(), *CLOSED_ORDER_STATUSES, int(limit)))
+
+def get_orders_by_ids(order_ids: Iterable[str], email: Optional[str] = None,
+                      columns: tuple = ORDER_SUMMARY_COLUMNS, chunk: int = 500) -> dict[str, sqlite3.Row]:
+    """
+    order_id -> row for the ids that exist (and belong to `email`, if given), in the order
+    asked; one IN query per `chunk` ids instead of one query per order.
+    """
+    ids = list(dict.fromkeys(order_ids))
+    found: dict[str, sqlite3.Row] = {}
+    select = _order_select(columns)
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        sql, params = f"SELECT {select} FROM orders WHERE order_id IN ({','.join('?' * len(part))})", list(part)
+        if email is not None:
+            sql, params = sql + " AND email = ?", params + [email.lower()]
+        found.update((r["order_id"], r) for r in _query(sql, params))
+    return {oid: found[oid] for oid in ids if oid in found}
+
+# --- Precomputed return windows (jobs.py refresh-return-deadlines) ---
+def list_orders_needing_deadlines(version: str, after: str = "", limit: int = 1000,
+                                  all_orders: bool = False) -> list[sqlite3.Row]:
+    """Orders (order_id order, after `after`) whose deadlines were not computed with rules `version`."""
+    return _query("""
+        SELECT order_id, created_at FROM orders
+        WHERE order_id > ? AND (? OR deadlines_version IS NOT ?)
+        ORDER BY order_id LIMIT ?
+    """, (after, int(all_orders), version, int(limit)))
+
+def save_order_deadlines(rows: Iterable[tuple]) -> None:
+    """Rows of (item_category, return_deadline, warranty_deadline, deadlines_version, order_id)."""
+    with closing(get_connection()) as conn:
+        conn.executemany("""
+            UPDATE orders SET item_category = ?, return_deadline = ?, warranty_deadline = ?, deadlines_version = ?
+            WHERE order_id = ?
+        """, rows)
+        conn.commit()
+
+def list_orders_return_window_closing(within_days: float, limit: int = 500) -> list[sqlite3.Row]:
+    """
+    Orders whose return window closes in the next `within_days` days and that have no open
+    return, soonest first. Only orders with current deadlines (see refresh job) are found.
+    """
+    return _query(f"""
+        SELECT o.* FROM orders o
+        WHERE o.return_deadline BETWEEN datetime('now') AND datetime('now', ?)
+          AND NOT EXISTS (SELECT 1 FROM returns r WHERE r.order_id = o.order_id
+                          AND r.state IN ({','.join('?' * len(OPEN_RETURN_STATES))}))
+        ORDER BY o.return_deadline LIMIT ?
+    """, (f"+{float(within_days)} days", *OPEN_RETURN_STATES, int(limit)))
+
 
 # ---------------------------------------------------------------
 # ORDER ITEMS
 # ---------------------------------------------------------------
+@turn_cache.writes("order:{order_id}")
 def add_order_item(order_id: str, sku: str, name: str, qty: int, unit_price_cents: int):
     line_total_cents = qty * unit_price_cents
-    _exec("""
-        INSERT INTO order_items (order_id, sku, name, qty, unit_price_cents, line_total_cents)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (order_id, sku, name, qty, unit_price_cents, line_total_cents))
+    with closing(get_connection()) as conn:
+        conn.execute("""
+            INSERT INTO order_items (order_id, sku, name, qty, unit_price_cents, line_total_cents)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (order_id, sku, name, qty, unit_price_cents, line_total_cents))
+        if sku:
+            _upsert_sku_categories(conn, [(sku, name, classify_item(sku, name))])
+        # the order's category may change: its precomputed deadlines are stale
+        conn.execute("UPDATE orders SET deadlines_version = NULL WHERE order_id = ?", (order_id,))
+        conn.commit()
     print(f"Order item {sku} for order {order_id} added.")
 
+def _upsert_sku_categories(conn: sqlite3.Connection, rows: Iterable[tuple]) -> None:
+    conn.executemany("""
+        INSERT INTO sku_categories (sku, name, category) VALUES (?, ?, ?)
+        ON CONFLICT(sku) DO UPDATE SET name = excluded.name, category = excluded.category,
+                                       classified_at = datetime('now')
+        WHERE sku_categories.name IS NOT excluded.name OR sku_categories.category IS NOT excluded.category
+    """, rows)
+
+def save_sku_categories(rows: Iterable[tuple]) -> None:
+    """Upsert (sku, name, category) rows."""
+    with closing(get_connection()) as conn:
+        _upsert_sku_categories(conn, rows)
+        conn.commit()
+
+def list_item_skus(after: str = "", limit: int = 1000, unclassified_only: bool = True) -> list[sqlite3.Row]:
+    """Distinct (sku, name) of order_items in SKU order after `after` (keyset paging), optionally only unclassified ones."""
+    return _query("""
+        SELECT oi.sku, MAX(oi.name) AS name
+        FROM order_items oi LEFT JOIN sku_categories sc ON sc.sku = oi.sku
+        WHERE oi.sku IS NOT NULL AND oi.sku > ? AND (? = 0 OR sc.sku IS NULL)
+        GROUP BY oi.sku ORDER BY oi.sku LIMIT ?
+    """, (after, int(unclassified_only), int(limit)))
+
+@turn_cache.reads("order:{order_id}")
+def get_order_item_categories(order_id: str) -> list[sqlite3.Row]:
+    """(sku, name, category) for each item of an order; category is NULL for unclassified SKUs."""
+    return _query("""
+        SELECT oi.sku, oi.name, sc.category
+        FROM order_items oi LEFT JOIN sku_categories sc ON sc.sku = oi.sku
+        WHERE oi.order_id = ? ORDER BY oi.order_item_id
+    """, (order_id,))
+
+def list_items_for_orders(order_ids: Iterable[str], chunk: int = 500) -> dict[str, list[sqlite3.Row]]:
+    """order_id -> its order_items rows, fetched with one IN query per `chunk` ids."""
+    ids = list(dict.fromkeys(order_ids))
+    out: dict[str, list[sqlite3.Row]] = {oid: [] for oid in ids}
+    with closing(get_connection()) as conn:
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            rows = conn.execute(
+                f"SELECT oi.*, sc.category FROM order_items oi LEFT JOIN sku_categories sc ON sc.sku = oi.sku "
+                f"WHERE oi.order_id IN ({','.join('?' * len(part))}) ORDER BY oi.order_item_id",
+                part,
+            ).fetchall()
+            for r in rows:
+                out[r["order_id"]].append(r)
+    return out
+
+# --- Order detail: order + line items + payments ---
+def get_orders_full(order_ids: Iterable[str], email: Optional[str] = None,
+                    chunk: int = 500) -> dict[str, dict]:
+    """
+    order_id -> the order as a dict with "items" (order_items + sku category) and
+    "payments" lists. Three IN queries per `chunk` ids on one connection, however many
+    orders are asked for. With `email`, orders of other users are left out, as are
+    unknown ids; the result keeps the order of `order_ids`.
+    """
+    ids = list(dict.fromkeys(order_ids))
+    out: dict[str, dict] = {}
+    with closing(get_connection()) as conn:
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            marks = ",".join("?" * len(part))
+            sql, params = f"SELECT * FROM orders WHERE order_id IN ({marks})", list(part)
+            if email is not None:
+                sql, params = sql + " AND email = ?", params + [email.lower()]
+            found = {r["order_id"]: {**dict(r), "items": [], "payments": []}
+                     for r in conn.execute(sql, params).fetchall()}
+            if not found:
+                continue
+            keys = list(found)
+            marks = ",".join("?" * len(keys))
+            for r in conn.execute(
+                f"SELECT oi.*, sc.category FROM order_items oi LEFT JOIN sku_categories sc ON sc.sku = oi.sku "
+                f"WHERE oi.order_id IN ({marks}) ORDER BY oi.order_item_id", keys,
+            ).fetchall():
+                found[r["order_id"]]["items"].append(dict(r))
+            for r in conn.execute(
+                f"SELECT * FROM payments WHERE order_id IN ({marks}) ORDER BY created_at, payment_id", keys,
+            ).fetchall():
+                found[r["order_id"]]["payments"].append(dict(r))
+            out.update(found)
+    return {oid: out[oid] for oid in ids if oid in out}
+
+def get_order_full(order_id: str, email: Optional[str] = None) -> Optional[dict]:
+    """One order with its "items" and "payments" (see get_orders_full); None if not found / not the user's."""
+    return get_orders_full([order_id], email=email).get(order_id)
+
 # ---------------------------------------------------------------
 # PAYMENTS
 # ---------------------------------------------------------------
@@ -323,21 +796,263 @@ def set_payment_method(payment_id: str, method: str): _exec("UPDATE payments SET
 
 def list_payments_for_user(email: str): return _query("SELECT * FROM payments WHERE email=? ORDER BY created_at DESC", (email.lower(),))
 
+# ---------------------------------------------------------------
+# RETURNS
+# ---------------------------------------------------------------
+RETURN_TRANSITIONS: dict[str, set[str]] = {
+    "requested":  {"approved", "rejected", "cancelled"},
+    "approved":   {"label_sent", "received", "cancelled"},
+    "label_sent": {"in_transit", "received", "cancelled"},
+    "in_transit": {"received"},
+    "received":   {"refunded", "rejected"},
+    "refunded":   {"closed"},
+    "rejected":   {"closed"},
+    "cancelled":  set(),
+    "closed":     set(),
+}
+OPEN_RETURN_STATES = ("requested", "approved", "label_sent", "in_transit", "received")   # see uq_returns_open_order
+NOTIFY_RETURN_STATES = {"requested", "approved", "rejected", "received", "refunded"}
+
+def _enqueue_notification(conn: sqlite3.Connection, dedupe_key: str, email: str, event_type: str,
+                          payload: dict) -> None:
+    conn.execute("""
+        INSERT INTO notification_outbox (dedupe_key, email, event_type, payload) VALUES (?, ?, ?, ?)
+        ON CONFLICT(dedupe_key) DO NOTHING
+    """, (dedupe_key, email, event_type, json.dumps(payload)))
+
+def _return_notification(conn: sqlite3.Connection, ret: sqlite3.Row, state: str, note: str = "") -> None:
+    if state not in NOTIFY_RETURN_STATES:
+        return
+    name = conn.execute("SELECT first_name FROM users WHERE email = ?", (ret["email"],)).fetchone()
+    details = f"Return {ret['rma_id']} for order {ret['order_id']} is now {state.replace('_', ' ')}."
+    _enqueue_notification(conn, f"return:{ret['rma_id']}:{state}", ret["email"], f"return_{state}", {
+        "email": ret["email"],
+        "order_id": ret["order_id"],
+        "name": (name["first_name"] if name else "") or "",
+        "event_type": f"return_{state}",
+        "details": f"{details} {note}".strip(),
+    })
+
+@turn_cache.writes("order:{order_id}", "returns:{email}")
+def create_return(order_id: str, email: str, items: list[dict], reason: str = "",
+                  eligible: Optional[bool] = None, decision_reason: str = "", decided_by: str = "",
+                  state: str = "requested") -> tuple[sqlite3.Row, bool]:
+    """
+    Open a return for `order_id` and mark the order "return requested", enqueueing the
+    customer notification in the same transaction. Idempotent: if the order already has an
+    open return, that one is returned. Returns (returns row, created).
+    """
+    if state not in OPEN_RETURN_STATES:
+        raise ValueError(f"a return cannot start in state {state!r}")
+    rma_id = f"rma_{uuid.uuid4().hex[:12]}"
+    with closing(get_connection()) as conn:
+        cur = conn.execute("""
+            INSERT INTO returns (rma_id, order_id, email, items, reason, eligible, decision_reason, decided_by, state)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+        """, (rma_id, order_id, email.lower(), json.dumps(items), reason,
+              None if eligible is None else int(eligible), decision_reason, decided_by, state))
+        created = cur.rowcount == 1
+        if created:
+            ret = conn.execute("SELECT * FROM returns WHERE rma_id = ?", (rma_id,)).fetchone()
+            conn.execute("INSERT INTO return_events (rma_id, from_state, to_state, note) VALUES (?, NULL, ?, ?)",
+                         (rma_id, state, decision_reason))
+            conn.execute("UPDATE orders SET status = 'return requested', updated_at = datetime('now') WHERE order_id = ?",
+                         (order_id,))
+            _return_notification(conn, ret, state)
+        else:
+            ret = conn.execute(
+                f"SELECT * FROM returns WHERE order_id = ? AND state IN ({','.join('?' * len(OPEN_RETURN_STATES))})",
+                (order_id, *OPEN_RETURN_STATES)).fetchone()
+        conn.commit()
+    print(f"[RETURNS] {'created' if created else 'reused open'} return {ret['rma_id']} for order {order_id}")
+    return ret, created
+
+@turn_cache.writes("return:{rma_id}")
+def transition_return(rma_id: str, to_state: str, note: str = "") -> bool:
+    """
+    Move a return to `to_state` if RETURN_TRANSITIONS allows it from its current state.
+    Logs a return_events row and enqueues the customer notification atomically.
+    False if the return does not exist or the transition is not allowed.
+    """
+    with closing(get_connection()) as conn:
+        ret = conn.execute("SELECT * FROM returns WHERE rma_id = ?", (rma_id,)).fetchone()
+        if not ret or to_state not in RETURN_TRANSITIONS.get(ret["state"], set()):
+            return False
+        cur = conn.execute("UPDATE returns SET state = ?, updated_at = datetime('now') WHERE rma_id = ? AND state = ?",
+                           (to_state, rma_id, ret["state"]))
+        if cur.rowcount != 1:      # changed concurrently
+            return False
+        conn.execute("INSERT INTO return_events (rma_id, from_state, to_state, note) VALUES (?, ?, ?, ?)",
+                     (rma_id, ret["state"], to_state, note))
+        _return_notification(conn, ret, to_state, note)
+        conn.commit()
+    return True
+
+@turn_cache.reads("return:{rma_id}")
+def get_return(rma_id: str) -> Optional[sqlite3.Row]:
+    rows = _query("SELECT * FROM returns WHERE rma_id = ?", (rma_id,))
+    return rows[0] if rows else None
+
+@turn_cache.reads("order:{order_id}", rows="return:{rma_id}")
+def get_open_return_for_order(order_id: str) -> Optional[sqlite3.Row]:
+    rows = _query(f"SELECT * FROM returns WHERE order_id = ? AND state IN ({','.join('?' * len(OPEN_RETURN_STATES))})",
+                  (order_id, *OPEN_RETURN_STATES))
+    return rows[0] if rows else None
+
+def list_return_events(rma_id: str) -> list[sqlite3.Row]:
+    return _query("SELECT * FROM return_events WHERE rma_id = ? ORDER BY event_id", (rma_id,))
+
+@turn_cache.reads("returns:{email}", rows="return:{rma_id}")
+def list_returns_for_user(email: str): return _query("SELECT * FROM returns WHERE email=? ORDER BY created_at DESC", (email.lower(),))
+
+def list_open_returns_older_than(days: float, limit: int = 500) -> list[sqlite3.Row]:
+    """Open returns created more than `days` ago, oldest first (range scan on idx_returns_state_created)."""
+    return _query(f"""
+        SELECT * FROM returns
+        WHERE state IN ({','.join('?' * len(OPEN_RETURN_STATES))}) AND created_at < datetime('now', ?)
+        ORDER BY created_at LIMIT ?
+    """, (*OPEN_RETURN_STATES, f"-{float(days)} days", int(limit)))
+
+# ---------------------------------------------------------------
+# NOTIFICATION OUTBOX
+# ---------------------------------------------------------------
+def list_due_notifications(limit: int = 50) -> list[sqlite3.Row]:
+    """Pending notifications whose next attempt is due, oldest first."""
+    return _query("""
+        SELECT * FROM notification_outbox
+        WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+        ORDER BY next_attempt_at LIMIT ?
+    """, (int(limit),))
+
+def mark_notification_sent(notification_id: int) -> None:
+    _exec("UPDATE notification_outbox SET status='sent', attempts=attempts+1, sent_at=datetime('now'), last_error=NULL "
+          "WHERE notification_id=?", (notification_id,))
+
+def mark_notification_failed(notification_id: int, error: str, retry_in_s: Optional[int]) -> None:
+    """Record a failed attempt; retried after `retry_in_s` seconds, or given up on (status 'failed') if None."""
+    _exec("""
+        UPDATE notification_outbox
+        SET attempts = attempts + 1, last_error = ?,
+            status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+            next_attempt_at = datetime('now', '+' || COALESCE(?, 0) || ' seconds')
+        WHERE notification_id = ?
+    """, (error[:500], retry_in_s, retry_in_s, notification_id))
+
+# ---------------------------------------------------------------
+# SHIPMENT TRACKING
+# ---------------------------------------------------------------
+SHIPMENT_EVENT_FIELDS = ("order_id", "carrier", "tracking_number", "code", "description", "location", "ts")
+
+def list_orders_by_status(statuses: Iterable[str], after: str = "", limit: int = 1000) -> list[sqlite3.Row]:
+    """Orders whose status is one of `statuses`, in order_id order after `after` (keyset paging)."""
+    statuses = list(statuses)
+    return _query(f"""
+        SELECT order_id, email, status, shipping_address, created_at, updated_at FROM orders
+        WHERE status IN ({','.join('?' * len(statuses))}) AND order_id > ?
+        ORDER BY order_id LIMIT ?
+    """, (*statuses, after, int(limit)))
+
+def get_shipment_feed_cursor(feed: str) -> Optional[str]:
+    rows = _query("SELECT cursor FROM shipment_feeds WHERE feed = ?", (feed,))
+    return rows[0]["cursor"] if rows else None
+
+def ingest_shipment_events(events: Iterable[dict], feed: Optional[str] = None,
+                           cursor: Optional[str] = None) -> int:
+    """
+    Store tracking events (dicts with SHIPMENT_EVENT_FIELDS) and, with `feed`, advance that
+    feed's cursor to `cursor` in the same transaction. Events already stored (same order,
+    carrier, code and ts) or for unknown orders are skipped. Returns the number of new events.
+    """
+    with closing(get_connection()) as conn:
+        before = conn.total_changes
+        conn.executemany(f"""
+            INSERT OR IGNORE INTO shipment_events ({', '.join(SHIPMENT_EVENT_FIELDS)})
+            SELECT {', '.join('?' * len(SHIPMENT_EVENT_FIELDS))}
+            WHERE EXISTS (SELECT 1 FROM orders WHERE order_id = ?)
+        """, [(*(e.get(f) for f in SHIPMENT_EVENT_FIELDS), e.get("order_id")) for e in events])
+        added = conn.total_changes - before
+        if feed is not None:
+            conn.execute("""
+                INSERT INTO shipment_feeds (feed, cursor, synced_at) VALUES (?, ?, datetime('now'))
+                ON CONFLICT(feed) DO UPDATE SET cursor = excluded.cursor, synced_at = excluded.synced_at
+            """, (feed, cursor))
+        conn.commit()
+    return added
+
+def get_latest_shipment_event(order_id: str) -> Optional[sqlite3.Row]:
+    """Newest tracking event of an order: one probe of idx_shipment_events_order_ts."""
+    rows = _query("SELECT * FROM shipment_events WHERE order_id = ? ORDER BY ts DESC, event_id DESC LIMIT 1",
+                  (order_id,))
+    return rows[0] if rows else None
+
+def list_latest_shipment_events(order_ids: Iterable[str], chunk: int = 500) -> dict[str, sqlite3.Row]:
+    """
+    order_id -> its newest tracking event, for many orders in one query per `chunk` ids;
+    each id costs one probe of idx_shipment_events_order_ts. Orders without events are left out.
+    """
+    ids = list(dict.fromkeys(order_ids))
+    out: dict[str, sqlite3.Row] = {}
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        out.update((r["order_id"], r) for r in _query(f"""
+            SELECT se.* FROM orders o
+            JOIN shipment_events se ON se.event_id = (
+                SELECT event_id FROM shipment_events WHERE order_id = o.order_id
+                ORDER BY ts DESC, event_id DESC LIMIT 1)
+            WHERE o.order_id IN ({','.join('?' * len(part))})
+        """, part))
+    return out
+
+def list_shipment_events(order_id: str, limit: int = 50) -> list[sqlite3.Row]:
+    """An order's tracking events, oldest first (the newest `limit`)."""
+    rows = _query("SELECT * FROM shipment_events WHERE order_id = ? ORDER BY ts DESC, event_id DESC LIMIT ?",
+                  (order_id, int(limit)))
+    return rows[::-1]
+
 # ---------------------------------------------------------------
 # AI CONVERSATIONS
 # ---------------------------------------------------------------
+@turn_cache.writes("conversation:{conversation_id}", "conversations:{email}")
 def add_conversation(conversation_id: str, email: str, conversation_text: str):
-    _exec("""
-        INSERT OR REPLACE INTO ai_conversations (conversation_id, email, conversation_text)
-        VALUES (?, ?, ?)
-    """, (conversation_id, email.lower(), conversation_text))
+    """Store `conversation_text` as the whole, uncompacted conversation (drops any archive)."""
+    with closing(get_connection()) as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO ai_conversations (conversation_id, email, conversation_text)
+            VALUES (?, ?, ?)
+        """, (conversation_id, email.lower(), conversation_text))
+        conn.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        conn.commit()
     print(f"Conversation {conversation_id} for user {email} added/updated.")
 
+@turn_cache.writes("conversation:{conversation_id}", "conversations:{email}")
+def save_conversation_messages(conversation_id: str, email: str, messages: list[dict]) -> int:
+    """
+    Save a session's full message list. Messages already compacted into the archive are
+    not written again: only messages[compacted_count:] is stored. Upserts in place, so
+    started_at and the compaction columns survive. Returns the number of hot messages.
+    """
+    with closing(get_connection()) as conn:
+        row = conn.execute("SELECT compacted_count FROM ai_conversations WHERE conversation_id = ?",
+                           (conversation_id,)).fetchone()
+        hot = messages[(row["compacted_count"] or 0) if row else 0:]
+        conn.execute("""
+            INSERT INTO ai_conversations (conversation_id, email, conversation_text)
+            VALUES (?, ?, ?)
+            ON CONFLICT(conversation_id) DO UPDATE SET
+                email = excluded.email, conversation_text = excluded.conversation_text
+        """, (conversation_id, email.lower(), json.dumps(hot)))
+        conn.commit()
+    return len(hot)
+
 # --- Key setters for Conversations ---
+@turn_cache.writes("conversation:{conversation_id}")
 def set_conversation_ended(conversation_id: str): _exec("UPDATE ai_conversations SET ended_at=datetime('now') WHERE conversation_id=?", (conversation_id,))
+@turn_cache.writes("conversation:{conversation_id}")
 def set_conversation_text(conversation_id: str, text: str): _exec("UPDATE ai_conversations SET conversation_text=? WHERE conversation_id=?", (text, conversation_id))
 
 def list_conversations_for_user(email: str): return _query("SELECT * FROM ai_conversations WHERE email=? ORDER BY started_at DESC", (email.lower(),))
+@turn_cache.reads("conversation:{conversation_id}")
 def get_conversation(conversation_id: int) -> Optional[str]:
     rows = _query("SELECT conversation_text FROM ai_conversations WHERE conversation_id = ?", (conversation_id,))
     if not rows:
@@ -345,6 +1060,155 @@ def get_conversation(conversation_id: int) -> Optional[str]:
     row = rows[0]
     return row["conversation_text"] if "conversation_text" in row.keys() else None
 
+@turn_cache.reads("conversation:{conversation_id}")
+def get_conversation_tail(conversation_id: str, offset: int) -> Optional[sqlite3.Row]:
+    """
+    conversation_text from character `offset` (0-based) onwards, as `tail`, with the
+    conversation's `compacted_count`; None if the conversation is missing.
+    """
+    rows = _query("SELECT substr(conversation_text, ?) AS tail, compacted_count FROM ai_conversations "
+                  "WHERE conversation_id = ?", (int(offset) + 1, conversation_id))
+    return rows[0] if rows else None
+
+@turn_cache.reads("conversation:{conversation_id}")
+def get_compacted_conversation(conversation_id: str) -> Optional[sqlite3.Row]:
+    """Hot messages (conversation_text), rolling_summary, summary_entities and compacted_count."""
+    rows = _query("""
+        SELECT conversation_id, email, started_at, conversation_text, rolling_summary, summary_entities,
+               COALESCE(compacted_count, 0) AS compacted_count
+        FROM ai_conversations WHERE conversation_id = ?
+    """, (conversation_id,))
+    return rows[0] if rows else None
+
+@turn_cache.writes("conversation:{conversation_id}")
+def compact_conversation(conversation_id: str, compacted_count: int, folded: list[dict], hot: list[dict],
+                         rolling_summary: str, summary_entities: dict) -> bool:
+    """
+    Move `folded` (the oldest hot messages) to conversation_archive and keep `hot` in
+    conversation_text, in one transaction. `compacted_count` is the value the caller
+    read; if another writer compacted in between nothing is changed and False is returned.
+    """
+    with closing(get_connection()) as conn:
+        cur = conn.execute("""
+            UPDATE ai_conversations
+            SET conversation_text = ?, rolling_summary = ?, summary_entities = ?, compacted_count = ?
+            WHERE conversation_id = ? AND COALESCE(compacted_count, 0) = ?
+        """, (json.dumps(hot), rolling_summary, json.dumps(summary_entities),
+              compacted_count + len(folded), conversation_id, compacted_count))
+        if cur.rowcount != 1:
+            conn.rollback()
+            return False
+        conn.executemany(
+            "INSERT OR REPLACE INTO conversation_archive (conversation_id, msg_seq, role, content) VALUES (?, ?, ?, ?)",
+            [(conversation_id, compacted_count + i, m.get("role"), m.get("content")) for i, m in enumerate(folded)],
+        )
+        conn.commit()
+    return True
+
+def get_full_conversation(conversation_id: str) -> list[dict]:
+    """Archived plus hot messages, oldest first (read-only; the stored form stays compacted)."""
+    with closing(get_connection()) as conn:
+        row = conn.execute("SELECT conversation_text FROM ai_conversations WHERE conversation_id = ?",
+                           (conversation_id,)).fetchone()
+        if row is None:
+            return []
+        archived = conn.execute(
+            "SELECT role, content FROM conversation_archive WHERE conversation_id = ? ORDER BY msg_seq",
+            (conversation_id,),
+        ).fetchall()
+    try:
+        hot = json.loads(row["conversation_text"] or "[]")
+    except ValueError:
+        hot = [{"role": "assistant", "content": row["conversation_text"]}]
+    return [{"role": r["role"], "content": r["content"]} for r in archived] + (hot if isinstance(hot, list) else [])
+
+@turn_cache.writes("conversation:{conversation_id}")
+def restore_conversation(conversation_id: str) -> bool:
+    """Undo compaction: write archived + hot messages back to conversation_text and clear the summary."""
+    messages = get_full_conversation(conversation_id)
+    with closing(get_connection()) as conn:
+        cur = conn.execute("""
+            UPDATE ai_conversations
+            SET conversation_text = ?, rolling_summary = NULL, summary_entities = NULL, compacted_count = 0
+            WHERE conversation_id = ?
+        """, (json.dumps(messages), conversation_id))
+        conn.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+        conn.commit()
+    return cur.rowcount == 1
+
+def _fts_terms(text: str, max_terms: int = 12) -> list[str]:
+    terms = []
+    for t in re.findall(r"[a-z0-9]+", (text or "").lower()):
+        if len(t) > 1 and t not in terms:
+            terms.append(t)
+    return terms[:max_terms]
+
+def search_customer_history(email: str, query: str, exclude_conversation_id: Optional[str] = None,
+                            limit: int = 5, terms: Optional[list[str]] = None,
+                            archived_before: int = 0) -> list[sqlite3.Row]:
+    """
+    Best-matching messages from the customer's *other* conversations (FTS5, bm25-ranked).
+    `terms` overrides the words taken from `query` (callers drop their own stopwords).
+    Messages of `exclude_conversation_id` with msg_seq < `archived_before` (its compacted
+    turns) are searched too.
+    """
+    terms = terms if terms is not None else _fts_terms(query)
+    if not email or not terms:
+        return []
+    email = email.lower()
+    owner = " ".join(_fts_terms(email, max_terms=20))
+    any_term = " OR ".join('"' + t + '"' for t in terms)
+    match = f'email : "{owner}" AND ({any_term})'
+    return _query("""
+        SELECT m.conversation_id, m.msg_seq, m.role, m.content, c.started_at,
+               snippet(conversation_messages_fts, 0, '', '', '…', 16) AS snippet,
+               bm25(conversation_messages_fts) AS rank
+        FROM conversation_messages_fts
+        JOIN conversation_messages m ON m.message_id = conversation_messages_fts.rowid
+        JOIN ai_conversations c ON c.conversation_id = m.conversation_id
+        WHERE conversation_messages_fts MATCH ?
+          AND m.email = ?
+          AND (m.conversation_id IS NOT ? OR m.msg_seq < ?)
+        ORDER BY rank
+        LIMIT ?
+    """, (match, email, exclude_conversation_id, int(archived_before), int(limit)))
+
+# --- Memory index persistence (see agents/memory_agent.py) ---
+def get_memory_index(conversation_id: str) -> Optional[tuple[sqlite3.Row, list[sqlite3.Row]]]:
+    with closing(get_connection()) as conn:
+        head = conn.execute("SELECT * FROM memory_index WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        if head is None:
+            return None
+        rows = conn.execute(
+            "SELECT * FROM memory_index_msgs WHERE conversation_id = ? ORDER BY idx", (conversation_id,)
+        ).fetchall()
+    return head, rows
+
+def save_memory_index(conversation_id: str, last_start: Optional[int], msg_count: int,
+                      rows: list[tuple], reset: bool = False) -> None:
+    """Append newly indexed messages (idx, role, content, ents, tags, toks) in one transaction."""
+    with closing(get_connection()) as conn:
+        if reset:
+            conn.execute("DELETE FROM memory_index_msgs WHERE conversation_id = ?", (conversation_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO memory_index_msgs (conversation_id, idx, role, content, ents, tags, toks) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(conversation_id, *r) for r in rows],
+        )
+        conn.execute("""
+            INSERT INTO memory_index (conversation_id, last_start, msg_count, updated_at)
+            VALUES (?, ?, ?, datetime('now'))
+            ON CONFLICT(conversation_id) DO UPDATE SET
+                last_start = excluded.last_start, msg_count = excluded.msg_count, updated_at = excluded.updated_at
+        """, (conversation_id, last_start, msg_count))
+        conn.commit()
+
+def delete_memory_index(conversation_id: str) -> None:
+    with closing(get_connection()) as conn:
+        conn.execute("DELETE FROM memory_index_msgs WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM memory_index WHERE conversation_id = ?", (conversation_id,))
+        conn.commit()
+
 
 # ---------------------------------------------------------------
 # Migrations - Handles schema changes for existing databases (Added Address and Unique phone number to users table)
@@ -398,6 +1262,54 @@ def migrate_add_phone_unique_index():
             #non-fatal; log and continue
             print(f"[Migration] Failed to create unique phone index: {e}")
 
+def migrate_add_compaction_columns():
+    """Add the conversation compaction columns to ai_conversations if they don't exist."""
+    with closing(get_connection()) as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(ai_conversations)").fetchall()]
+        added = False
+        for name, decl in (("rolling_summary", "TEXT"), ("summary_entities", "TEXT"),
+                           ("compacted_count", "INTEGER DEFAULT 0")):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE ai_conversations ADD COLUMN {name} {decl}")
+                added = True
+        conn.commit()
+        if added:
+            print("[Migration] Added compaction columns to ai_conversations.")
+
+def migrate_add_return_deadline_columns():
+    """Add the precomputed return-window columns to orders, and their index, if they don't exist."""
+    with closing(get_connection()) as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(orders)").fetchall()]
+        added = False
+        for name in ("item_category", "return_deadline", "warranty_deadline", "deadlines_version"):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE orders ADD COLUMN {name} TEXT")
+                added = True
+        # list_orders_return_window_closing() is a range scan on this
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_return_deadline ON orders(return_deadline)")
+        conn.commit()
+        if added:
+            print("[Migration] Added return deadline columns to orders.")
+
+def migrate_backfill_conversation_messages():
+    """Populate conversation_messages (and its FTS index) for conversations stored before
+    the sync triggers existed. Re-saving every row lets the triggers do the work."""
+    with closing(get_connection()) as conn:
+        try:
+            missing = conn.execute("""
+                SELECT conversation_id, conversation_text FROM ai_conversations c
+                WHERE conversation_text IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM conversation_messages m WHERE m.conversation_id = c.conversation_id)
+            """).fetchall()
+            for row in missing:
+                conn.execute("UPDATE ai_conversations SET conversation_text = ? WHERE conversation_id = ?",
+                             (row["conversation_text"], row["conversation_id"]))
+            conn.commit()
+            if missing:
+                print(f"[Migration] Indexed {len(missing)} conversations for history search.")
+        except Exception as e:
+            print(f"[Migration] Failed to backfill conversation_messages: {e}")
+
 # ---------------------------------------------------------------
 # Entrypoint
 # ---------------------------------------------------------------
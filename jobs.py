@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Maintenance jobs.
+
+    python jobs.py backfill-sku-categories              # classify SKUs without a category
+    python jobs.py backfill-sku-categories --reclassify # re-run the classifier over every SKU
+    python jobs.py send-notifications                   # deliver queued customer notifications
+    python jobs.py open-returns --days 14               # returns still open after N days
+    python jobs.py refresh-return-deadlines             # nightly: orders.return_deadline / warranty_deadline
+    python jobs.py return-window-closing --days 7       # orders whose return window closes soon
+    python jobs.py sync-shipments                       # ingest new carrier tracking scans
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime, timedelta, timezone
+
+import carrier_sim
+import db
+from agents import policy_rules
+from agents.policy_rules import classify_item
+
+
+# ------------ SKU categories ------------
+def backfill_sku_categories(batch: int = 1000, reclassify: bool = False) -> int:
+    """
+    Classify the SKUs of existing order_items into sku_categories, `batch` SKUs per
+    transaction. With reclassify every SKU is re-run (after the keywords change);
+    unchanged rows are not rewritten. Returns the number of SKUs processed.
+    """
+    done, after = 0, ""
+    while True:
+        rows = db.list_item_skus(after=after, limit=batch, unclassified_only=not reclassify)
+        if not rows:
+            break
+        db.save_sku_categories((r["sku"], r["name"], classify_item(r["sku"], r["name"])) for r in rows)
+        done += len(rows)
+        after = rows[-1]["sku"]
+    print(f"[JOBS] sku categories: {done} SKUs classified")
+    return done
+
+
+# ------------ Return deadlines ------------
+def refresh_return_deadlines(batch: int = 1000, full: bool = False) -> int:
+    """
+    Store item_category, return_deadline and warranty_deadline on every order whose
+    deadlines are missing, stale (items added) or from an older rules table; with full,
+    on every order. Meant to run nightly. Returns the number of orders updated.
+    """
+    rules = policy_rules.load_rules()
+    done, after = 0, ""
+    while True:
+        orders = db.list_orders_needing_deadlines(rules.version, after=after, limit=batch, all_orders=full)
+        if not orders:
+            break
+        items = db.list_items_for_orders([o["order_id"] for o in orders])
+        rows = []
+        for o in orders:
+            category = policy_rules.categorize_items(
+                (r["sku"], r["name"], r["category"]) for r in items[o["order_id"]])
+            rows.append((category, *policy_rules.deadlines(category, o["created_at"], rules), rules.version,
+                         o["order_id"]))
+        db.save_order_deadlines(rows)
+        done += len(rows)
+        after = orders[-1]["order_id"]
+    print(f"[JOBS] return deadlines: {done} orders updated (rules {rules.version})")
+    return done
+
+
+# ------------ Notification outbox ------------
+RETRY_BACKOFF_S = (60, 300, 1800, 7200)     # wait before attempt 2, 3, ...; then give up
+
+def send_notifications(limit: int = 50) -> dict[str, int]:
+    """
+    Deliver due notification_outbox rows through message_agent. A failed send is retried
+    with backoff and marked 'failed' once RETRY_BACKOFF_S is exhausted.
+    """
+    from agents import message_agent as msg      # sendgrid / vonage clients, only needed here
+
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+    for n in db.list_due_notifications(limit):
+        try:
+            out = msg.message_agent(json.loads(n["payload"] or "{}"))
+            ok = (out.get("confidence") or 0) >= 0.85
+            error = "" if ok else (out.get("output") or "not sent")
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        if ok:
+            db.mark_notification_sent(n["notification_id"])
+            counts["sent"] += 1
+            continue
+        attempt = n["attempts"]
+        retry_in = RETRY_BACKOFF_S[attempt] if attempt < len(RETRY_BACKOFF_S) else None
+        db.mark_notification_failed(n["notification_id"], error, retry_in)
+        counts["retry" if retry_in is not None else "failed"] += 1
+    print(f"[JOBS] notifications: {counts}")
+    return counts
+
+
+# ------------ Shipment tracking ------------
+TRACKED_STATUSES = ("shipped", "in transit", "out for delivery", "delivered")
+SHIPMENT_FEED = "carrier_sim"
+SYNC_LOOKBACK = timedelta(hours=48)      # re-poll overlap for late scans; re-ingesting is a no-op
+
+def sync_shipments(until: str | None = None, batch: int = 1000) -> int:
+    """
+    Poll the carrier feed (carrier_sim) for scans since the feed's cursor, minus
+    SYNC_LOOKBACK, up to `until` (default now, UTC) for every order in TRACKED_STATUSES,
+    and store them in shipment_events. The cursor moves with the last batch's insert.
+    Simulated histories start from orders.created_at, which never changes (updated_at
+    moves with every status or address change and would shift every scan time).
+    Returns the number of new events.
+    """
+    until = until or datetime.now(timezone.utc).strftime(carrier_sim.DATE_FMT)
+    cursor = db.get_shipment_feed_cursor(SHIPMENT_FEED)
+    since = None
+    if cursor:
+        since = (datetime.strptime(cursor, carrier_sim.DATE_FMT) - SYNC_LOOKBACK).strftime(carrier_sim.DATE_FMT)
+    added, shipments, after = 0, 0, ""
+    while True:
+        orders = db.list_orders_by_status(TRACKED_STATUSES, after=after, limit=batch)
+        last = len(orders) < batch
+        events = carrier_sim.poll(
+            (carrier_sim.Shipment(o["order_id"], o["created_at"],
+                                  carrier_sim.destination_of(o["shipping_address"])) for o in orders),
+            since, until)
+        added += db.ingest_shipment_events(events, feed=SHIPMENT_FEED if last else None, cursor=until)
+        shipments += len(orders)
+        if last:
+            break
+        after = orders[-1]["order_id"]
+    print(f"[JOBS] shipments: {added} new tracking events for {shipments} shipments (up to {until})")
+    return added
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="job", required=True)
+    p = sub.add_parser("backfill-sku-categories")
+    p.add_argument("--batch", type=int, default=1000)
+    p.add_argument("--reclassify", action="store_true")
+    p = sub.add_parser("send-notifications")
+    p.add_argument("--limit", type=int, default=50)
+    p = sub.add_parser("open-returns")
+    p.add_argument("--days", type=float, default=14)
+    p = sub.add_parser("refresh-return-deadlines")
+    p.add_argument("--batch", type=int, default=1000)
+    p.add_argument("--full", action="store_true")
+    p = sub.add_parser("return-window-closing")
+    p.add_argument("--days", type=float, default=7)
+    p = sub.add_parser("sync-shipments")
+    p.add_argument("--until", help="poll up to this UTC time ('YYYY-MM-DD HH:MM:SS'; default now)")
+    args = ap.parse_args()
+
+    db.init_db()
+    if args.job == "backfill-sku-categories":
+        backfill_sku_categories(batch=args.batch, reclassify=args.reclassify)
+    elif args.job == "send-notifications":
+        send_notifications(limit=args.limit)
+    elif args.job == "open-returns":
+        for r in db.list_open_returns_older_than(args.days):
+            print(f"{r['rma_id']}  {r['order_id']}  {r['state']:<10}  {r['created_at']}  {r['email']}")
+    elif args.job == "refresh-return-deadlines":
+        refresh_return_deadlines(batch=args.batch, full=args.full)
+    elif args.job == "return-window-closing":
+        for o in db.list_orders_return_window_closing(args.days):
+            print(f"{o['order_id']}  {o['item_category'] or '-':<30}  closes {o['return_deadline']}  {o['email']}")
+    elif args.job == "sync-shipments":
+        sync_shipments(until=args.until)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,8 @@ from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 import os
 import re
+import time
 from difflib import SequenceMatcher
-from pathlib import Path
 
 # --- Specialist agents ---
 from agents.order_agent import order_agent
@@ -16,26 +16,49 @@ from agents.return_agent import return_agent
 from agents.live_agent_router import live_agent_router
 from agents.memory_agent import memory_agent
 from agents.policy_agent import policy_agent
+from agents.entity_extractor import extract as extract_entities
+from agents import policy_index
 
 # --- General LLM agent ---
-from agents.general_agent import general_agent, model
+from agents.general_agent import general_agent, model, model_fast
+from agents import prompt_builder, llm_runtime, turn_cache
+from agents.prompt_builder import PromptBuilder
 
 LAST_INTENT_BY_THREAD: dict[str, str] = {}
 
+# Confidence assigned to LLM-classified intents (keyword hits are 1.0 / fuzzy score)
+LLM_LABEL_CONFIDENCE = 0.8
+LLM_OTHER_CONFIDENCE = 0.6
+
+# Classification only needs the gist of the message; a long paste is clipped
+CLASSIFY_USER_BUDGET = 256
+
+INTENT_LABELS = (
+    "['check order','shipping status','check payment','billing','change password','change address',"
+    "'change phone number','change full name','refund','live agent','memory','policy','other']"
+)
+
 class AgentState(TypedDict, total=False):
     input: str
     email: Optional[str]
+    conversation_id: Optional[str]
+    entities: Optional[dict]
     intent: Optional[str]
+    intent_confidence: Optional[float]
     reasoning: Optional[str]
     tool_calls: List[str]
     tool_results: List[str]
     output: Optional[str]
     routing_msg: Optional[str]
+    orders_cursor: Optional[str]   # order_agent "show more orders" paging; kept across turns by the checkpointer
 
     # memory fields
     messages: Optional[List[dict]]
     context_summary: Optional[str]
     context_refs: Optional[List[str]]
+    history_refs: Optional[List[str]]
+    conversation_summary: Optional[str]
+    memory: Optional[dict]
     preface: Optional[str]
     return_policy: Optional[str]
 
@@ -45,7 +68,8 @@ class AgentState(TypedDict, total=False):
 # ============================================================
 
 INTENT_KEYWORDS = {
-    "check order": ["check order", "my order", "track order", "order status"],
+    "check order": ["check order", "my order", "track order", "order status",
+                    "more orders", "older orders"],
     "change shipping address": ["change shipping address", "update shipping address", "shipping address"], # checked before "change address"
     "shipping status": ["shipping", "delivery", "where is my package", "track shipping"],
     "billing": ["billing", "charge", "invoice"],
@@ -87,7 +111,8 @@ def _normalize(text: str) -> str:
 
     return t
 
-def detect_intent(text: Optional[str]) -> Optional[str]:
+def detect_intent_with_score(text: Optional[str]) -> tuple[Optional[str], float]:
+    """Keyword intent plus a confidence: 1.0 for an exact phrase, the similarity for a fuzzy match."""
     t_raw = text or ""
     t_norm = _normalize(t_raw)
     words = t_norm.split()
@@ -101,7 +126,7 @@ def detect_intent(text: Optional[str]) -> Optional[str]:
 
             # returns if exact string is matched
             if k_norm and k_norm in t_norm:
-                return intent
+                return intent, 1.0
 
             # Typo detection: Fuzzy logic matches against each word in the user input
             for w in words:
@@ -115,9 +140,13 @@ def detect_intent(text: Optional[str]) -> Optional[str]:
     # Only trusts fuzzy result if similarity is high enough ******TUNING NEEDED******
     if best_score >= 0.75:
         print(f"[SUPERVISOR] Fuzzy intent match: {best_intent} (score={best_score:.2f})")
-        return best_intent
+        return best_intent, best_score
+
+    return None, 0.0
 
-    return None
+
+def detect_intent(text: Optional[str]) -> Optional[str]:
+    return detect_intent_with_score(text)[0]
 
 
 def supervisor(state: AgentState):
@@ -125,10 +154,18 @@ def supervisor(state: AgentState):
     text = state["input"]
     print(f"[SUPERVISOR] User Input: {text}")
 
+    # --------------------------------------------------------
+    # Extract entities once; every agent reuses state["entities"]
+    # --------------------------------------------------------
+    state["entities"] = extract_entities(text)
+    found = {k: v for k, v in state["entities"].items() if v}
+    if found:
+        print(f"[SUPERVISOR] Entities: {found}")
+
     # --------------------------------------------------------
     # Detect intent (keyword → LLM fallback)
     # --------------------------------------------------------
-    intent = detect_intent(text)
+    intent, intent_confidence = detect_intent_with_score(text)
 
     if not intent:
         try:
@@ -139,13 +176,25 @@ def supervisor(state: AgentState):
             if prev_intent:
                 context_info = f"Previous intent was: {prev_intent}. "
             
-            resp = model.invoke(
-                "Classify the user's intent as one of: "
-                "['check order','shipping status','check payment','billing','change password','change address',"
-                "'change phone number','change full name','refund','live agent','memory','policy','other'].\n"
-                "If user is already in a refund/return context and provides an order ID, classify as 'other'.\n"
-                f"{context_info}User: {text}\nReturn just the label."
+            builder = PromptBuilder("supervisor.classify", separator="\n")
+            builder.add(
+                "system",
+                f"Classify the user's intent as one of: {INTENT_LABELS}.\n"
+                "If user is already in a refund/return context and provides an order ID, classify as 'other'.",
+                required=True,
+            )
+            builder.add("memory", context_info)
+            builder.add("user", f"User: {text}", budget=CLASSIFY_USER_BUDGET, keep="both", required=True)
+            builder.add("format", "Return just the label.", kind="system", required=True)
+            built = builder.build()
+
+            start = time.perf_counter()
+            resp = llm_runtime.invoke(
+                model, built.text,
+                hedge_model=model_fast,
+                deadline_s=llm_runtime.CALL_DEADLINE_S,
             )
+            prompt_builder.record(built, time.perf_counter() - start)
             label = (getattr(resp, "content", None) or str(resp) or "").strip().lower()
 
             mapping = {
@@ -167,9 +216,12 @@ def supervisor(state: AgentState):
                 "policy": "policy",
             }
             intent = mapping.get(label, "other")
+            # LLM labels are trusted less than keyword hits; "other" is the least certain
+            intent_confidence = LLM_LABEL_CONFIDENCE if label in mapping else LLM_OTHER_CONFIDENCE
 
         except Exception:
             intent = "other"
+            intent_confidence = 0.0
             
 ##################################################################
     # --------------------------------------------------------
@@ -199,17 +251,17 @@ def supervisor(state: AgentState):
 ##################################################################
 
     state["intent"] = intent
+    state["intent_confidence"] = intent_confidence
 
 
     # --------------------------------------------------------
-    # Inject return_policy.txt for policy_agent
+    # Inject return_policy.txt for policy_agent (parsed + indexed once, re-read only when the file changes)
     # --------------------------------------------------------
     if intent == "policy":
-        policy_path = Path("return_policy.txt")
-        if policy_path.exists():
-            state["return_policy"] = policy_path.read_text()
+        try:
+            state["return_policy"] = policy_index.get_index().text
             print("[SUPERVISOR] return_policy.txt added into context.")
-        else:
+        except OSError:
             print("[SUPERVISOR] return_policy.txt NOT FOUND!")
 
 
@@ -231,11 +283,21 @@ def supervisor(state: AgentState):
     if state.get("context_summary"):
         preface += f"Context Summary: {state['context_summary']}\n"
 
+    if state.get("conversation_summary"):
+        # last lines of the rolling summary of this conversation's compacted turns
+        preface += "Earlier in this conversation:\n"
+        preface += "\n".join(state["conversation_summary"].splitlines()[-3:]) + "\n"
+
     if state.get("context_refs"):
         preface += "Relevant recent messages:\n"
         for r in state["context_refs"][:3]:
             preface += f"- {r}\n"
 
+    if state.get("history_refs"):
+        preface += "From earlier conversations with this customer:\n"
+        for r in state["history_refs"][:2]:
+            preface += f"- {r}\n"
+
     if preface:
         state["preface"] = preface
         print("[SUPERVISOR] Preface added to state.")
@@ -349,8 +411,11 @@ def ask_agent_events(query: str, thread_id: str = "default", email: str | None =
         "routing_msg": None,
     }
 
-    for s in app.stream(state, config={"configurable": {"thread_id": thread_id}}, stream_mode="values"):
-        if s.get("routing_msg"):
-            yield ("routing", s["routing_msg"])
-        if s.get("output"):
-            yield ("output", s["output"])
\ No newline at end of file
+    # one turn cache per graph run: repeated DB reads within the turn are served from memory
+    with turn_cache.turn(f"thread {thread_id}") as cache:
+        for s in app.stream(state, config={"configurable": {"thread_id": thread_id}}, stream_mode="values"):
+            if s.get("routing_msg"):
+                yield ("routing", s["routing_msg"])
+            if s.get("output"):
+                yield ("output", s["output"])
+    yield ("trace", cache.summary())
\ No newline at end of file
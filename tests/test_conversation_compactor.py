@@ -0,0 +1,82 @@
+import json
+
+import pytest
+import db
+from agents import conversation_compactor as compactor
+from agents import memory_agent as mem
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    monkeypatch.setattr(compactor, "COMPACT_AFTER", 6)
+    monkeypatch.setattr(compactor, "KEEP_RECENT", 2)
+    db.init_db()
+    mem.reset_index()
+    yield
+    mem.reset_index()
+
+def _turns(n, start=0):
+    out = []
+    for i in range(start, start + n):
+        if i % 2 == 0:
+            out.append({"role": "user", "content": f"where is my refund for ORD_{1000 + i}"})
+        else:
+            out.append({"role": "assistant", "content": f"checking reply {i}"})
+    return out
+
+def _seqs(conversation_id):
+    return [r["msg_seq"] for r in db._query(
+        "SELECT msg_seq FROM conversation_messages WHERE conversation_id = ? ORDER BY msg_seq", (conversation_id,))]
+
+
+def test_compaction_folds_old_turns_and_keeps_recent(temp_db):
+    msgs = _turns(6)
+    db.save_conversation_messages("c1", "demo@example.com", msgs)
+    assert compactor.maybe_compact("c1") is False      # not past the threshold yet
+
+    msgs += _turns(2, start=6)
+    db.save_conversation_messages("c1", "demo@example.com", msgs)
+    assert compactor.maybe_compact("c1") is True
+
+    row = db.get_compacted_conversation("c1")
+    assert row["compacted_count"] == 6
+    assert json.loads(row["conversation_text"]) == msgs[-2:]
+    assert "ORD_1004" in row["rolling_summary"]
+    assert json.loads(row["summary_entities"])["orders"] == ["ORD_1000", "ORD_1002", "ORD_1004"]
+    # archived turns stay indexed for search, with global msg_seq
+    assert _seqs("c1") == list(range(8))
+
+    # the app keeps re-saving its full list; only the hot part is written
+    msgs += _turns(1, start=8)
+    assert db.save_conversation_messages("c1", "demo@example.com", msgs) == 3
+    assert json.loads(db.get_compacted_conversation("c1")["conversation_text"]) == msgs[6:]
+    assert _seqs("c1") == list(range(9))
+
+def test_restore_conversation_undoes_compaction(temp_db):
+    msgs = _turns(8)
+    db.save_conversation_messages("c1", "demo@example.com", msgs)
+    compactor.maybe_compact("c1")
+    assert db.get_full_conversation("c1") == msgs
+
+    assert db.restore_conversation("c1") is True
+    row = db.get_compacted_conversation("c1")
+    assert json.loads(row["conversation_text"]) == msgs
+    assert row["compacted_count"] == 0 and row["rolling_summary"] is None
+    assert db._query("SELECT * FROM conversation_archive") == []
+    assert _seqs("c1") == list(range(8))
+
+def test_memory_agent_reads_compacted_form(temp_db):
+    msgs = _turns(8)
+    db.save_conversation_messages("c1", "demo@example.com", msgs)
+    state = mem.memory_agent({"conversation_id": "c1", "email": "demo@example.com", "input": "refund"})
+    assert len(mem.get_index("c1").msgs) == 8
+
+    compactor.maybe_compact("c1")
+    state = mem.memory_agent({"conversation_id": "c1", "email": "demo@example.com", "input": "ORD_1000 refund"})
+    idx = mem.get_index("c1")
+    assert [m.content for m in idx.msgs] == [m["content"] for m in msgs[-2:]]
+    assert "ORD_1000" in state["memory"]["entities"]["orders"]      # seeded from summary_entities
+    assert "ORD_1002" in state["conversation_summary"]
+    # compacted turns of the same conversation are found through history search
+    assert any("ORD_1000" in r or "ord_1000" in r.lower() for r in state["history_refs"])
@@ -60,3 +60,158 @@ def test_set_user_address_line_invalid():
     user = db.get_user(email)
     assert user is None
 
+
+
+# ---------- conversation_messages / FTS sync ----------
+import json
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.init_db()
+    yield
+
+def _conv_rows(conversation_id):
+    return [tuple(r) for r in db._query(
+        "SELECT msg_seq, content FROM conversation_messages WHERE conversation_id = ? ORDER BY msg_seq",
+        (conversation_id,))]
+
+def test_conversation_messages_follow_appends_and_rewrites(temp_db):
+    msgs = [{"role": "user", "content": "My keyboard ORD_777 is broken"}]
+    db.add_conversation("c1", "demo@example.com", json.dumps(msgs))
+    msgs.append({"role": "assistant", "content": "Sorry, I started a return."})
+    db.add_conversation("c1", "demo@example.com", json.dumps(msgs))
+    assert _conv_rows("c1") == [(0, "My keyboard ORD_777 is broken"), (1, "Sorry, I started a return.")]
+
+    db.add_conversation("c1", "demo@example.com", json.dumps([{"role": "user", "content": "rewritten"}]))
+    assert _conv_rows("c1") == [(0, "rewritten")]
+
+def test_search_customer_history_is_scoped_to_email(temp_db):
+    db.add_conversation("old", "demo@example.com", json.dumps([{"role": "user", "content": "keyboard keys stuck"}]))
+    db.add_conversation("other", "panda@example.com", json.dumps([{"role": "user", "content": "keyboard arrived"}]))
+    rows = db.search_customer_history("demo@example.com", "my keyboard again", exclude_conversation_id="new")
+    assert [r["conversation_id"] for r in rows] == ["old"]
+    assert db.search_customer_history("demo@example.com", "keyboard", exclude_conversation_id="old") == []
+
+def test_list_items_for_orders_batches_in_query(temp_db):
+    items = db.list_items_for_orders(["ord_001", "ord_missing", "ord_001"], chunk=1)
+    assert list(items) == ["ord_001", "ord_missing"]
+    assert [r["sku"] for r in items["ord_001"]] == [r["sku"] for r in db._query(
+        "SELECT sku FROM order_items WHERE order_id = 'ord_001' ORDER BY order_item_id")]
+    assert items["ord_missing"] == []
+
+def test_get_order_for_user_is_scoped_to_email(temp_db):
+    owner = db._query("SELECT email FROM orders WHERE order_id = 'ord_001'")[0]["email"]
+    assert db.get_order_for_user(owner.upper(), "ord_001")["order_id"] == "ord_001"
+    assert db.get_order_for_user("nobody@example.com", "ord_001") is None
+    assert db.get_order_for_user(owner, "ord_missing") is None
+
+def test_add_order_item_records_sku_category(temp_db):
+    db.add_order_item("ord_001", "SKU-900", "Wireless Headphones", 1, 5999)
+    rows = {r["sku"]: r["category"] for r in db.get_order_item_categories("ord_001")}
+    assert rows["SKU-900"] == "Electronics"
+    assert db._query("SELECT category FROM sku_categories WHERE sku = 'SKU-900'")[0]["category"] == "Electronics"
+
+def test_backfill_sku_categories_classifies_existing_items(temp_db):
+    import jobs
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO order_items (order_id, sku, name, qty, unit_price_cents, line_total_cents) "
+                     "VALUES ('ord_001', 'SKU-901', 'Trail Boots', 1, 100, 100)")
+    assert [r["sku"] for r in db.list_item_skus()] == ["SKU-901"]
+    assert jobs.backfill_sku_categories(batch=1) == 1
+    assert db.list_item_skus() == []
+    assert {r["sku"]: r["category"] for r in db.list_items_for_orders(["ord_001"])["ord_001"]}["SKU-901"] == "Footwear"
+    # reclassify walks every SKU in keyset batches
+    assert jobs.backfill_sku_categories(batch=2, reclassify=True) == 5
+
+# ---------- returns / notification outbox ----------
+def test_create_return_is_idempotent_and_queues_notification(temp_db):
+    ret, created = db.create_return("ord_001", "demo@example.com", [{"sku": "SKU-001"}], reason="defective item",
+                                    eligible=True, decision_reason="within 60 days", decided_by="rules",
+                                    state="approved")
+    again, created_again = db.create_return("ord_001", "demo@example.com", [], reason="other")
+    assert created and not created_again and again["rma_id"] == ret["rma_id"]
+    assert db._query("SELECT status FROM orders WHERE order_id = 'ord_001'")[0]["status"] == "return requested"
+    outbox = db.list_due_notifications()
+    assert [(n["email"], n["event_type"]) for n in outbox] == [("demo@example.com", "return_approved")]
+    assert json.loads(outbox[0]["payload"])["order_id"] == "ord_001"
+
+def test_return_transitions_follow_state_machine(temp_db):
+    ret, _ = db.create_return("ord_001", "demo@example.com", [])
+    rma = ret["rma_id"]
+    assert db.transition_return(rma, "refunded") is False             # not from requested
+    assert db.transition_return(rma, "approved")
+    assert db.transition_return(rma, "received", "scanned at dock")
+    assert db.transition_return(rma, "refunded") and db.transition_return(rma, "closed")
+    assert db.transition_return(rma, "approved") is False             # closed is final
+    assert [(e["from_state"], e["to_state"]) for e in db.list_return_events(rma)] == [
+        (None, "requested"), ("requested", "approved"), ("approved", "received"),
+        ("received", "refunded"), ("refunded", "closed")]
+    # a closed return frees the order for a new one
+    assert db.create_return("ord_001", "demo@example.com", [])[1] is True
+
+def test_list_open_returns_older_than_uses_state_index(temp_db):
+    old, _ = db.create_return("ord_001", "demo@example.com", [])
+    db.create_return("ord_201", "panda@example.com", [])
+    done, _ = db.create_return("ord_202", "alice.johnson@example.com", [])
+    db.transition_return(done["rma_id"], "cancelled")
+    with db.get_connection() as conn:
+        conn.execute("UPDATE returns SET created_at = datetime('now', '-20 days') WHERE rma_id IN (?, ?)",
+                     (old["rma_id"], done["rma_id"]))
+    assert [r["rma_id"] for r in db.list_open_returns_older_than(14)] == [old["rma_id"]]
+    plan = " ".join(r["detail"] for r in db._query(
+        "EXPLAIN QUERY PLAN SELECT * FROM returns WHERE state IN ('requested', 'approved') "
+        "AND created_at < datetime('now', '-14 days')"))
+    assert "idx_returns_state_created" in plan
+
+def test_list_orders_page_walks_keyset_cursor(temp_db):
+    for i in range(5):
+        db.add_order(f"ord_9{i}", "demo@example.com", subtotal_cents=100 * i)
+    with db.get_connection() as conn:
+        conn.execute("UPDATE orders SET created_at = '2025-01-01 00:00:00' WHERE order_id = 'ord_001'")
+        conn.execute("UPDATE orders SET created_at = '2025-06-01 00:00:00' WHERE order_id LIKE 'ord_9%'")
+    seen, cursor = [], None
+    while True:
+        rows, cursor = db.list_orders_page("DEMO@example.com", limit=2, cursor=cursor, columns=("status",))
+        seen += [r["order_id"] for r in rows]
+        assert set(rows[0].keys()) == {"order_id", "created_at", "status"}
+        if cursor is None:
+            break
+    # same created_at: order_id breaks the tie, newest (largest) first; the oldest order comes last
+    assert seen == ["ord_94", "ord_93", "ord_92", "ord_91", "ord_90", "ord_001"]
+    assert db.get_latest_order("demo@example.com")["order_id"] == "ord_94"
+    assert db.get_latest_order("nobody@example.com") is None
+    with pytest.raises(ValueError):
+        db.list_orders_page("demo@example.com", columns=("status; DROP TABLE orders",))
+    plan = " ".join(r["detail"] for r in db._query(
+        "EXPLAIN QUERY PLAN SELECT order_id FROM orders WHERE email = ? AND (created_at, order_id) < (?, ?) "
+        "ORDER BY created_at DESC, order_id DESC LIMIT 3", ("demo@example.com", "2025-06-01", "ord_93")))
+    assert "idx_orders_email_created_id" in plan and "TEMP B-TREE" not in plan
+
+def test_get_orders_full_batches_items_and_payments(temp_db, monkeypatch):
+    db.add_order_item("ord_201", "SKU-202B", "Mouse Pad", 1, 999)
+    statements = []
+    real = db.get_connection
+
+    def traced():
+        conn = real()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(db, "get_connection", traced)
+    full = db.get_orders_full(["ord_201", "ord_missing", "ord_001", "ord_202", "ord_203"])
+    assert sum(q.lstrip().upper().startswith("SELECT") for q in statements) == 3    # not 1 + 2 per order
+    assert list(full) == ["ord_201", "ord_001", "ord_202", "ord_203"]
+    assert [i["name"] for i in full["ord_201"]["items"]] == ["Wireless Mouse", "Mouse Pad"]
+    assert full["ord_201"]["payments"][0]["payment_id"] == "pay_201"
+    assert full["ord_001"]["items"][0]["category"] is not None
+    assert db.get_order_full("ord_001", email="panda@example.com") is None
+    assert db.get_order_full("ord_001", email="DEMO@example.com")["payments"][0]["amount_cents"] == 1080
+
+def test_get_orders_by_ids_and_open_orders(temp_db):
+    found = db.get_orders_by_ids(["ord_203", "ord_missing", "ord_001"])
+    assert list(found) == ["ord_203", "ord_001"]
+    assert list(db.get_orders_by_ids(["ord_203", "ord_001"], email="bob.smith@example.com")) == ["ord_203"]
+    db.add_order("ord_204", "bob.smith@example.com", status="delivered")
+    assert [o["order_id"] for o in db.list_open_orders_for_user("Bob.Smith@example.com")] == ["ord_203"]
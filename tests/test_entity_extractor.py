@@ -0,0 +1,39 @@
+from agents.entity_extractor import extract, get_entities, first, phone_digits
+
+
+def test_extracts_every_kind_in_one_pass():
+    ents = extract(
+        "Order ORD_12345 paid with PAY_98765 on 2025-10-01. Email me at a.b@example.com, "
+        "call (770) 555-1234, ship to 12 Oak St, Austin, TX 78701"
+    )
+    assert ents["orders"] == ["ORD_12345"]
+    assert ents["payments"] == ["PAY_98765"]
+    assert ents["dates"] == ["2025-10-01"]
+    assert ents["emails"] == ["a.b@example.com"]
+    assert ents["phones"] == ["(770) 555-1234"]
+    assert ents["addresses"] == ["12 Oak St, Austin, TX 78701"]
+
+def test_order_id_forms():
+    assert extract("ord_001 and ORD-W-001 and ORD123")["orders"] == ["ord_001", "ORD-W-001", "ORD123"]
+    assert extract("return ord_electronics_40d please")["orders"] == ["ord_electronics_40d"]
+    # an id needs a digit; plain words are not orders
+    assert extract("ord_abc")["orders"] == []
+
+def test_order_id_before_address_is_not_swallowed():
+    ents = extract("ord_100 789 New St, Boston, MA 02118")
+    assert ents["orders"] == ["ord_100"]
+    assert ents["addresses"] == ["789 New St, Boston, MA 02118"]
+
+def test_get_entities_reuses_supervisor_result():
+    state = {"input": "ord_100", "entities": {"orders": ["ord_777"]}}
+    assert first(state, "orders") == "ord_777"
+    fresh = {"input": "track ord_100"}
+    assert first(fresh, "orders") == "ord_100"
+    assert fresh["entities"] is get_entities(fresh)
+
+def test_phone_keeps_country_code_and_parens():
+    assert extract("call +1 770-555-1234")["phones"] == ["+1 770-555-1234"]
+
+def test_phone_digits_drops_country_code():
+    assert phone_digits("+1 (770) 555-1234") == "7705551234"
+    assert phone_digits("770.555.1234") == "7705551234"
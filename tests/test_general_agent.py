@@ -9,6 +9,7 @@ class DummyModel:
 
 def test_general_agent_basic(monkeypatch):
     monkeypatch.setattr("agents.general_agent.model", DummyModel())
+    monkeypatch.setattr("agents.general_agent.model_fast", DummyModel())
     state = AgentState(input="Hello, what are your hours?", email="user@example.com")
     result = general_agent(state)
     assert "test response" in result["output"].lower()
@@ -20,6 +21,7 @@ def test_general_agent_error(monkeypatch):
         def invoke(self, prompt):
             raise RuntimeError("Model error!")
     monkeypatch.setattr("agents.general_agent.model", ErrorModel())
+    monkeypatch.setattr("agents.general_agent.model_fast", ErrorModel())
     state = AgentState(input="Hi", email="user@example.com")
     result = general_agent(state)
     assert "went wrong" in result["output"].lower()
@@ -27,12 +29,28 @@ def test_general_agent_error(monkeypatch):
 
 def test_general_agent_preface(monkeypatch):
     monkeypatch.setattr("agents.general_agent.model", DummyModel())
+    monkeypatch.setattr("agents.general_agent.model_fast", DummyModel())
     state = AgentState(input="Can you help?", preface="Previous: User asked about shipping.")
     result = general_agent(state)
     assert "test response" in result["output"].lower()
 
 def test_general_agent_context_summary(monkeypatch):
     monkeypatch.setattr("agents.general_agent.model", DummyModel())
+    monkeypatch.setattr("agents.general_agent.model_fast", DummyModel())
     state = AgentState(input="Can you help?", context_summary="User wants help with billing.")
     result = general_agent(state)
     assert "test response" in result["output"].lower()
+
+def test_general_agent_routes_greeting_to_fast_model(monkeypatch):
+    class Named(DummyModel):
+        def __init__(self, name):
+            self.name = name
+        def invoke(self, prompt):
+            class Resp:
+                content = f"from {self.name}"
+            return Resp()
+    monkeypatch.setattr("agents.general_agent.model", Named("primary"))
+    monkeypatch.setattr("agents.general_agent.model_fast", Named("fast"))
+    result = general_agent(AgentState(input="Hi there!"))
+    assert result["output"] == "from fast"
+    assert any("model=fast" in c for c in result["tool_calls"])
@@ -0,0 +1,112 @@
+import sys
+import types
+
+import pytest
+
+import agents
+import db
+import jobs
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.init_db()
+    yield
+
+@pytest.fixture
+def sender(monkeypatch):
+    """Replaces agents.message_agent; `sender.fail` makes every send fail."""
+    fake = types.ModuleType("agents.message_agent")
+    fake.sent, fake.fail = [], False
+
+    def message_agent(state):
+        if fake.fail:
+            return {**state, "output": "Email failed: timeout", "confidence": 0.2}
+        fake.sent.append(state)
+        return {**state, "output": "Email sent.", "confidence": 0.9}
+
+    fake.message_agent = message_agent
+    monkeypatch.setitem(sys.modules, "agents.message_agent", fake)
+    monkeypatch.setattr(agents, "message_agent", fake, raising=False)
+    return fake
+
+
+def test_send_notifications_delivers_queued_rows_once(temp_db, sender):
+    db.create_return("ord_001", "demo@example.com", [])
+    assert jobs.send_notifications() == {"sent": 1, "retry": 0, "failed": 0}
+    assert sender.sent[0]["email"] == "demo@example.com" and sender.sent[0]["event_type"] == "return_requested"
+    assert jobs.send_notifications() == {"sent": 0, "retry": 0, "failed": 0}
+
+def test_send_notifications_backs_off_then_gives_up(temp_db, sender, monkeypatch):
+    monkeypatch.setattr(jobs, "RETRY_BACKOFF_S", (0,))
+    sender.fail = True
+    db.create_return("ord_001", "demo@example.com", [])
+    assert jobs.send_notifications() == {"sent": 0, "retry": 1, "failed": 0}
+    assert jobs.send_notifications() == {"sent": 0, "retry": 0, "failed": 1}
+    row = db._query("SELECT * FROM notification_outbox")[0]
+    assert row["status"] == "failed" and row["attempts"] == 2 and "timeout" in row["last_error"]
+
+def test_refresh_return_deadlines_is_incremental(temp_db):
+    from agents import policy_rules
+    version = policy_rules.load_rules().version
+    assert jobs.refresh_return_deadlines(batch=3) == 4
+    order = db._query("SELECT * FROM orders WHERE order_id = 'ord_201'")[0]     # Wireless Mouse
+    assert order["item_category"] == "general merchandise" and order["deadlines_version"] == version
+    assert order["warranty_deadline"] is None
+    assert jobs.refresh_return_deadlines() == 0
+
+    db.add_order_item("ord_201", "SKU-777", "Wireless Headphones", 1, 100)   # makes ord_201 stale
+    assert jobs.refresh_return_deadlines() == 1
+    order = db._query("SELECT * FROM orders WHERE order_id = 'ord_201'")[0]
+    assert order["item_category"] == "Electronics"
+    assert (order["return_deadline"], order["warranty_deadline"]) == policy_rules.deadlines("Electronics", order["created_at"])
+    assert jobs.refresh_return_deadlines(full=True) == 4
+
+def test_return_window_closing_is_a_range_query(temp_db):
+    jobs.refresh_return_deadlines()
+    with db.get_connection() as conn:
+        conn.execute("UPDATE orders SET return_deadline = datetime('now', '+3 days') WHERE order_id IN ('ord_001', 'ord_201')")
+        conn.execute("UPDATE orders SET return_deadline = datetime('now', '-1 days') WHERE order_id = 'ord_202'")
+    db.create_return("ord_201", "panda@example.com", [])
+    assert [o["order_id"] for o in db.list_orders_return_window_closing(7)] == ["ord_001"]
+    plan = " ".join(r["detail"] for r in db._query(
+        "EXPLAIN QUERY PLAN SELECT * FROM orders WHERE return_deadline BETWEEN datetime('now') AND datetime('now', '+7 days')"))
+    assert "idx_orders_return_deadline" in plan
+
+
+def test_sync_shipments_ingests_incrementally(temp_db):
+    with db.get_connection() as conn:
+        conn.execute("UPDATE orders SET created_at = '2025-11-10 12:00:00'")
+    assert jobs.sync_shipments(until="2025-11-10 12:00:00") == 0
+    first = jobs.sync_shipments(until="2025-11-11 12:00:00")
+    assert first > 0
+    assert db.get_shipment_feed_cursor(jobs.SHIPMENT_FEED) == "2025-11-11 12:00:00"
+    # the next poll overlaps the last one (lookback); nothing is stored twice
+    total = first + jobs.sync_shipments(until="2025-11-30 00:00:00")
+    assert jobs.sync_shipments(until="2025-11-30 00:00:00") == 0
+    assert db._query("SELECT COUNT(*) AS n FROM shipment_events")[0]["n"] == total
+
+    timeline = db.list_shipment_events("ord_203")
+    assert [e["code"] for e in timeline][0] == "label_created"
+    assert db.get_latest_shipment_event("ord_203")["code"] == "delivered" == timeline[-1]["code"]
+    assert timeline[-1]["location"] == "Austin, TX"
+    assert db.list_shipment_events("ord_202") == []          # still preparing: not tracked
+    latest = db.list_latest_shipment_events(["ord_203", "ord_202", "ord_001"])
+    assert sorted(latest) == ["ord_001", "ord_203"] and latest["ord_203"]["event_id"] == timeline[-1]["event_id"]
+
+def test_order_updates_between_syncs_keep_one_history(temp_db):
+    with db.get_connection() as conn:
+        conn.execute("UPDATE orders SET created_at = '2025-11-10 12:00:00', updated_at = '2025-11-10 12:00:00'")
+    jobs.sync_shipments(until="2025-11-11 12:00:00")
+    before = [(e["code"], e["ts"]) for e in db.list_shipment_events("ord_203")]
+    assert before
+    db.set_order_status("ord_203", "in transit")
+    db.set_order_shipping_address("ord_203", "9 Charger Way, Austin, TX 78701")
+    with db.get_connection() as conn:      # the updates happened between the two syncs
+        conn.execute("UPDATE orders SET updated_at = '2025-11-11 13:00:00' WHERE order_id = 'ord_203'")
+    jobs.sync_shipments(until="2025-11-30 00:00:00")
+    after = [(e["code"], e["ts"]) for e in db.list_shipment_events("ord_203")]
+    assert after[:len(before)] == before
+    assert [c for c, _ in after].count("label_created") == 1
+    assert [ts for _, ts in after] == sorted(ts for _, ts in after)
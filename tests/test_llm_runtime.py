@@ -0,0 +1,260 @@
+import threading
+import time
+
+import pytest
+from agents import llm_runtime
+from agents.llm_runtime import (
+    SingleFlight, DispatchScheduler, LatencyTracker, LLMQueueTimeout, LLMDeadlineExceeded,
+)
+
+
+class Resp:
+    def __init__(self, content):
+        self.content = content
+
+
+class CountingModel:
+    """Blocks until `release` is set so concurrent callers overlap."""
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def invoke(self, prompt):
+        self.calls += 1
+        self.release.wait(2)
+        return Resp(f"answer to {prompt}")
+
+
+def _run_concurrently(n, fn):
+    results = [None] * n
+    def worker(i):
+        results[i] = fn()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_identical_concurrent_calls_share_one_request(monkeypatch):
+    sf = SingleFlight()
+    monkeypatch.setattr(llm_runtime, "SINGLE_FLIGHT", sf)
+    model = CountingModel()
+
+    threads, results = _run_concurrently(5, lambda: llm_runtime.invoke(model, "Check Order"))
+    deadline = time.time() + 2
+    while sf.collapsed < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    model.release.set()
+    for t in threads:
+        t.join()
+
+    assert model.calls == 1
+    assert all(r.content == "answer to Check Order" for r in results)
+    stats = sf.stats()
+    assert stats["calls"] == 5 and stats["executed"] == 1 and stats["collapsed"] == 4
+    assert stats["in_flight"] == 0
+
+def test_different_prompts_are_not_collapsed(monkeypatch):
+    sf = SingleFlight()
+    monkeypatch.setattr(llm_runtime, "SINGLE_FLIGHT", sf)
+    model = CountingModel()
+    model.release.set()
+    llm_runtime.invoke(model, "Billing")
+    llm_runtime.invoke(model, "Check Order")
+    assert model.calls == 2
+    assert sf.collapsed == 0
+
+def test_errors_propagate_to_all_waiters():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def boom():
+        started.set()
+        release.wait(2)
+        raise RuntimeError("provider down")
+
+    errors = []
+    def follower():
+        try:
+            sf.do("k", lambda: "unused")
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, sf.do, "k", boom))
+    leader.start()
+    started.wait(2)
+    t = threading.Thread(target=follower)
+    t.start()
+    while sf.collapsed < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    t.join()
+    assert len(errors) == 1 and "provider down" in str(errors[0])
+
+
+# ---------- dispatch scheduler ----------
+
+
+def test_scheduler_bounds_in_flight():
+    sched = DispatchScheduler(max_in_flight=2, rate_per_s=0, burst=10, queue_deadline_s=2)
+    peak = [0]
+    lock = threading.Lock()
+    active = [0]
+
+    def work():
+        with sched.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] <= 2
+    assert sched.stats()["admitted"]["interactive"] == 6
+    assert sched.stats()["max_queue_depth"] >= 1
+
+def test_scheduler_serves_interactive_before_background():
+    sched = DispatchScheduler(max_in_flight=1, rate_per_s=0, burst=10, queue_deadline_s=2)
+    order = []
+    sched.acquire()   # occupy the only slot
+
+    def waiter(lane):
+        with sched.slot(lane):
+            order.append(lane)
+
+    bg = threading.Thread(target=waiter, args=("background",))
+    bg.start()
+    while sched.stats()["queue_depth"] < 1:
+        time.sleep(0.005)
+    fg = threading.Thread(target=waiter, args=("interactive",))
+    fg.start()
+    while sched.stats()["queue_depth"] < 2:
+        time.sleep(0.005)
+    sched.release()
+    bg.join()
+    fg.join()
+    assert order == ["interactive", "background"]
+
+def test_scheduler_token_bucket_limits_rate():
+    sched = DispatchScheduler(max_in_flight=10, rate_per_s=20, burst=1, queue_deadline_s=2)
+    start = time.monotonic()
+    for _ in range(3):
+        with sched.slot():
+            pass
+    # burst of 1, then 2 more tokens at 20/s -> roughly 0.1s
+    assert time.monotonic() - start >= 0.08
+
+def test_queue_deadline_fast_fails_with_fallback(monkeypatch):
+    sched = DispatchScheduler(max_in_flight=1, rate_per_s=0, burst=10, queue_deadline_s=0.05)
+    monkeypatch.setattr(llm_runtime, "SCHEDULER", sched)
+    monkeypatch.setattr(llm_runtime, "SINGLE_FLIGHT", SingleFlight())
+    sched.acquire()   # saturate
+    model = CountingModel()
+    model.release.set()
+
+    reply = llm_runtime.invoke(model, "hello", fallback="busy, try later")
+    assert reply.content == "busy, try later"
+    assert model.calls == 0
+    with pytest.raises(LLMQueueTimeout):
+        llm_runtime.invoke(model, "hello")
+    assert sched.stats()["timeouts"]["interactive"] == 2
+    assert sched.stats()["queue_depth"] == 0
+
+
+# ---------- deadlines and hedging ----------
+
+
+class SleepyModel:
+    def __init__(self, delay, content):
+        self.delay = delay
+        self.content = content
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        return Resp(self.content)
+
+
+@pytest.fixture
+def fresh_runtime(monkeypatch):
+    tracker = LatencyTracker()
+    monkeypatch.setattr(llm_runtime, "LATENCY", tracker)
+    monkeypatch.setattr(llm_runtime, "SINGLE_FLIGHT", SingleFlight())
+    monkeypatch.setattr(llm_runtime, "SCHEDULER", DispatchScheduler(max_in_flight=4, rate_per_s=0))
+    return tracker
+
+def test_fast_primary_does_not_hedge(fresh_runtime):
+    primary, fast = SleepyModel(0, "primary"), SleepyModel(0, "fast")
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=0.5, deadline_s=2)
+    assert resp.content == "primary"
+    assert fast.calls == 0
+    assert fresh_runtime.stats()["hedges_fired"] == 0
+
+def test_slow_primary_is_hedged_and_hedge_wins(fresh_runtime):
+    primary, fast = SleepyModel(0.5, "primary"), SleepyModel(0, "fast")
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=0.05, deadline_s=2)
+    assert resp.content == "fast"
+    stats = fresh_runtime.stats()
+    assert stats["hedges_fired"] == 1 and stats["hedge_wins"] == 1
+    assert stats["hedge_rate"] == 1.0
+
+class FailingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        raise ConnectionError("provider unavailable")
+
+def test_failing_primary_is_hedged_immediately(fresh_runtime):
+    primary, fast = FailingModel(), SleepyModel(0, "fast")
+    t0 = time.monotonic()
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=1, deadline_s=2)
+    assert resp.content == "fast" and time.monotonic() - t0 < 0.5
+    stats = fresh_runtime.stats()
+    assert stats["hedges_fired"] == 1 and stats["hedge_wins"] == 1
+
+def test_losing_call_gives_its_slot_back(fresh_runtime):
+    primary, fast = SleepyModel(0.5, "primary"), SleepyModel(0, "fast")
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=0.05, deadline_s=2)
+    assert resp.content == "fast"
+    assert llm_runtime.SCHEDULER.stats()["in_flight"] == 0      # primary is still sleeping
+
+def test_queued_loser_leaves_the_queue(fresh_runtime, monkeypatch):
+    sched = DispatchScheduler(max_in_flight=1, rate_per_s=0)
+    monkeypatch.setattr(llm_runtime, "SCHEDULER", sched)
+    primary, fast = SleepyModel(0.1, "primary"), SleepyModel(0, "fast")
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=0.02, deadline_s=2)
+    assert resp.content == "primary" and fast.calls == 0
+    deadline = time.monotonic() + 1
+    while sched.stats()["cancelled"]["interactive"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = sched.stats()
+    assert stats["cancelled"]["interactive"] == 1
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+def test_deadline_degrades_to_canned_reply(fresh_runtime):
+    primary, fast = SleepyModel(0.5, "primary"), SleepyModel(0.5, "fast")
+    resp = llm_runtime.invoke(primary, "hi", hedge_model=fast, hedge_after_s=0.02,
+                              deadline_s=0.1, fallback="canned")
+    assert resp.content == "canned"
+    with pytest.raises(LLMDeadlineExceeded):
+        llm_runtime.invoke(primary, "again", deadline_s=0.05)
+    assert fresh_runtime.stats()["deadline_misses"] == 2
+
+def test_latency_percentiles_are_reported(fresh_runtime):
+    for ms in range(1, 101):
+        fresh_runtime.record(ms / 1000)
+    stats = fresh_runtime.stats()
+    assert stats["calls"] == 100
+    assert 0.049 <= stats["p50_s"] <= 0.051
+    assert stats["p99_s"] >= 0.098
@@ -1,4 +1,8 @@
+import json
+
 import pytest
+import db
+from agents import memory_agent as mem
 from agents.memory_agent import memory_agent, AgentState
 
 def test_memory_agent_no_messages():
@@ -32,3 +36,100 @@ def test_memory_agent_with_minimal_message():
     assert isinstance(result["context_summary"], str)
     assert isinstance(result["context_refs"], list)
     assert "general" in result["context_summary"]
+
+
+# ---------- incremental index ----------
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.init_db()
+    mem.reset_index()
+    yield
+    mem.reset_index()
+
+def _turn(i):
+    return [
+        {"role": "user", "content": f"Where is ORD_{1000 + i}?"},
+        {"role": "assistant", "content": f"ORD_{1000 + i} has shipped."},
+    ]
+
+def test_index_only_processes_appended_messages(temp_db):
+    msgs = _turn(0) + _turn(1)
+    db.add_conversation("c1", "demo@example.com", json.dumps(msgs))
+    memory_agent(AgentState(conversation_id="c1"))
+    before = mem.INDEX_STATS["indexed"]
+
+    msgs += _turn(2)
+    db.add_conversation("c1", "demo@example.com", json.dumps(msgs))
+    result = memory_agent(AgentState(conversation_id="c1"))
+
+    assert mem.INDEX_STATS["indexed"] - before == 2
+    assert result["memory"]["entities"]["orders"] == ["ORD_1000", "ORD_1001", "ORD_1002"]
+    assert len(mem.get_index("c1").msgs) == 6
+
+def test_index_rebuilds_when_history_is_rewritten(temp_db):
+    db.add_conversation("c2", "demo@example.com", json.dumps(_turn(0) + _turn(1)))
+    memory_agent(AgentState(conversation_id="c2"))
+    db.add_conversation("c2", "demo@example.com", json.dumps(_turn(5)))
+    result = memory_agent(AgentState(conversation_id="c2"))
+    assert result["memory"]["entities"]["orders"] == ["ORD_1005"]
+
+def test_index_is_restored_from_db(temp_db, monkeypatch):
+    monkeypatch.setattr(mem, "PERSIST_INDEX", True)
+    db.add_conversation("c3", "demo@example.com", json.dumps(_turn(0)))
+    memory_agent(AgentState(conversation_id="c3"))
+
+    mem.reset_index()   # simulate a process restart
+    db.add_conversation("c3", "demo@example.com", json.dumps(_turn(0) + _turn(1)))
+    before = mem.INDEX_STATS["indexed"]
+    result = memory_agent(AgentState(conversation_id="c3"))
+    assert mem.INDEX_STATS["indexed"] - before == 2
+    assert result["memory"]["entities"]["orders"] == ["ORD_1000", "ORD_1001"]
+    head, rows = db.get_memory_index("c3")
+    assert head["msg_count"] == 4 and len(rows) == 4
+
+def test_plain_text_seed_conversations_still_load(temp_db):
+    result = memory_agent(AgentState(conversation_id="conv_201"))
+    assert result["context_summary"]
+
+def test_links_reach_past_the_recent_window():
+    filler = [{"role": "assistant", "content": f"Note {i} about the weather forecast."} for i in range(40)]
+    messages = (
+        [{"role": "user", "content": "My keyboard order is ORD_4242."}]
+        + filler
+        + [{"role": "user", "content": "Any update on ORD_4242?"}]
+    )
+    result = memory_agent(AgentState(messages=messages))
+    assert result["memory"]["links"][0] == 0
+    assert "ORD_4242" in result["context_refs"][0]
+
+def test_search_prefers_matching_ids_and_respects_k():
+    idx = mem.ConversationIndex()
+    idx.append([
+        {"role": "user", "content": "refund for ORD_1 please"},
+        {"role": "user", "content": "refund for ORD_2 please"},
+        {"role": "user", "content": "the charger is broken"},
+        {"role": "user", "content": "refund status for ORD_2"},
+    ])
+    hits = idx.search(k=1)
+    assert [m.idx for m, _ in hits] == [1]
+    assert len(idx.search(k=2)) == 2
+
+def test_history_refs_from_earlier_conversations_are_cached(temp_db, monkeypatch):
+    db.add_conversation("old", "demo@example.com",
+                        json.dumps([{"role": "user", "content": "The keyboard from ORD_777 has sticky keys"}]))
+    calls = []
+    real = db.search_customer_history
+    monkeypatch.setattr(db, "search_customer_history", lambda *a, **k: calls.append(a) or real(*a, **k))
+
+    state = AgentState(input="sticky keyboard again", email="demo@example.com", conversation_id="new")
+    result = memory_agent(state)
+    assert len(result["history_refs"]) == 1 and "sticky keys" in result["history_refs"][0]
+
+    memory_agent(AgentState(input="Sticky keyboard again!", email="demo@example.com", conversation_id="new"))
+    assert len(calls) == 1
+
+def test_history_refs_need_an_email(temp_db):
+    result = memory_agent(AgentState(input="sticky keyboard"))
+    assert result["history_refs"] == []
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from agents import memory_agent as mem
+from agents.memory_agent import memory_agent, AgentState
+
+
+MESSAGES = [
+    {"role": "user", "content": "My order ORD_12345 and payment PAY_98765 failed."},
+    {"role": "assistant", "content": "I can see ORD_12345 is shipped."},
+    {"role": "user", "content": "The weather is nice today."},
+    {"role": "assistant", "content": ""},
+    {"role": "user", "content": "Can you refund payment PAY_98765 for ORD_12345?"},
+]
+
+
+def test_vector_scores_match_set_scoring():
+    idx = mem.ConversationIndex()
+    idx.append(MESSAGES)
+    q = idx.msgs[-1]
+    expected = {m.idx: mem._score(q, m) for m in idx.msgs[:-1] if mem._score(q, m) > 0}
+    got = {m.idx: s for m, s in idx.vector_search(k=10)}
+    assert got.keys() == expected.keys()
+    for i, s in expected.items():
+        assert got[i] == pytest.approx(s, abs=1e-3)
+
+def test_vector_index_stays_in_sync_with_appends():
+    idx = mem.ConversationIndex()
+    idx.append(MESSAGES[:2])
+    idx.vector_search(k=1)                       # builds the matrix
+    idx.append(MESSAGES[2:])                     # added incrementally
+    assert idx.vectors.rows == len(MESSAGES)
+    assert [m.idx for m, _ in idx.vector_search(k=1)] == [0]
+
+def test_memory_agent_uses_vector_scorer(monkeypatch):
+    monkeypatch.setattr(mem, "SCORER", "vector")
+    result = memory_agent(AgentState(messages=MESSAGES))
+    assert result["memory"]["links"][:2] == [0, 1]
+    assert 3 not in result["memory"]["links"]    # empty messages never link
@@ -0,0 +1,49 @@
+from agents import model_selector as ms
+
+
+class Model:
+    def __init__(self, name):
+        self.name = name
+
+
+PRIMARY, FAST = Model("primary"), Model("fast")
+
+
+def test_greeting_is_trivial():
+    score, factors = ms.estimate_complexity("Hi there!")
+    assert score == 0.0
+    assert factors == {"small_talk": 1.0}
+
+def test_entities_and_length_raise_complexity():
+    simple, _ = ms.estimate_complexity("what are your hours", intent_confidence=0.6)
+    detailed, factors = ms.estimate_complexity(
+        "I was charged twice for ORD_12345 on 2025-10-01 and again on 2025-10-03, "
+        "can you explain why and also tell me when the refund for PAY_98765 will arrive?",
+        intent_confidence=0.6,
+    )
+    assert detailed > simple
+    assert factors["entities"] == 1.0
+
+def test_low_intent_confidence_raises_complexity():
+    sure, _ = ms.estimate_complexity("tell me about your store", intent_confidence=1.0)
+    unsure, _ = ms.estimate_complexity("tell me about your store", intent_confidence=0.0)
+    assert unsure > sure
+
+def test_select_model_picks_fast_for_small_talk():
+    chosen, sel = ms.select_model({"input": "thanks!"}, PRIMARY, FAST)
+    assert chosen is FAST and sel.tier == "fast"
+
+def test_select_model_picks_primary_for_complex_turn():
+    state = {
+        "input": "My order ORD_555 arrived damaged and the replacement ORD_556 never shipped, "
+                 "what are my options and can you send it to 12 Oak St, Austin, TX 78701?",
+        "intent_confidence": 0.6,
+        "memory": {"entities": {"orders": ["ORD_555"]}},
+    }
+    chosen, sel = ms.select_model(state, PRIMARY, FAST)
+    assert chosen is PRIMARY and sel.tier == "primary"
+
+def test_adaptive_selection_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(ms, "ADAPTIVE_ENABLED", False)
+    chosen, sel = ms.select_model({"input": "hi"}, PRIMARY, FAST)
+    assert chosen is PRIMARY
@@ -4,14 +4,23 @@ from agents.order_agent import order_agent, AgentState
 class DummyDB:
     def __init__(self):
         self.orders = {
-            "ord_100": {"order_id": "ord_100", "status": "processing", "created_at": "2025-11-01", "shipping_address": "123 Main St, Atlanta, GA 30318", "subtotal_cents": 10000, "tax_cents": 800, "shipping_cents": 500},
+            "ord_100": {"order_id": "ord_100", "email": "demo@example.com", "status": "processing", "created_at": "2025-11-01", "shipping_address": "123 Main St, Atlanta, GA 30318", "subtotal_cents": 10000, "tax_cents": 800, "shipping_cents": 500},
             "ord_200": {"order_id": "ord_200", "status": "shipped", "created_at": "2025-11-02", "shipping_address": "456 Oak Ave, New York, NY 10001", "subtotal_cents": 20000, "tax_cents": 1600, "shipping_cents": 1000},
         }
     def get_order_by_id(self, order_id):
         return self.orders.get(order_id)
+    def get_order_for_user(self, email, order_id):
+        order = self.orders.get(order_id)
+        return order if order and order.get("email") == email else None
     def set_order_shipping_address(self, order_id, address):
         if order_id in self.orders:
             self.orders[order_id]["shipping_address"] = address
+    def get_order_full(self, order_id, email=None):
+        order = self.get_order_for_user(email, order_id) if email else self.get_order_by_id(order_id)
+        if not order:
+            return None
+        return {**order, "items": [{"sku": "SKU-1", "name": "Widget", "qty": 2}],
+                "payments": [{"amount_cents": 11300, "method": "card", "status": "successful"}]}
     def list_orders_for_user(self, email):
         return [v for v in self.orders.values() if email in v.get("shipping_address","")]
 
@@ -33,6 +42,7 @@ def test_order_agent_found():
     assert "ord_100" in result["output"]
     assert "processing" in result["output"].lower()
     assert "estimated total" in result["output"].lower()
+    assert "2 × Widget" in result["output"] and "$113.00 by card" in result["output"]
     assert result["confidence"] >= 0.7
 
 def test_order_agent_not_found():
@@ -54,3 +64,36 @@ def test_order_agent_blocked_status():
     state = AgentState(input="ord_200 123 New St, NY, NY 10001", intent="change shipping address")
     result = order_agent(state)
     assert "can no longer be changed" in result["output"].lower()
+
+def test_order_agent_scopes_lookup_to_logged_in_user():
+    state = AgentState(input="where is ord_100", email="demo@example.com")
+    result = order_agent(state)
+    assert "ord_100" in result["output"]
+    assert result["tool_calls"][0].startswith("orders:get_full(") and "email='demo@example.com'" in result["tool_calls"][0]
+
+    other = order_agent(AgentState(input="where is ord_100", email="someone@example.com"))
+    assert "couldn’t find any orders" in other["output"].lower()
+
+def test_order_agent_pages_order_list(monkeypatch):
+    rows = [{"order_id": f"ord_{i}", "status": "shipped", "created_at": "2025-11-01",
+             "subtotal_cents": 100, "tax_cents": 0, "shipping_cents": 0} for i in range(7)]
+    calls = []
+
+    def list_orders_page(email, limit=5, cursor=None, columns=None):
+        calls.append(cursor)
+        start = int(cursor) if cursor else 0
+        nxt = start + limit if start + limit < len(rows) else None
+        return rows[start:start + limit], (str(nxt) if nxt else None)
+
+    monkeypatch.setattr("agents.order_agent.db.list_orders_page", list_orders_page, raising=False)
+    first = order_agent(AgentState(input="show my orders", email="demo@example.com"))
+    assert "ord_4" in first["output"] and "ord_5" not in first["output"]
+    assert "show more orders" in first["output"] and first["orders_cursor"] == "5"
+
+    more = order_agent(AgentState(input="show more orders", email="demo@example.com",
+                                  orders_cursor=first["orders_cursor"]))
+    assert "Here are more of your orders" in more["output"] and "ord_6" in more["output"]
+    assert more["orders_cursor"] is None and calls == [None, "5"]
+
+    order_agent(AgentState(input="what's my next order?", email="demo@example.com", orders_cursor="5"))
+    assert calls[-1] is None                    # not a paging request: starts from the newest order
@@ -132,3 +132,27 @@ def test_policy_agent_wrapper_handles_error(monkeypatch):
 
     # We should get the fake safe response, not an exception
     assert out["output"] == "fallback: safe response"
+
+
+def test_check_eligibility_batch_uses_rules_then_one_prompt(monkeypatch):
+    from datetime import datetime
+
+    prompts = []
+
+    def fake_invoke(builder):
+        prompts.append(builder.build().text)
+        return "ord_3 | Not eligible | Worn apparel cannot be returned."
+
+    monkeypatch.setattr(pa, "_invoke", fake_invoke)
+    orders = [
+        {"order_id": "ord_1", "created_at": "2025-06-20 10:00:00", "items": [("SKU-1", "Laptop")]},
+        {"order_id": "ord_2", "created_at": "2025-05-01 10:00:00", "items": [("SKU-1", "Laptop")]},
+        {"order_id": "ord_3", "created_at": "2025-06-20 10:00:00",
+         "category": "Apparel and Wearables", "text": "I wore it once"},
+    ]
+    out = pa.check_eligibility_batch(iter(orders), now=datetime(2025, 6, 30))
+
+    assert [(r["order_id"], r["eligible"], r["decided_by"]) for r in out] == [
+        ("ord_1", True, "rules"), ("ord_2", False, "rules"), ("ord_3", False, "model"),
+    ]
+    assert len(prompts) == 1 and "ord_3" in prompts[0] and "ord_1" not in prompts[0]
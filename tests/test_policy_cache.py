@@ -0,0 +1,63 @@
+from datetime import date
+
+from agents import policy_cache as pc
+
+
+def test_exact_and_normalised_hits():
+    cache = pc.AnswerCache()
+    assert cache.get("What's the return window for electronics?", "v1") is None
+    cache.put("What's the return window for electronics?", "v1", "30 days.")
+    assert cache.get("what is the return window for electronics", "v1") == "30 days."
+    assert cache.get("Electronics return window?", "v1") == "30 days."   # word order ignored
+
+def test_near_duplicate_hit():
+    cache = pc.AnswerCache()
+    cache.put("how long do refunds take with paypal payments", "v1", "1-3 business days.")
+    assert cache.get("how long do refunds take with paypal", "v1") == "1-3 business days."
+    assert cache.get("how long does shipping take", "v1") is None
+
+def test_policy_change_invalidates():
+    cache = pc.AnswerCache()
+    cache.put("return window electronics", "v1", "30 days.")
+    assert cache.get("return window electronics", "v2") is None
+    assert cache.entries == {} and cache.buckets == {}
+
+def test_follow_ups_and_short_questions_skip_the_cache():
+    cache = pc.AnswerCache()
+    cache.put("does that apply to shoes too", "v1", "yes")
+    assert cache.entries == {}
+    assert cache.get("warranty?", "v1") is None
+    assert cache.report()["skipped"] == 1
+
+def test_lru_eviction_keeps_buckets_consistent():
+    cache = pc.AnswerCache(max_entries=2)
+    cache.put("return window electronics", "v1", "a")
+    cache.put("refund timeline paypal", "v1", "b")
+    cache.get("return window electronics", "v1")          # refresh
+    cache.put("international return duties", "v1", "c")
+    assert cache.get("refund timeline paypal", "v1") is None
+    assert cache.get("return window electronics", "v1") == "a"
+    live = set(cache.entries)
+    assert all(keys <= live for keys in cache.buckets.values())
+
+def test_daily_report():
+    cache = pc.AnswerCache()
+    cache.put("return window electronics", "v1", "a")
+    cache.get("return window electronics", "v1")
+    cache.get("refund timeline paypal", "v1")
+    day = cache.report(date.today().isoformat())
+    assert (day["hits"], day["misses"], day["hit_rate_pct"]) == (1, 1, 50)
+
+def test_negations_and_modals_change_the_key():
+    cache = pc.AnswerCache()
+    cache.put("Can clearance items be returned?", "v1", "No, clearance is final sale.")
+    assert cache.get("Clearance items can not be returned?", "v1") is None
+    assert cache.get("Clearance items can't be returned?", "v1") is None
+    assert cache.get("can clearance items be returned", "v1") == "No, clearance is final sale."
+
+def test_near_duplicates_must_agree_on_category_and_numbers():
+    cache = pc.AnswerCache()
+    cache.put("Can I return apparel after 30 days if I paid by credit card online?", "v1", "apparel answer")
+    assert cache.get("Can I return electronics after 30 days if I paid by credit card online?", "v1") is None
+    assert cache.get("Can I return apparel after 45 days if I paid by credit card online?", "v1") is None
+    assert cache.get("Can I return apparel after 30 days if I paid with a credit card online?", "v1") == "apparel answer"
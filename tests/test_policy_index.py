@@ -0,0 +1,72 @@
+import os
+import textwrap
+
+from agents import policy_index as pi
+
+POLICY = textwrap.dedent(
+    """
+    Return Eligibility:
+    We accept returns on most items within 60 days of delivery.
+
+    Return Categories:
+    Electronics:
+    Electronics must be returned within 30 days with all chargers.
+
+    Footwear:
+    Shoes must show no signs of outdoor wear.
+
+    REFUNDS
+
+    Refunds are issued 5-10 business days after inspection.
+    Refund timeline by payment type:
+    PayPal: 1-3 business days
+
+    WARRANTY POLICY
+
+    Some products include a 1-year limited warranty against manufacturer defects.
+    """
+).strip()
+
+
+def test_parse_sections_groups_and_major_headings():
+    titles = [s.title for s in pi.parse_sections(POLICY)]
+    assert titles == [
+        "Return Eligibility",
+        "Return Categories > Electronics",
+        "Return Categories > Footwear",
+        "Refunds",
+        "Warranty Policy",
+    ]
+    # a "Heading:" line inside an ALL-CAPS section does not split it
+    refunds = pi.parse_sections(POLICY)[3]
+    assert "PayPal: 1-3 business days" in refunds.text
+
+def test_select_returns_relevant_sections_only():
+    index = pi.PolicyIndex(POLICY)
+    text = index.select("how long does a paypal refund take", k=1)
+    assert "PayPal" in text and "warranty" not in text
+
+    text = index.select("is my laptop covered by the warranty", k=1, pin_first=True)
+    assert text.startswith("Return Eligibility:") and "1-year limited warranty" in text
+    assert "Shoes" not in text
+
+def test_select_without_matches_falls_back_to_first_sections():
+    index = pi.PolicyIndex(POLICY)
+    assert index.select("zzz", k=2).startswith("Return Eligibility:")
+
+def test_unstructured_policy_is_one_section():
+    index = pi.PolicyIndex('{"warranty_years": 2}')
+    assert index.select("warranty claim") == '{"warranty_years": 2}'
+
+def test_index_rebuilds_when_file_changes(tmp_path):
+    p = tmp_path / "return_policy.txt"
+    p.write_text(POLICY)
+    first = pi.get_index(str(p))
+    assert pi.get_index(str(p)) is first
+
+    p.write_text(POLICY + "\n\nCANCELLATIONS\n\nOrders may be canceled within 2 hours.")
+    later = os.stat(p).st_mtime_ns + 1_000_000   # same-tick writes can keep the mtime
+    os.utime(p, ns=(later, later))
+    second = pi.get_index(str(p))
+    assert second is not first
+    assert second.sections[-1].title == "Cancellations"
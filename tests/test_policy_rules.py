@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+from agents import policy_rules as pr
+
+
+@pytest.fixture
+def rules():
+    return pr.load_rules("return_policy_rules.json")
+
+
+def test_category_windows(rules):
+    assert pr.evaluate("Electronics", 20, "changed mind", rules=rules).eligible is True
+    late = pr.evaluate("Electronics", 45, "changed mind", rules=rules)
+    assert late.eligible is False and "30 days" in late.reason
+    assert pr.evaluate("Home Goods", 45, "changed mind", rules=rules).eligible is True
+    # unknown categories get the default window
+    assert pr.evaluate("garden", 61, "changed mind", rules=rules).rule == "expired"
+
+def test_exclusions(rules):
+    assert pr.evaluate("Home Goods", 3, "changed mind", flags=["clearance"], rules=rules).rule == "final_sale"
+    assert pr.evaluate("Consumables", 3, "changed mind", rules=rules).eligible is False
+    assert pr.evaluate("Consumables", 3, "defective item", rules=rules).eligible is True
+
+def test_ambiguous_cases_go_to_the_model(rules):
+    d = pr.evaluate("Apparel and Wearables", 5, "customer initiated return",
+                    text="I wore it once to a party", rules=rules)
+    assert d.eligible is None and d.rule == "ambiguous_text"
+    # past the return window but inside the warranty
+    assert pr.evaluate("Electronics", 200, "defective item", rules=rules).rule == "warranty"
+    # the model could not decide: the table answers on its own
+    assert pr.evaluate("Electronics", 200, "defective item", rules=rules, strict=False).eligible is False
+
+def test_missing_date_is_decided_locally(rules):
+    assert pr.evaluate("Electronics", None, "changed mind", rules=rules).rule == "no_date"
+
+def test_record_tracks_local_share(monkeypatch):
+    monkeypatch.setattr(pr, "STATS", {"checks": 0, "local": 0, "llm": 0})
+    pr.record(pr.Decision(True, "", "window"))
+    pr.record(pr.Decision(True, "", "window"))
+    pr.record(pr.Decision(None, "", "ambiguous_text"))
+    assert pr.STATS == {"checks": 3, "local": 2, "llm": 1}
+    assert pr.local_ratio() == pytest.approx(2 / 3)
+
+def test_rules_recompiled_when_file_changes(tmp_path):
+    p = tmp_path / "rules.json"
+    p.write_text(json.dumps({"categories": {"Electronics": {"window_days": 30}}}))
+    assert pr.load_rules(str(p)).rule_for("electronics").window_days == 30
+    p.write_text(json.dumps({"categories": {"Electronics": {"window_days": 14}}}))
+    later = p.stat().st_mtime_ns + 1_000_000
+    os.utime(p, ns=(later, later))
+    assert pr.load_rules(str(p)).rule_for("electronics").window_days == 14
+
+def test_categorize_items():
+    assert pr.categorize_items([("SKU-1", "Laptop Pro")]) == "Electronics"
+    assert pr.categorize_items([("SKU-2", "Dish soap")]) == "Consumables"
+    assert pr.categorize_items([("A", "thing"), ("B", "other thing")]) == "Bundles and Kits"
+    assert pr.categorize_items([("SKU-9", "Starter kit")]) == "Bundles and Kits"
+    assert pr.categorize_items([]) == "general merchandise"
+
+def test_days_since():
+    from datetime import datetime
+    assert pr.days_since("2025-06-01 10:00:00", now=datetime(2025, 6, 11, 9, 0)) == 9
+    assert pr.days_since(None) is None and pr.days_since("yesterday") is None
+
+def test_deadlines_agree_with_days_since(rules):
+    from datetime import datetime, timedelta
+    created = "2025-06-01 10:00:00"
+    ret, warranty = pr.deadlines("Electronics", created, rules)
+    assert ret == "2025-07-02 09:59:59" and warranty == "2026-06-02 09:59:59"
+    assert pr.deadlines("Footwear", created, rules)[1] is None
+    assert pr.deadlines("Footwear", "yesterday", rules) == (None, None)
+    start = datetime(2025, 6, 29)
+    for hours in range(0, 24 * 6, 7):
+        now = start + timedelta(hours=hours)
+        by_days = pr.evaluate("Electronics", pr.days_since(created, now), "changed mind", rules=rules)
+        by_deadline = pr.evaluate("Electronics", None, "changed mind", rules=rules, deadlines=(ret, warranty), now=now)
+        assert by_days.eligible == by_deadline.eligible
+    late = pr.evaluate("Electronics", None, "defective item", rules=rules, deadlines=(ret, warranty),
+                       now=datetime(2025, 9, 1))
+    assert late.rule == "warranty"
+
+def test_stored_deadlines_follow_rules_version(rules):
+    order = {"return_deadline": "2025-07-02 09:59:59", "warranty_deadline": None, "deadlines_version": rules.version}
+    assert pr.stored_deadlines(order, rules) == ("2025-07-02 09:59:59", None)
+    assert pr.stored_deadlines({**order, "deadlines_version": "old"}, rules) is None
+    assert pr.stored_deadlines({**order, "deadlines_version": None}, rules) is None
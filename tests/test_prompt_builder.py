@@ -0,0 +1,53 @@
+from agents import prompt_builder as pb
+from agents.prompt_builder import PromptBuilder, estimate_tokens, truncate_to_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("a" * 401) == 101
+
+def test_truncate_keeps_requested_end():
+    text = "START " + "x" * 1000 + " END"
+    assert truncate_to_tokens(text, 20, keep="head").startswith("START")
+    assert truncate_to_tokens(text, 20, keep="tail").endswith("END")
+    both = truncate_to_tokens(text, 20, keep="both")
+    assert both.startswith("START") and both.endswith("END")
+    assert estimate_tokens(both) <= 20
+
+def test_section_budget_truncates():
+    built = (
+        PromptBuilder("test")
+        .add("system", "You are helpful.", required=True)
+        .add("user", "y" * 10_000, budget=50, required=True)
+        .build()
+    )
+    assert "user" in built.truncated
+    assert built.sections["user"] <= 50
+    assert built.text.startswith("You are helpful.")
+
+def test_global_budget_drops_lowest_priority_first():
+    built = (
+        PromptBuilder("test", max_tokens=120)
+        .add("system", "s" * 200, required=True)
+        .add("memory", "m" * 400)
+        .add("user", "u" * 100, required=True)
+        .build()
+    )
+    assert built.tokens <= 120
+    # memory has the lowest priority and goes first
+    assert "memory" in built.dropped or "memory" in built.truncated
+    assert "s" * 50 in built.text and "u" * 25 in built.text
+
+def test_empty_sections_are_skipped():
+    built = PromptBuilder("test").add("memory", "").add("user", "hi").build()
+    assert built.text == "hi"
+    assert "memory" not in built.sections
+
+def test_record_logs_tokens_and_latency():
+    built = PromptBuilder("test").add("user", "hello there").build()
+    entry = pb.record(built, 0.25)
+    assert entry["tokens"] == built.tokens
+    assert entry["latency_s"] == 0.25
+    assert pb.PROMPT_LOG[-1] is entry
@@ -52,12 +52,16 @@ class TestReturnAgent:
         updated_state = return_agent(state)
         assert "order number" in updated_state["output"].lower()
 
+    @patch('agents.return_agent._check_return_eligibility')
+    @patch('agents.return_agent._get_order_details')
     @patch('agents.return_agent._process_return')
     @patch('agents.return_agent._get_orderid')
-    def test_return_agent_successful_return(self, mock_get_orderid, mock_process_return):
+    def test_return_agent_successful_return(self, mock_get_orderid, mock_process_return, mock_order, mock_eligibility):
         """Test successful return processing."""
         mock_get_orderid.return_value = "ord_12345"
-        mock_process_return.return_value = True
+        mock_order.return_value = {"order_id": "ord_12345"}
+        mock_eligibility.return_value = {"eligible": True, "reason": "within window", "decided_by": "rules"}
+        mock_process_return.return_value = {"rma_id": "rma_1", "state": "approved", "created": True}
 
         state: AgentState = {
             "input": "I want to return order 12345",
@@ -73,14 +77,30 @@ class TestReturnAgent:
             "memory": None
         }
         updated_state = return_agent(state)
-        assert "confirmation email" in updated_state["output"].lower()
+        assert "We've opened return **rma_1**" in updated_state["output"]
+        assert "✅ Approved" in updated_state["output"]
+        assert "shortly" not in updated_state["output"]
+
+    @patch('agents.return_agent._check_return_eligibility')
+    @patch('agents.return_agent._get_order_details')
+    @patch('agents.return_agent._process_return')
+    def test_return_agent_requested_return_is_not_shown_as_approved(self, mock_process_return, mock_order,
+                                                                    mock_eligibility):
+        """A return opened in state "requested" is reported as pending review."""
+        mock_order.return_value = {"order_id": "ord_12345"}
+        mock_eligibility.return_value = {"eligible": True, "reason": "needs a look", "decided_by": "model"}
+        mock_process_return.return_value = {"rma_id": "rma_2", "state": "requested", "created": True}
+
+        updated_state = return_agent({"input": "return ord_12345", "email": "user@example.com"})
+        assert "We've opened return **rma_2**" in updated_state["output"]
+        assert "Pending review" in updated_state["output"] and "Approved" not in updated_state["output"]
 
     @patch('agents.return_agent._process_return')
     @patch('agents.return_agent._get_orderid')
     def test_return_agent_failed_return(self, mock_get_orderid, mock_process_return):
         """Test failed return processing."""
         mock_get_orderid.return_value = "ord_99999"
-        mock_process_return.return_value = False
+        mock_process_return.return_value = None
 
         state: AgentState = {
             "input": "I want to return order 99999",
@@ -143,89 +163,70 @@ class TestProcessReturn:
         )
 
     # test process return success.
-    @patch('agents.return_agent.msg')
     @patch('agents.return_agent.db')
-    def test_process_return_success(self, mock_db, mock_msg):
-        """Test successful return processing."""
-        mock_db.get_user.return_value = {
-            "email": "user@example.com",
-            "first_name": "John"
-        }
-        mock_db.set_order_status.return_value = None
-        mock_msg.message_agent.return_value = {"success": True}
+    def test_process_return_success(self, mock_db):
+        """Test successful return processing: the return is recorded, the email is queued."""
+        mock_db.get_order_for_user.return_value = {"order_id": "ord_test_001", "email": "user@example.com"}
+        mock_db.list_items_for_orders.return_value = {"ord_test_001": []}
+        mock_db.create_return.return_value = ({"rma_id": "rma_1", "state": "approved"}, True)
 
-        result = _process_return("user@example.com", "ord_test_001")
+        result = _process_return("user@example.com", "ord_test_001", "defective item",
+                                 {"eligible": True, "reason": "within window", "decided_by": "rules"})
 
-        assert result is True
-        mock_db.get_user.assert_called_once_with("user@example.com")
-        mock_db.set_order_status.assert_called_once_with(
-            "ord_test_001", "return requested")
+        assert result == {"rma_id": "rma_1", "state": "approved", "created": True}
+        mock_db.create_return.assert_called_once_with(
+            "ord_test_001", "user@example.com", [], reason="defective item", eligible=True,
+            decision_reason="within window", decided_by="rules", state="approved")
 
     # process return with valid email and order ID.
-    @patch('agents.return_agent.msg.message_agent')
-    @patch('agents.return_agent.db.set_order_status')
-    @patch('agents.return_agent.db.get_user')
-    def test_process_return_valid_email_and_order(self, mock_get_user,
-                                                  mock_set_status, mock_message_agent):
-        """Test successful return processing with valid email and order ID."""
-        # Arrange
+    @patch('agents.return_agent.db')
+    def test_process_return_valid_email_and_order(self, mock_db):
+        """Without an eligibility decision the return starts as requested."""
         email = "user@example.com"
         order_id = "ord_12345"
-        mock_user = {
-            "email": email,
-            "first_name": "John",
-            "last_name": "Doe"
-        }
+        mock_db.get_order_for_user.return_value = {"order_id": order_id, "email": email}
+        mock_db.list_items_for_orders.return_value = {order_id: [{"sku": "SKU-1", "name": "Widget", "qty": 1}]}
+        mock_db.create_return.return_value = ({"rma_id": "rma_1"}, True)
 
-        mock_get_user.return_value = mock_user
-        mock_message_agent.return_value = {"success": True}
+        result = _process_return(email, order_id)
+
+        assert result["rma_id"] == "rma_1"
+        args, kwargs = mock_db.create_return.call_args
+        assert args == (order_id, email, [{"sku": "SKU-1", "name": "Widget", "qty": 1}])
+        assert kwargs["state"] == "requested" and kwargs["eligible"] is None
  # test process return with empty order ID.
 
-    @patch('agents.return_agent.msg')
     @patch('agents.return_agent.db')
-    def test_process_return_empty_order_id(self, mock_db, mock_msg):
+    def test_process_return_empty_order_id(self, mock_db):
         """Test return processing with empty order ID."""
-        mock_db.get_user.return_value = {"email": "user@example.com"}
+        mock_db.get_order_for_user.return_value = None
 
         result = _process_return("user@example.com", "")
 
-        assert result is False
-        mock_db.set_order_status.assert_not_called()
-        mock_msg.message_agent.assert_not_called()
+        assert result is None
+        mock_db.create_return.assert_not_called()
 
     # process with invalid order ID.
     @patch('agents.return_agent.db')
-    @patch('agents.return_agent.msg.message_agent')
-    def test_process_return_invalid_order_id(self, mock_message_agent, mock_db):
-        """Test return processing with invalid order ID."""
-        email = "test@example.com"
-        order_id = ""
+    def test_process_return_invalid_order_id(self, mock_db):
+        """Test return processing with an order that is not the user's."""
+        mock_db.get_order_for_user.return_value = None
 
-        mock_db.get_user.return_value = {"email": email, "first_name": "Test"}
-
-        result = _process_return(email, order_id)
+        result = _process_return("test@example.com", "ord_99999")
 
-        assert result is False
-        mock_message_agent.assert_not_called()
-        mock_message_agent.assert_not_called()
+        assert result is None
+        mock_db.create_return.assert_not_called()
 
-    # process return when user has no first name.
+    # asking twice for the same order reuses the open return.
     @patch('agents.return_agent.db')
-    @patch('agents.return_agent.msg.message_agent')
-    def test_process_return_no_first_name(self, mock_message_agent, mock_db):
-        """Test return processing when user has no first name."""
-        mock_db.get_user.return_value = {"email": "user@example.com"}
-        email = "user@example.com"
-        order_id = "ord_12345"
-        mock_db.set_order_status.return_value = None
-        mock_message_agent.return_value = {"success": True}
-        result = _process_return(email, order_id)
-
-        assert result is True
-        mock_db.get_user.assert_called_once_with(email)
-        mock_db.set_order_status.assert_called_once_with(
-            order_id, "return requested")
-        mock_message_agent.assert_called_once()
+    def test_process_return_reuses_open_return(self, mock_db):
+        """create_return is idempotent; the already open return is returned."""
+        mock_db.get_order_for_user.return_value = {"order_id": "ord_12345", "email": "user@example.com"}
+        mock_db.list_items_for_orders.return_value = {}
+        mock_db.create_return.return_value = ({"rma_id": "rma_1"}, False)
+
+        assert _process_return("user@example.com", "ord_12345") == {"rma_id": "rma_1", "created": False}
+        mock_db.create_return.assert_called_once()
 # run the tests
 
 
@@ -28,4 +28,84 @@ def test_shipping_agent_error_handler(monkeypatch):
     monkeypatch.setattr("agents.shipping_agent.ShippingAgent.run", lambda self, s: 1/0)
     out = shipping_agent({"input": "foo"})
     assert "Sorry—something went wrong while checking your shipping status." in out["output"]
-    assert out["confidence"] == 0.2
\ No newline at end of file
+    assert out["confidence"] == 0.2
+
+
+def test_email_only_lookup_reads_latest_order(monkeypatch):
+    monkeypatch.setattr("agents.shipping_agent.db.get_latest_order",
+                        lambda email: {"order_id": "ord_9", "status": "in transit", "created_at": "2025-11-12"})
+    monkeypatch.setattr("agents.shipping_agent.db.get_latest_shipment_event", lambda order_id: None)
+    monkeypatch.setattr("agents.shipping_agent.db.list_open_orders_for_user", lambda email, limit=10: [])
+    result = ShippingAgent().run({"input": "where is my package", "email": "demo@example.com"})
+    assert result["tool_calls"][1] == "orders:get_latest(email='demo@example.com')"
+    assert "ord_9" in result["output"] and "In Transit" in result["output"]
+
+def test_single_open_order_is_used_over_the_latest_order(monkeypatch):
+    monkeypatch.setattr("agents.shipping_agent.db.list_open_orders_for_user", lambda email, limit=10: [
+        {"order_id": "ord_7", "status": "shipped", "created_at": "2025-10-02"}])
+    monkeypatch.setattr("agents.shipping_agent.db.get_order_for_user",
+                        lambda email, order_id: {"order_id": order_id, "status": "shipped", "created_at": "2025-10-02"})
+    monkeypatch.setattr("agents.shipping_agent.db.get_latest_shipment_event", lambda order_id: None)
+    result = ShippingAgent().run({"input": "where is my package", "email": "demo@example.com"})
+    assert result["tool_calls"][1] == "orders:get_for_user(email='demo@example.com', order_id='ord_7')"
+    assert not any(c.startswith("orders:get_latest(") for c in result["tool_calls"])
+    assert "ord_7" in result["output"] and "Shipped" in result["output"]
+
+def test_latest_scan_and_timeline_answer(monkeypatch):
+    scans = [
+        {"code": "picked_up", "description": "Picked up by UPS", "location": "Atlanta, GA",
+         "ts": "2025-11-11 04:24:00", "carrier": "UPS", "tracking_number": "1Z1"},
+        {"code": "out_for_delivery", "description": "Out for delivery", "location": "Austin, TX",
+         "ts": "2025-11-13 12:33:00", "carrier": "UPS", "tracking_number": "1Z1"},
+    ]
+    monkeypatch.setattr("agents.shipping_agent.db.get_order_by_id",
+                        lambda order_id: {"order_id": order_id, "status": "shipped", "created_at": "2025-11-10"})
+    monkeypatch.setattr("agents.shipping_agent.db.get_latest_shipment_event", lambda order_id: scans[-1])
+    monkeypatch.setattr("agents.shipping_agent.db.list_shipment_events", lambda order_id, limit=20: scans)
+
+    latest = ShippingAgent().run({"input": "where is my package ord_203"})
+    assert "**Out for Delivery**" in latest["output"] and "Austin, TX" in latest["output"]
+    assert "UPS tracking number: 1Z1" in latest["output"] and "Tracking history" not in latest["output"]
+
+    history = ShippingAgent().run({"input": "show the tracking history for ord_203"})
+    assert history["tool_calls"][-1].startswith("shipments:timeline(")
+    assert "- 2025-11-11 04:24:00: Picked up by UPS — Atlanta, GA" in history["output"]
+
+    number = ShippingAgent().run({"input": "what's my tracking number for ord_203?"})
+    assert number["tool_calls"][-1].startswith("shipments:latest(")
+    assert "UPS tracking number: 1Z1" in number["output"] and "Tracking history" not in number["output"]
+
+    updates = ShippingAgent().run({"input": "show me all updates for ord_203"})
+    assert updates["tool_calls"][-1].startswith("shipments:timeline(")
+
+def test_several_order_ids_get_one_combined_answer(monkeypatch):
+    orders = {"ord_201": {"order_id": "ord_201", "status": "delivered", "created_at": "2025-11-01"},
+              "ord_203": {"order_id": "ord_203", "status": "shipped", "created_at": "2025-11-10"}}
+    batches = []
+
+    def get_orders_by_ids(order_ids, email=None):
+        batches.append(list(order_ids))
+        return {oid: orders[oid] for oid in order_ids if oid in orders}
+
+    monkeypatch.setattr("agents.shipping_agent.db.get_orders_by_ids", get_orders_by_ids)
+    monkeypatch.setattr("agents.shipping_agent.db.list_latest_shipment_events", lambda order_ids: {
+        "ord_203": {"code": "arrived_at_facility", "description": "Arrived at UPS hub", "location": "Dallas, TX",
+                    "ts": "2025-11-11 18:18:00"}})
+    result = ShippingAgent().run({"input": "where are ORD_201 and ord_203 and ord_999?"})
+    assert batches == [["ord_201", "ord_203", "ord_999"]]
+    assert [c.split("(")[0] for c in result["tool_calls"]] == ["orders:get_many", "shipments:latest_many"]
+    out = result["output"]
+    assert "**ord_201** is **Delivered** (placed on 2025-11-01)" in out
+    assert "**ord_203** is **In Transit** — Arrived at UPS hub, Dallas, TX" in out
+    assert "**ord_999**: I couldn’t find this order." in out
+    assert result["confidence"] == 0.7
+
+def test_open_orders_of_user_are_listed_together(monkeypatch):
+    open_orders = [{"order_id": "ord_2", "status": "preparing", "created_at": "2025-11-10"},
+                   {"order_id": "ord_1", "status": "shipped", "created_at": "2025-11-01"}]
+    monkeypatch.setattr("agents.shipping_agent.db.list_open_orders_for_user", lambda email, limit=10: open_orders)
+    monkeypatch.setattr("agents.shipping_agent.db.list_latest_shipment_events", lambda order_ids: {})
+    result = ShippingAgent().run({"input": "where is my package", "email": "demo@example.com"})
+    assert "orders:get_many" not in " ".join(result["tool_calls"])
+    assert result["output"].index("ord_2") < result["output"].index("ord_1")
+    assert "**ord_1** is **Shipped**" in result["output"] and result["confidence"] == 0.9
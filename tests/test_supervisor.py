@@ -28,6 +28,12 @@ def test_detect_intent_conflicting_keywords():
     intent = detect_intent(text)
     assert intent == "change shipping address"
 
+def test_detect_intent_order_paging_phrases_only():
+    assert detect_intent("show more orders") == "check order"
+    assert detect_intent("can you show more detail on the return policy") == "policy"
+    assert detect_intent("show more of my payments") == "check payment"
+    assert detect_intent("show more tracking history for ord_123") == "memory"
+
 def test_supervisor_routing_order_agent():
     state = AgentState(input="ord_208 123 Main St, Atlanta, GA 30301")
     result = supervisor(state)
@@ -100,3 +106,14 @@ def test_supervisor_memory_agent_called_and_preface_added():
     assert out.get("preface") is not None and "Context Summary" in out["preface"]
     assert out["intent"] == "check order"
     assert out["routing_msg"] is not None and "check order" in out["routing_msg"]
+
+def test_tool_agent_turn_runs_through_checkpointed_graph(monkeypatch, tmp_path):
+    # the compiled app checkpoints the whole state (MemorySaver): tool results must serialize
+    import db
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.init_db()
+    events = list(sup.ask_agent_events("check order ord_001", thread_id="t-checkpoint", email="demo@example.com"))
+    outputs = [text for kind, text in events if kind == "output"]
+    assert outputs and "ord_001" in outputs[-1]
+    saved = sup.app.get_state({"configurable": {"thread_id": "t-checkpoint"}}).values
+    assert saved["tool_results"] and all(isinstance(r, str) for r in saved["tool_results"])
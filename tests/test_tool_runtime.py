@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+from agents import tool_runtime as tr
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    out = []
+    monkeypatch.setattr(tr.time, "sleep", out.append)
+    return out
+
+def _runtime(registry, **kw):
+    return tr.ToolRuntime(registry, metrics=tr.ToolMetrics(), **kw)
+
+class Flaky:
+    def __init__(self, errors, result="ok"):
+        self.errors = list(errors)
+        self.calls = 0
+        self.result = result
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def test_transient_errors_are_retried_with_jittered_backoff(sleeps):
+    fn = Flaky([ConnectionError("reset"), sqlite3.OperationalError("database is locked")])
+    rt = _runtime({"t": {"fn": fn}}, retry=tr.RetryPolicy(max_retries=2, base_s=0.4))
+    state = {}
+    assert rt.call("t", {}, state) == "ok"
+    assert fn.calls == 3
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= 0.4 and 0 <= sleeps[1] <= 0.8
+    assert state["tool_calls"] == ["t()", "t()", "t()"]
+    assert rt.metrics.stats()["t"]["errors"] == 2 and rt.metrics.stats()["t"]["retries"] == 2
+
+def test_permanent_errors_fail_fast(sleeps):
+    fn = Flaky([KeyError("order_id")])
+    rt = _runtime({"t": {"fn": fn}})
+    with pytest.raises(KeyError):
+        rt.call("t", {})
+    assert fn.calls == 1 and sleeps == []
+    assert rt.metrics.stats()["t"]["permanent"] == 1
+
+    with pytest.raises(tr.UnknownTool):
+        rt.call("nope", {})
+    calls = []
+    rt = _runtime({"get": {"fn": lambda order_id: calls.append(order_id)}})
+    with pytest.raises(TypeError):
+        rt.call("get", {"id": "ord_1"})      # bad arguments are rejected before calling
+    assert calls == [] and sleeps == []
+
+def test_retries_stop_at_the_limit(sleeps):
+    fn = Flaky([TimeoutError()] * 5)
+    rt = _runtime({"t": {"fn": fn}})
+    with pytest.raises(TimeoutError):
+        rt.call("t", {}, max_retries=1)
+    assert fn.calls == 2
+
+def test_per_tool_timeout():
+    release = threading.Event()
+    slow = lambda: release.wait(2) and "late"
+    rt = _runtime({"slow": {"fn": slow, "timeout_s": 0.05,
+                            "retry": tr.RetryPolicy(max_retries=3, retry_timeouts=False)}})
+    state = {}
+    with pytest.raises(tr.ToolTimeout):
+        rt.call("slow", {}, state)
+    assert len(state["tool_calls"]) == 1                     # not re-sent after a timeout
+    assert rt.metrics.stats()["slow"]["timeouts"] == 1
+    release.set()
+
+def test_http_status_errors(sleeps):
+    class HTTPError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+    assert tr.is_transient(HTTPError(503)) and tr.is_transient(HTTPError(429))
+    assert not tr.is_transient(HTTPError(400))
+    assert not tr.is_transient(sqlite3.OperationalError("no such table: orders"))
+
+def test_results_are_logged_as_plain_string_previews():
+    rows = [{"order_id": f"ord_{i}"} for i in range(20)]
+    rt = _runtime({"list": {"fn": lambda: rows}})
+    state = {}
+    assert rt.call("list", {}, state) is rows
+    text = state["tool_results"][0]
+    assert type(text) is str                                  # graph state is checkpointed
+    assert "ord_4" in text and "ord_5" not in text           # first rows only
+    assert len(tr.preview("x" * 1000)) == tr.PREVIEW_CHARS + 1
+
+def test_async_variant(monkeypatch):
+    slept = []
+
+    async def fake_sleep(s):
+        slept.append(s)
+    monkeypatch.setattr(tr.asyncio, "sleep", fake_sleep)
+
+    async def fetch(order_id):
+        return {"order_id": order_id}
+    fn = Flaky([ConnectionError()], result=[1, 2])
+    rt = _runtime({"fetch": {"fn": fetch}, "sync": {"fn": fn}})
+
+    async def main():
+        return await asyncio.gather(rt.acall("fetch", {"order_id": "ord_1"}), rt.acall("sync", {}))
+    assert asyncio.run(main()) == [{"order_id": "ord_1"}, [1, 2]]
+    assert fn.calls == 2 and len(slept) == 1
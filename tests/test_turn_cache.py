@@ -0,0 +1,88 @@
+import pytest
+
+import db
+from agents import turn_cache
+from agents.tool_runtime import ToolRuntime, ToolMetrics
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.init_db()
+    yield
+
+@pytest.fixture
+def queries(monkeypatch, temp_db):
+    """Counts the SELECTs that reach sqlite through db._query."""
+    seen = []
+    real = db._query
+
+    def counting(sql, params=()):
+        seen.append(sql)
+        return real(sql, params)
+
+    monkeypatch.setattr(db, "_query", counting)
+    return seen
+
+
+def test_no_caching_outside_a_turn(queries):
+    db.get_user("demo@example.com")
+    db.get_user("demo@example.com")
+    assert len(queries) == 2
+
+
+def test_repeated_reads_hit_the_cache(queries):
+    with turn_cache.turn() as cache:
+        first = db.get_user("demo@example.com")
+        assert db.get_user("demo@example.com") is first
+        db.get_compacted_conversation("conv_001")
+        db.get_compacted_conversation("conv_001")
+    assert len(queries) == 2
+    s = cache.summary()
+    assert s["hits"] == 2 and s["queries"] == 2
+    assert s["redundant"] == {"get_user": 1, "get_compacted_conversation": 1}
+    assert turn_cache.current() is None
+
+
+def test_writes_invalidate_only_their_tags(queries):
+    with turn_cache.turn() as cache:
+        db.get_user("demo@example.com")
+        db.get_user("panda@example.com")
+        db.set_user_first_name("DEMO@example.com", "Dee")
+        assert db.get_user("demo@example.com")["first_name"] == "Dee"
+        db.get_user("panda@example.com")
+    assert len(queries) == 3
+    assert cache.summary()["invalidations"] == 1
+
+
+def test_row_tags_invalidate_lists(queries):
+    with turn_cache.turn():
+        assert db.list_orders_for_user("alice.johnson@example.com")[0]["status"] == "preparing"
+        db.get_order_by_id("ord_201")
+        db.set_order_shipping_address("ord_202", "1 New St")
+        assert db.list_orders_for_user("alice.johnson@example.com")[0]["shipping_address"] == "1 New St"
+        db.get_order_by_id("ord_201")
+    assert len(queries) == 3
+
+
+def test_conversation_save_invalidates(temp_db):
+    with turn_cache.turn():
+        assert db.get_compacted_conversation("conv_001")["compacted_count"] == 0
+        db.save_conversation_messages("conv_001", "demo@example.com", [{"role": "user", "content": "hi"}])
+        assert "hi" in db.get_compacted_conversation("conv_001")["conversation_text"]
+
+
+def test_cached_lists_are_copies(temp_db):
+    with turn_cache.turn():
+        db.list_orders_for_user("demo@example.com").clear()
+        assert len(db.list_orders_for_user("demo@example.com")) == 1
+
+
+def test_tool_threads_share_the_turn_cache(queries):
+    tools = ToolRuntime({"get_order": {"fn": lambda order_id: db.get_order_by_id(order_id)}},
+                       timeout_s=5, metrics=ToolMetrics())
+    with turn_cache.turn() as cache:
+        tools.call("get_order", {"order_id": "ord_001"})
+        tools.call("get_order", {"order_id": "ord_001"})
+        db.get_order_by_id("ord_001")
+    assert len(queries) == 1 and cache.summary()["hits"] == 2